@@ -22,4 +22,13 @@ def create_app():
     from .routes import main as main_blueprint
     app.register_blueprint(main_blueprint)
 
+    from .thumbnails import thumbnail_url
+    app.add_template_global(thumbnail_url)
+
+    from .cli import register_commands
+    register_commands(app)
+
+    # The periodic storage GC is started by gunicorn.conf.py in one worker, or
+    # run with `flask storage-gc --every`, never here: every process calls this
+
     return app
@@ -1,61 +1,170 @@
+import logging
 import os
-import cv2
-import numpy as np
+import threading
 import time
+from flask import current_app
 
+from . import metrics
+from .lazy import lazy_import
 
-def align_and_crop_regions(input_image_path, model):
-    """
-    Align the input image with the template image from the model, check the alignment
-    by cropping regions, and return the aligned image. The aligned image is saved, but
-    the cropped regions are only processed in memory and not saved.
-    """
+logger = logging.getLogger(__name__)
+
+cv2 = lazy_import('cv2')
+np = lazy_import('numpy')
+
+
+# SIFT/FLANN/RANSAC settings used for alignment. benchmarks/align_bench.py measures
+# alternatives against synthetic ground truth before any of these are changed.
+DEFAULT_ALIGN_PARAMS = dict(
+    nfeatures=50000,  # SIFT keypoint budget per image
+    trees=5,  # FLANN KD-tree count
+    checks=500,  # FLANN leaf checks per query
+    ratio=0.7,  # Lowe's ratio test threshold
+    min_matches=10,  # homography needs more good matches than this
+    reprojection_threshold=5.0,  # RANSAC inlier distance in pixels
+)
+
+# A template's SIFT features are the same for every image aligned to it, so each
+# process detects them once per template file
+_feature_cache = {}  # (template path, nfeatures) -> (mtime_ns, points, descriptors)
+_feature_lock = threading.Lock()
+
+
+def load_template(model):
+    """Load the model's template image from disk."""
     # Get the local template image path
     template_path = model.get_template_image_path()
 
     if not template_path:
         raise ValueError("Template image path not found in the model.")
 
-    template = cv2.imread(template_path)
-    input_image = cv2.imread(input_image_path)
+    with metrics.timed('decode', model=model.id):
+        template = cv2.imread(template_path)
 
-    if template is None or input_image is None:
-        raise ValueError("Either template or input image could not be loaded.")
+    if template is None:
+        raise ValueError("Template image could not be loaded.")
 
-    # Convert images to grayscale
-    gray_template = cv2.cvtColor(template, cv2.COLOR_BGR2GRAY)
-    gray_input = cv2.cvtColor(input_image, cv2.COLOR_BGR2GRAY)
+    return template
+
+
+def load_input(input_image_path, model):
+    """Load an input image from disk."""
+    with metrics.timed('decode', model=model.id):
+        input_image = cv2.imread(input_image_path)
+
+    if input_image is None:
+        raise ValueError("Input image could not be loaded.")
+
+    return input_image
+
+
+def load_images(input_image_path, model):
+    """Load the model's template image and the input image from disk."""
+    return load_template(model), load_input(input_image_path, model)
 
+
+def detect_features(gray, params=DEFAULT_ALIGN_PARAMS):
+    """SIFT keypoint positions (an N x 2 float32 array) and descriptors of a grayscale image."""
+    sift = cv2.SIFT_create(nfeatures=params['nfeatures'])
+    keypoints, descriptors = sift.detectAndCompute(gray, None)
+    return np.float32([keypoint.pt for keypoint in keypoints]).reshape(-1, 2), descriptors
+
+
+def template_features(path, template=None, params=DEFAULT_ALIGN_PARAMS):
+    """
+    The SIFT features of a template image file, cached until the file changes.
+    template is the already loaded BGR image, read from path if not given.
+    """
+    key = (path, params['nfeatures'])
+    mtime = os.stat(path).st_mtime_ns
+    with _feature_lock:
+        cached = _feature_cache.get(key)
+    if cached and cached[0] == mtime:
+        return cached[1:]
+
+    if template is None:
+        template = cv2.imread(path)
+        if template is None:
+            raise ValueError(f"Could not load template: {path}")
+    features = detect_features(cv2.cvtColor(template, cv2.COLOR_BGR2GRAY), params)
+    with _feature_lock:
+        _feature_cache[key] = (mtime,) + features
+    return features
+
+
+def estimate_homography(gray_template, gray_input, params=DEFAULT_ALIGN_PARAMS, model_id=None, features=None):
+    """
+    Estimate the homography mapping a grayscale input image onto a grayscale template
+    with SIFT, FLANN and RANSAC. features are the template's precomputed
+    (points, descriptors), detected here if not given. Returns None if there
+    are not enough good matches.
+    """
     # Detect SIFT keypoints and descriptors
-    sift = cv2.SIFT_create(nfeatures=50000)
-    keypoints_template, descriptors_template = sift.detectAndCompute(gray_template, None)
-    keypoints_input, descriptors_input = sift.detectAndCompute(gray_input, None)
+    with metrics.timed('sift_detect', model=model_id):
+        if features is None:
+            features = detect_features(gray_template, params)
+        points_template, descriptors_template = features
+        points_input, descriptors_input = detect_features(gray_input, params)
+
+    if descriptors_template is None or descriptors_input is None or len(descriptors_input) < 2:
+        return None
 
     # Use FLANN based matcher
-    FLANN_INDEX_KDTREE = 1
-    index_params = dict(algorithm=FLANN_INDEX_KDTREE, trees=5)
-    search_params = dict(checks=500)
-    flann = cv2.FlannBasedMatcher(index_params, search_params)
-    matches = flann.knnMatch(descriptors_template, descriptors_input, k=2)
+    with metrics.timed('flann_match', model=model_id):
+        FLANN_INDEX_KDTREE = 1
+        index_params = dict(algorithm=FLANN_INDEX_KDTREE, trees=params['trees'])
+        search_params = dict(checks=params['checks'])
+        flann = cv2.FlannBasedMatcher(index_params, search_params)
+        matches = flann.knnMatch(descriptors_template, descriptors_input, k=2)
 
-    # Apply Lowe's ratio test
-    good_matches = [m for m, n in matches if m.distance < 0.7 * n.distance]
+        # Apply Lowe's ratio test
+        good_matches = [m for m, n in matches if m.distance < params['ratio'] * n.distance]
 
-    if len(good_matches) > 10:
-        # Extract matched points
-        src_pts = np.float32([keypoints_template[m.queryIdx].pt for m in good_matches]).reshape(-1, 1, 2)
-        dst_pts = np.float32([keypoints_input[m.trainIdx].pt for m in good_matches]).reshape(-1, 1, 2)
+    if len(good_matches) <= params['min_matches']:
+        return None
 
-        # Compute homography
-        H, mask = cv2.findHomography(dst_pts, src_pts, cv2.RANSAC, 5.0)
+    # Extract matched points
+    src_pts = points_template[[m.queryIdx for m in good_matches]].reshape(-1, 1, 2)
+    dst_pts = points_input[[m.trainIdx for m in good_matches]].reshape(-1, 1, 2)
 
-        # Align the input image
+    # Compute homography
+    with metrics.timed('ransac', model=model_id):
+        H, mask = cv2.findHomography(dst_pts, src_pts, cv2.RANSAC, params['reprojection_threshold'])
+
+    return H
+
+
+def compute_homography(template, input_image, model):
+    """
+    Estimate the homography mapping the input image onto the model's template.
+    Returns None if there are not enough good matches.
+    """
+    # The template's features come from the cache; only the input needs SIFT
+    features = None
+    template_path = model.get_template_image_path()
+    if template_path and os.path.exists(template_path):
+        features = template_features(template_path, template)
+
+    gray_input = cv2.cvtColor(input_image, cv2.COLOR_BGR2GRAY)
+    gray_template = None if features is not None else cv2.cvtColor(template, cv2.COLOR_BGR2GRAY)
+    return estimate_homography(gray_template, gray_input, model_id=model.id, features=features)
+
+
+def warp_to_template(input_image, H, template, model):
+    """Warp the input image into the template's frame."""
+    with metrics.timed('warp', model=model.id):
         height, width, channels = template.shape
-        aligned_image = cv2.warpPerspective(input_image, H, (width, height))
+        return cv2.warpPerspective(input_image, H, (width, height))
 
-        # Process the regions (only in-memory, no saving)
-        max_vals = []
-        for region in model.regions:
+
+def score_regions(aligned_image, template, model, input_image_path=None):
+    """
+    Score how well each region of the aligned image matches the template with
+    normalised cross-correlation. Returns the scores in model.regions order.
+    """
+    max_vals = []
+    for region in model.regions:
+        with metrics.timed('region_scoring', model=model.id, region=region.name, region_id=region.id):
             x1, y1, x2, y2 = region.x1, region.y1, region.x2, region.y2
 
             # Ensure coordinates are ordered correctly
@@ -77,68 +186,65 @@ def align_and_crop_regions(input_image_path, model):
             match_result = cv2.matchTemplate(aligned_crop_gray, template_crop_gray, cv2.TM_CCOEFF_NORMED)
             _, max_val, _, _ = cv2.minMaxLoc(match_result)
             max_vals.append(max_val)
+    return max_vals
 
-        # Check if alignment was successful based on match scores
-        print(input_image_path, max_vals)
-        if max(max_vals) > 0:
-            return None  # Alignment failed
-        else:
-            # Save the aligned image
-            aligned_image_name = os.path.splitext(os.path.basename(input_image_path))[0] + '_aligned.jpg'
-            aligned_image_path = os.path.join('app/static/uploads', aligned_image_name)
-            cv2.imwrite(aligned_image_path, aligned_image)
-
-            return aligned_image_path
-    return None
 
-
-def crop_regions(input_image_path, model, region):
+def align_and_crop_regions(input_image_path, model):
     """
-    Align the input image with the template image from the model, crop the region, save the cropped region,
-    and return the path of the cropped region image with a unique timestamp to avoid overwriting.
+    Align the input image with the template image from the model, check the alignment
+    by cropping regions, and return the aligned image. The aligned image is saved, but
+    the cropped regions are only processed in memory and not saved.
     """
-    # Get the local template image path
-    template_path = model.get_template_image_path()
-
-    if not template_path:
-        raise ValueError("Template image path not found in the model.")
+    # Uploads are content addressed, so an aligned image already saved for this
+    # input and template can be reused instead of running SIFT again
+    template_stem = os.path.splitext(os.path.basename(model.template_image_filename or ''))[0]
+    input_stem = os.path.splitext(os.path.basename(input_image_path))[0]
+    aligned_image_name = f'{input_stem}_{template_stem}_aligned.jpg'
+    aligned_image_path = os.path.join(current_app.config['UPLOADED_IMAGES_DEST'], aligned_image_name)
+
+    if os.path.exists(aligned_image_path):
+        template, aligned_image = load_images(aligned_image_path, model)
+    else:
+        template, input_image = load_images(input_image_path, model)
 
-    template = cv2.imread(template_path)
-    input_image = cv2.imread(input_image_path)
+        H = compute_homography(template, input_image, model)
+        if H is None:
+            return None
 
-    if template is None or input_image is None:
-        raise ValueError("Either template or input image could not be loaded.")
+        # Align the input image
+        aligned_image = warp_to_template(input_image, H, template, model)
 
-    # Convert images to grayscale
-    gray_template = cv2.cvtColor(template, cv2.COLOR_BGR2GRAY)
-    gray_input = cv2.cvtColor(input_image, cv2.COLOR_BGR2GRAY)
+    # Process the regions (only in-memory, no saving)
+    max_vals = score_regions(aligned_image, template, model, input_image_path)
 
-    # Detect SIFT keypoints and descriptors
-    sift = cv2.SIFT_create(nfeatures=50000)
-    keypoints_template, descriptors_template = sift.detectAndCompute(gray_template, None)
-    keypoints_input, descriptors_input = sift.detectAndCompute(gray_input, None)
+    # Check if alignment was successful based on match scores
+    logger.debug("Region scores for %s: %s", input_image_path, max_vals)
+    # A template with no regions yet has nothing to check
+    if max_vals and max(max_vals) > 0:
+        return None  # Alignment failed
+    else:
+        # Save the aligned image
+        if not os.path.exists(aligned_image_path):
+            cv2.imwrite(aligned_image_path, aligned_image)
+        else:
+            # Refresh the mtime so the storage GC's minimum age covers the new reference
+            os.utime(aligned_image_path)
 
-    # Use FLANN based matcher
-    FLANN_INDEX_KDTREE = 1
-    index_params = dict(algorithm=FLANN_INDEX_KDTREE, trees=5)
-    search_params = dict(checks=500)
-    flann = cv2.FlannBasedMatcher(index_params, search_params)
-    matches = flann.knnMatch(descriptors_template, descriptors_input, k=2)
+        return aligned_image_path
 
-    # Apply Lowe's ratio test
-    good_matches = [m for m, n in matches if m.distance < 0.7 * n.distance]
 
-    if len(good_matches) > 10:
-        # Extract matched points
-        src_pts = np.float32([keypoints_template[m.queryIdx].pt for m in good_matches]).reshape(-1, 1, 2)
-        dst_pts = np.float32([keypoints_input[m.trainIdx].pt for m in good_matches]).reshape(-1, 1, 2)
+def crop_regions(input_image_path, model, region):
+    """
+    Align the input image with the template image from the model, crop the region, save the cropped region,
+    and return the path of the cropped region image with a unique timestamp to avoid overwriting.
+    """
+    template, input_image = load_images(input_image_path, model)
 
-        # Compute homography
-        H, mask = cv2.findHomography(dst_pts, src_pts, cv2.RANSAC, 5.0)
+    H = compute_homography(template, input_image, model)
 
+    if H is not None:
         # Align the input image
-        height, width, channels = template.shape
-        aligned_image = cv2.warpPerspective(input_image, H, (width, height))
+        aligned_image = warp_to_template(input_image, H, template, model)
 
         # Ensure coordinates are ordered correctly for the region
         x1, x2 = min(region.x1, region.x2), max(region.x1, region.x2)
@@ -150,7 +256,7 @@ def crop_regions(input_image_path, model, region):
         # Generate a unique cropped image filename with a timestamp to avoid overwrites
         timestamp = int(time.time())
         cropped_image_name = f"{os.path.splitext(os.path.basename(input_image_path))[0]}_crop_{region.id}_{timestamp}.jpg"
-        cropped_image_path = os.path.join('app/static/uploads', cropped_image_name)
+        cropped_image_path = os.path.join(current_app.config['UPLOADED_IMAGES_DEST'], cropped_image_name)
 
         # Save the cropped region
         cv2.imwrite(cropped_image_path, cropped_region)
@@ -0,0 +1,175 @@
+import os
+import struct
+import tempfile
+import zipfile
+import zlib
+
+from werkzeug.datastructures import FileStorage
+from werkzeug.formparser import MultiPartParser
+from werkzeug.http import parse_options_header
+
+# Uploaded parts bigger than this are spooled to disk instead of memory
+SPOOL_MAX_MEMORY = 4 * 1024 * 1024
+CHUNK_SIZE = 64 * 1024
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.gif', '.bmp', '.tif', '.tiff')
+
+_LOCAL_FILE_HEADER = b'PK\x03\x04'
+_DATA_DESCRIPTOR = b'PK\x07\x08'
+
+
+def _spooled_file():
+    return tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_MEMORY)
+
+
+def _spooled_stream_factory(total_content_length, content_type, filename=None, content_length=None):
+    return _spooled_file()
+
+
+def is_image_name(filename):
+    return bool(filename) and filename.lower().endswith(IMAGE_EXTENSIONS)
+
+
+def _read_exact(stream, size):
+    data = b''
+    while len(data) < size:
+        chunk = stream.read(size - len(data))
+        if not chunk:
+            raise ValueError("Zip upload ended unexpectedly.")
+        data += chunk
+    return data
+
+
+class _PushbackStream:
+    """Wraps a forward-only stream so bytes read past the end of a zip member can be put back."""
+
+    def __init__(self, stream):
+        self.stream = stream
+        self.buffer = b''
+
+    def read(self, size):
+        if self.buffer:
+            data, self.buffer = self.buffer[:size], self.buffer[size:]
+            return data
+        return self.stream.read(size)
+
+    def unread(self, data):
+        self.buffer = data + self.buffer
+
+
+def _copy_deflated(stream, output, compressed_size):
+    """Inflate one deflated member into output, reading only as far as the member ends."""
+    decompressor = zlib.decompressobj(-zlib.MAX_WBITS)
+    remaining = compressed_size
+    while not decompressor.eof:
+        size = CHUNK_SIZE if remaining is None else min(CHUNK_SIZE, remaining)
+        if remaining is not None and size == 0:
+            break
+        chunk = stream.read(size)
+        if not chunk:
+            raise ValueError("Zip upload ended unexpectedly.")
+        if remaining is not None:
+            remaining -= len(chunk)
+        output.write(decompressor.decompress(chunk))
+    output.write(decompressor.flush())
+    if decompressor.unused_data:
+        stream.unread(decompressor.unused_data)
+
+
+def iter_zip_stream(stream):
+    """
+    Yield (filename, file) for each image in a zip archive read front to back
+    from a forward-only stream, so members are handed out while the rest of the
+    archive is still uploading. Only stored and deflated members are supported,
+    which covers what zip tools produce for images.
+    """
+    stream = _PushbackStream(stream)
+    while True:
+        signature = stream.read(4)
+        if signature != _LOCAL_FILE_HEADER:
+            # The central directory (or end of data) follows the last member
+            return
+
+        (_, flags, method, _, _, _, compressed_size, _, name_length, extra_length) = struct.unpack(
+            '<HHHHHIIIHH', _read_exact(stream, 26)
+        )
+        filename = _read_exact(stream, name_length).decode('utf-8' if flags & 0x800 else 'cp437')
+        _read_exact(stream, extra_length)
+
+        has_descriptor = bool(flags & 0x08)
+        if has_descriptor and method != zipfile.ZIP_DEFLATED:
+            raise ValueError(f"Cannot stream zip member {filename}: stored with a data descriptor.")
+        if method not in (zipfile.ZIP_STORED, zipfile.ZIP_DEFLATED):
+            raise ValueError(f"Cannot stream zip member {filename}: unsupported compression.")
+
+        output = _spooled_file()
+        if method == zipfile.ZIP_DEFLATED:
+            _copy_deflated(stream, output, None if has_descriptor else compressed_size)
+        else:
+            remaining = compressed_size
+            while remaining:
+                chunk = _read_exact(stream, min(CHUNK_SIZE, remaining))
+                output.write(chunk)
+                remaining -= len(chunk)
+
+        if has_descriptor:
+            # Optional signature, then crc and sizes (zip64 descriptors are not supported)
+            descriptor = _read_exact(stream, 4)
+            if descriptor == _DATA_DESCRIPTOR:
+                descriptor = _read_exact(stream, 4)
+            _read_exact(stream, 8)
+
+        output.seek(0)
+        if is_image_name(filename) and not filename.endswith('/'):
+            yield os.path.basename(filename), output
+        else:
+            output.close()
+
+
+def iter_zip_file(file):
+    """Yield (filename, file) for each image in an already spooled, seekable zip file."""
+    with zipfile.ZipFile(file) as archive:
+        for info in archive.infolist():
+            if info.is_dir() or not is_image_name(info.filename):
+                continue
+            output = _spooled_file()
+            with archive.open(info) as member:
+                while True:
+                    chunk = member.read(CHUNK_SIZE)
+                    if not chunk:
+                        break
+                    output.write(chunk)
+            output.seek(0)
+            yield os.path.basename(info.filename), output
+
+
+def iter_uploaded_images(request):
+    """
+    Yield a FileStorage per image in a batch upload, as each arrives. Accepts a
+    multipart form with any number of image and/or zip file parts, or a raw
+    application/zip body. Multipart parts are parsed straight off the request
+    stream and spooled individually, so the whole upload is never held at once.
+    """
+    content_type, options = parse_options_header(request.headers.get('Content-Type', ''))
+
+    if content_type == 'multipart/form-data':
+        boundary = options.get('boundary', '').encode('latin-1')
+        if not boundary:
+            raise ValueError("Multipart upload is missing its boundary.")
+        parser = MultiPartParser(_spooled_stream_factory)
+        for kind, (name, value) in parser.parse_parts(request.stream, boundary, request.content_length):
+            if kind != 'file' or not value.filename:
+                continue
+            if value.filename.lower().endswith('.zip'):
+                with value.stream:
+                    for filename, file in iter_zip_file(value.stream):
+                        yield FileStorage(file, filename, name)
+            else:
+                yield value
+
+    elif content_type in ('application/zip', 'application/x-zip-compressed'):
+        for filename, file in iter_zip_stream(request.stream):
+            yield FileStorage(file, filename, 'image')
+
+    else:
+        raise ValueError("Batch uploads must be multipart/form-data or application/zip.")
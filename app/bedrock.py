@@ -1,27 +1,32 @@
 import os
 
-import boto3
 import json
 import base64
-import time
+import logging
 import pickle
-from datetime import datetime
-import requests
 from flask import current_app
 
+from . import metrics
 
-def encode_image_to_base64_from_disk(image_path):
+logger = logging.getLogger(__name__)
+
+
+def encode_image_to_base64_from_disk(image_path, model=None, region=None):
     # Open and encode image to base64
-    with open(image_path, "rb") as image_file:
-        return base64.b64encode(image_file.read()).decode('utf-8')
+    with metrics.timed('base64_encode', model=model, region=region):
+        with open(image_path, "rb") as image_file:
+            return base64.b64encode(image_file.read()).decode('utf-8')
 
 
 
 def send_request(model_id, new_message, conversation_history, save=False, region=None):
-    start_time_request = time.time()
-    print(f"{datetime.now()} Request Start")
-
-    bedrock = boto3.client('bedrock-runtime')
+    # Regions are trained from several threads, and the default boto3 session is
+    # not thread safe, so each request builds its client from its own session
+    import boto3
+    bedrock = boto3.session.Session().client(
+        'bedrock-runtime',
+        endpoint_url=current_app.config['BEDROCK_ENDPOINT_URL']
+    )
 
     # Append the new message to conversation history
     conversation_history.append({
@@ -40,15 +45,20 @@ def send_request(model_id, new_message, conversation_history, save=False, region
     body_json = json.dumps(body).encode('utf-8')
 
     # Make the request to Bedrock
-    response = bedrock.invoke_model(
-        modelId=model_id,
-        body=body_json,
-        contentType="application/json",
-        accept="application/json"
-    )
-
-    # Read the response body
-    response_body = response['body'].read()
+    with metrics.timed(
+        'bedrock',
+        model=region.model_id if region else None,
+        region=region.name if region else None
+    ):
+        response = bedrock.invoke_model(
+            modelId=model_id,
+            body=body_json,
+            contentType="application/json",
+            accept="application/json"
+        )
+
+        # Read the response body
+        response_body = response['body'].read()
 
     # Parse the response
     assistant_response = json.loads(response_body)
@@ -66,11 +76,6 @@ def send_request(model_id, new_message, conversation_history, save=False, region
         with open(save_path, 'wb') as f:
             pickle.dump(conversation_history, f)
 
-    # Print total request time
-    end_time_request = time.time()
-    total_time = end_time_request - start_time_request
-    print(f"{datetime.now()} Request End: {total_time:.2f} seconds")
-
     return assistant_response
 
 
@@ -82,7 +87,7 @@ def train_bedrock(good_img_urls, bad_img_urls, region):
     # Process fail images
     fail_images_content = []
     for image_path in bad_img_urls:
-        encoded_image = encode_image_to_base64_from_disk(image_path)  # Fetch from disk
+        encoded_image = encode_image_to_base64_from_disk(image_path, region.model_id, region.name)  # Fetch from disk
         fail_images_content.append({
             "type": "image",
             "source": {
@@ -95,18 +100,17 @@ def train_bedrock(good_img_urls, bad_img_urls, region):
     # Add fail image description
     fail_images_content.append({
         "type": "text",
-        "text": f"Your job is to examine examples of incorrect and correct images and learn how to tell if a new image is incorrect or correct. Here are 5 'incorrect' images. {region.fail_description} Provide descriptions for these images and end each description with the word 'incorrect'."
+        "text": f"Your job is to examine examples of incorrect and correct images and learn how to tell if a new image is incorrect or correct. Here are {len(bad_img_urls)} 'incorrect' images. {region.fail_description} Provide descriptions for these images and end each description with the word 'incorrect'."
     })
 
     # Send fail images to Bedrock
-    fail_response = send_request(model_id, fail_images_content, conversation_history)
-    print(f"{datetime.now()} Response for 5 fail images:")
-    print(fail_response)
+    fail_response = send_request(model_id, fail_images_content, conversation_history, region=region)
+    logger.debug("Region %s: response for %d fail images: %s", region.id, len(bad_img_urls), fail_response)
 
     # Process pass images
     pass_images_content = []
     for image_path in good_img_urls:
-        encoded_image = encode_image_to_base64_from_disk(image_path)  # Fetch from disk
+        encoded_image = encode_image_to_base64_from_disk(image_path, region.model_id, region.name)  # Fetch from disk
         pass_images_content.append({
             "type": "image",
             "source": {
@@ -119,11 +123,10 @@ def train_bedrock(good_img_urls, bad_img_urls, region):
     # Add pass image description
     pass_images_content.append({
         "type": "text",
-        "text": f"Here are 5 'correct' images. {region.pass_description} Provide descriptions for these images and end each description with the word 'correct'."
+        "text": f"Here are {len(good_img_urls)} 'correct' images. {region.pass_description} Provide descriptions for these images and end each description with the word 'correct'."
     })
 
     # Send pass images to Bedrock
     pass_response = send_request(model_id, pass_images_content, conversation_history, save=True, region=region)
-    print(f"{datetime.now()} Response for 5 pass images:")
-    print(pass_response)
+    logger.debug("Region %s: response for %d pass images: %s", region.id, len(good_img_urls), pass_response)
 
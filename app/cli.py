@@ -0,0 +1,270 @@
+import json
+import os
+
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+
+from . import db
+from .export import export_run
+from .models import Model, Run, Inspection
+from .offline import find_images, inspect_directory
+from .events import count_run_inspections
+from .rollups import backfill, record_inspections
+from .s3_runs import run_s3
+from .shards import plan_run, run_progress, run_worker
+from .storage_gc import run_gc_loop, run_storage_gc
+from .video import DEFAULT_TRACKING_PARAMS, frame_url, inspect_video
+
+
+@click.command('storage-gc')
+@click.option('--min-age', type=int, default=None, help='Keep files younger than this many seconds (default STORAGE_GC_MIN_AGE).')
+@click.option('--quota', type=int, default=None, help='Disk quota in bytes for uploads and thumbnails (default STORAGE_QUOTA_BYTES, 0 for none).')
+@click.option('--dry-run', is_flag=True, help='Report what would be deleted without deleting it.')
+@click.option('--every', type=int, default=None, help='Keep running, sweeping every this many seconds.')
+@with_appcontext
+def storage_gc_command(min_age, quota, dry_run, every):
+    """Delete unreferenced uploads and derived files, and enforce the disk quota."""
+    if every:
+        # Sweeps until interrupted, echoing each sweep's stats
+        click.echo(f"Sweeping every {every} seconds.")
+        run_gc_loop(current_app._get_current_object(), every, click.echo, min_age=min_age, quota_bytes=quota, dry_run=dry_run)
+    else:
+        stats = run_storage_gc(min_age=min_age, quota_bytes=quota, dry_run=dry_run)
+        if stats is None:
+            click.echo("Another storage GC is already running.")
+            return
+        for key, value in stats.items():
+            click.echo(f"{key}: {value}")
+
+
+@click.command('inspect-dir')
+@click.argument('model_id', type=int)
+@click.argument('path')
+@click.option('--workers', type=int, default=None, help='Worker processes (default INSPECT_DIR_WORKERS).')
+@click.option('--resume', 'run_id', type=int, default=None, help='Continue an earlier run, skipping images it already has.')
+@click.option('--export', 'export_path', default=None, help='Write a summary of the run to this .csv or .parquet file.')
+@click.option('--station', default=None, help='Camera the images came from, to reuse its homography between images.')
+@with_appcontext
+def inspect_dir_command(model_id, path, workers, run_id, export_path, station):
+    """Inspect every image in a local directory (or matching a glob) with MODEL_ID."""
+    model = Model.query.get(model_id)
+    if model is None:
+        raise click.ClickException(f"Model {model_id} not found.")
+
+    paths = find_images(path)
+    if not paths:
+        raise click.ClickException(f"No images found at {path}.")
+
+    if run_id is not None:
+        run = Run.query.filter_by(id=run_id, model_id=model.id).first()
+        if run is None:
+            raise click.ClickException(f"Run {run_id} not found for model {model_id}.")
+    else:
+        run = Run(model_id=model.id, s3_path='file://' + os.path.abspath(path))
+        db.session.add(run)
+        db.session.commit()
+    click.echo(f"Run {run.id}: {len(paths)} images")
+
+    counts = inspect_directory(
+        model,
+        paths,
+        run,
+        workers or current_app.config['INSPECT_DIR_WORKERS'],
+        current_app.config['BATCH_INSERT_SIZE'],
+        station=station,
+        progress=click.echo
+    )
+    click.echo(f"Run {run.id}: {run.result} ({', '.join(f'{key} {value}' for key, value in counts.items())})")
+
+    if export_path:
+        try:
+            export_run(run, export_path)
+        except RuntimeError as e:
+            raise click.ClickException(str(e))
+        click.echo(f"Wrote {export_path}")
+
+
+@click.command('inspect-s3')
+@click.argument('model_id', type=int)
+@click.argument('s3_path')
+@click.option('--incremental', is_flag=True, help='Only inspect objects that are new or changed since the last run on this path.')
+@click.option('--workers', type=int, default=None, help='Worker threads (default BATCH_INSPECT_WORKERS).')
+@click.option('--station', default=None, help='Camera the images came from, to reuse its homography between images.')
+@with_appcontext
+def inspect_s3_command(model_id, s3_path, incremental, workers, station):
+    """Inspect the images under S3_PATH (s3://bucket/prefix) with MODEL_ID."""
+    model = Model.query.get(model_id)
+    if model is None:
+        raise click.ClickException(f"Model {model_id} not found.")
+
+    run = Run(model_id=model.id, s3_path=s3_path)
+    db.session.add(run)
+    db.session.commit()
+
+    try:
+        counts = run_s3(
+            model,
+            run,
+            incremental=incremental,
+            workers=workers or current_app.config['BATCH_INSPECT_WORKERS'],
+            insert_size=current_app.config['BATCH_INSERT_SIZE'],
+            station=station,
+            progress=click.echo
+        )
+    except ValueError as e:
+        raise click.ClickException(str(e))
+    click.echo(f"Run {run.id}: {run.result} ({', '.join(f'{key} {value}' for key, value in counts.items())})")
+
+
+@click.command('plan-run')
+@click.argument('model_id', type=int)
+@click.argument('s3_path')
+@click.option('--incremental', is_flag=True, help='Only shard objects that are new or changed since the last run on this path.')
+@click.option('--shard-size', type=int, default=None, help='Objects per shard (default RUN_SHARD_SIZE).')
+@with_appcontext
+def plan_run_command(model_id, s3_path, incremental, shard_size):
+    """List S3_PATH into a new run of MODEL_ID, split into shards for run-worker processes."""
+    model = Model.query.get(model_id)
+    if model is None:
+        raise click.ClickException(f"Model {model_id} not found.")
+
+    run = Run(model_id=model.id, s3_path=s3_path)
+    db.session.add(run)
+    db.session.commit()
+
+    try:
+        shards = plan_run(run, incremental, shard_size or current_app.config['RUN_SHARD_SIZE'], progress=click.echo)
+    except ValueError as e:
+        raise click.ClickException(str(e))
+    click.echo(f"Run {run.id}: {shards} shards")
+
+
+@click.command('run-worker')
+@click.option('--run', 'run_id', type=int, default=None, help='Only work on this run.')
+@click.option('--workers', type=int, default=None, help='Worker threads (default BATCH_INSPECT_WORKERS).')
+@click.option('--name', default=None, help='Worker name recorded on its leases (default host:pid).')
+@click.option('--exit-when-idle', is_flag=True, help='Exit when there are no shards to claim instead of polling.')
+@click.option('--station', default=None, help='Camera the images came from, to reuse its homography between images.')
+@with_appcontext
+def run_worker_command(run_id, workers, name, exit_when_idle, station):
+    """Claim and inspect shards of sharded runs. Start as many as needed, on any node."""
+    completed = run_worker(
+        worker=name,
+        run_id=run_id,
+        workers=workers or current_app.config['BATCH_INSPECT_WORKERS'],
+        insert_size=current_app.config['BATCH_INSERT_SIZE'],
+        lease_seconds=current_app.config['RUN_LEASE_SECONDS'],
+        poll_interval=current_app.config['RUN_WORKER_POLL_SECONDS'],
+        exit_when_idle=exit_when_idle,
+        station=station,
+        steal_min_objects=current_app.config['RUN_STEAL_MIN_OBJECTS'],
+        progress=click.echo
+    )
+    click.echo(f"{completed} shards completed")
+
+
+@click.command('run-status')
+@click.argument('run_id', type=int)
+@with_appcontext
+def run_status_command(run_id):
+    """Show the progress of RUN_ID across every worker."""
+    run = Run.query.get(run_id)
+    if run is None:
+        raise click.ClickException(f"Run {run_id} not found.")
+    progress = run_progress(run_id)
+    click.echo(json.dumps(dict(progress, result=run.result), indent=2))
+
+
+@click.command('export-run')
+@click.argument('run_id', type=int)
+@click.argument('path')
+@with_appcontext
+def export_run_command(run_id, path):
+    """Write every inspection of RUN_ID, with stage timings and region scores, to PATH (.csv or .parquet)."""
+    run = Run.query.get(run_id)
+    if run is None:
+        raise click.ClickException(f"Run {run_id} not found.")
+    try:
+        export_run(run, path)
+    except RuntimeError as e:
+        raise click.ClickException(str(e))
+    click.echo(f"Wrote {path}")
+
+
+@click.command('inspect-video')
+@click.argument('model_id', type=int)
+@click.argument('source')
+@click.option('--fps', type=float, default=None, help='Frames to inspect per second of video (default VIDEO_SAMPLE_FPS).')
+@click.option('--keyframe-interval', type=int, default=DEFAULT_TRACKING_PARAMS['keyframe_interval'], help='Run full alignment at least every N sampled frames.')
+@click.option('--min-confidence', type=float, default=DEFAULT_TRACKING_PARAMS['min_confidence'], help='Re-anchor when less of the tracked motion fits than this.')
+@with_appcontext
+def inspect_video_command(model_id, source, fps, keyframe_interval, min_confidence):
+    """Inspect frames sampled from a video file or stream URL with MODEL_ID."""
+    model = Model.query.get(model_id)
+    if model is None:
+        raise click.ClickException(f"Model {model_id} not found.")
+
+    params = dict(DEFAULT_TRACKING_PARAMS, keyframe_interval=keyframe_interval, min_confidence=min_confidence)
+    run = Run(model_id=model.id, s3_path=source)
+    db.session.add(run)
+    db.session.commit()
+
+    insert_size = current_app.config['BATCH_INSERT_SIZE']
+    counts = {'frames': 0, 'keyframes': 0, 'passed': 0, 'failed': 0}
+    rows = []
+    try:
+        for result in inspect_video(model, source, fps or current_app.config['VIDEO_SAMPLE_FPS'], params):
+            counts['frames'] += 1
+            counts['keyframes'] += result['keyframe']
+            counts['passed' if result['pass_fail'] else 'failed'] += 1
+            rows.append({
+                'run_id': run.id,
+                'model_id': model.id,
+                'image_url': frame_url(source, result['frame'], result['seconds']),
+                'pass_fail': result['pass_fail'],
+                'reason': result['reason'],
+                'timings': json.dumps(result['timings']),
+                'duration_ms': result['duration_ms'],
+                'region_results': json.dumps(result['region_results']),
+            })
+            if len(rows) >= insert_size:
+                db.session.bulk_insert_mappings(Inspection, rows)
+                record_inspections(rows)
+                count_run_inspections(rows)
+                db.session.commit()
+                del rows[:]
+                click.echo(f"{counts['frames']} frames, {counts['keyframes']} keyframes")
+    except ValueError as e:
+        raise click.ClickException(str(e))
+    finally:
+        if rows:
+            db.session.bulk_insert_mappings(Inspection, rows)
+            record_inspections(rows)
+            count_run_inspections(rows)
+        run.result = f"{counts['passed']}/{counts['frames']} PASS"
+        db.session.commit()
+
+    click.echo(f"Run {run.id}: {run.result} ({counts['keyframes']} of {counts['frames']} frames were keyframes)")
+
+
+@click.command('rollup-backfill')
+@click.option('--model', 'model_id', type=int, default=None, help='Rebuild one model only (default every model).')
+@click.option('--since', type=click.DateTime(formats=['%Y-%m-%d']), default=None, help='Rebuild from this UTC day onwards (default all history).')
+@with_appcontext
+def rollup_backfill_command(model_id, since):
+    """Rebuild the analytics rollups from the inspection table."""
+    counted = backfill(model_id, since, progress=click.echo)
+    click.echo(f"Rollups rebuilt from {counted} inspections")
+
+
+def register_commands(app):
+    app.cli.add_command(storage_gc_command)
+    app.cli.add_command(inspect_dir_command)
+    app.cli.add_command(inspect_s3_command)
+    app.cli.add_command(plan_run_command)
+    app.cli.add_command(run_worker_command)
+    app.cli.add_command(run_status_command)
+    app.cli.add_command(export_run_command)
+    app.cli.add_command(inspect_video_command)
+    app.cli.add_command(rollup_backfill_command)
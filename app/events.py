@@ -0,0 +1,105 @@
+import json
+import time
+
+from . import db
+from .models import Run, Inspection
+
+RECENT_FAILURES = 10
+
+
+def add_run_counts(run_id, passed=0, failed=0, carried=0):
+    """Add to a run's progress counters in the current transaction."""
+    if passed or failed or carried:
+        Run.query.filter_by(id=run_id).update({
+            'passed': Run.passed + passed,
+            'failed': Run.failed + failed,
+            'carried': Run.carried + carried,
+        }, synchronize_session=False)
+
+
+def count_run_inspections(rows):
+    """
+    Count inspection insert mappings into their runs' counters. Call it in the
+    transaction that inserts the rows, as with record_inspections, so the
+    counters always match what is committed.
+    """
+    counts = {}
+    for row in rows:
+        if row.get('run_id') is None:
+            continue
+        passed, failed = counts.get(row['run_id'], (0, 0))
+        if row['pass_fail']:
+            passed += 1
+        else:
+            failed += 1
+        counts[row['run_id']] = (passed, failed)
+    for run_id, (passed, failed) in sorted(counts.items()):
+        add_run_counts(run_id, passed, failed)
+
+
+def recent_failures(run_id, limit=RECENT_FAILURES):
+    """A run's latest failed inspections, newest first, read off ix_inspection_run_failures without a sort."""
+    rows = db.session.query(Inspection.image_url, Inspection.reason).filter(
+        Inspection.run_id == run_id, Inspection.pass_fail == False  # noqa: E712
+    ).order_by(Inspection.id.desc()).limit(limit)
+    return [{'image_url': image_url, 'reason': reason} for image_url, reason in rows]
+
+
+def format_sse(data, event='progress'):
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+def stream_run_events(run_id, progress=None, interval=1.0, duration=60, heartbeat=15, retry_ms=1000):
+    """
+    Generate Server-Sent Events of a run's progress, read from the counters on
+    its row every interval seconds. The counters are written with the run's
+    inspections, so any web worker can serve the stream whichever process is
+    running the run. progress(run_id), if given, adds extra fields (a sharded
+    run's shard counts) to each event.
+
+    The stream ends after duration seconds and the browser's EventSource
+    reconnects by itself retry_ms later, so an open page holds a server thread
+    for at most that long at a time. Throughput is over the current connection.
+    """
+    yield f"retry: {retry_ms}\n\n"
+    started = last_sent = time.monotonic()
+    first_total = None
+    sent = None
+    failures = []
+    while True:
+        passed, failed, result = db.session.query(Run.passed, Run.failed, Run.result).filter(Run.id == run_id).one()
+        total = passed + failed
+        if first_total is None:
+            first_total = total
+        if sent is None or failed != sent['failed']:
+            failures = recent_failures(run_id)
+        extra = progress(run_id) if progress else None
+        # End the transaction so the next poll sees newly committed counts
+        db.session.commit()
+
+        finished = result is not None
+        state = (passed, failed, result, extra)
+        if sent is None or state != sent['state']:
+            elapsed = time.monotonic() - started
+            snapshot = {
+                'run_id': run_id,
+                'total': total,
+                'passed': passed,
+                'failed': failed,
+                'throughput': round((total - first_total) / elapsed, 2) if elapsed > 0 else 0.0,
+                'recent_failures': failures,
+                'finished': finished,
+                'result': result,
+            }
+            if extra:
+                snapshot.update(extra)
+            yield format_sse(snapshot)
+            sent = {'failed': failed, 'state': state}
+            last_sent = time.monotonic()
+        elif time.monotonic() - last_sent >= heartbeat:
+            yield ': keep-alive\n\n'
+            last_sent = time.monotonic()
+
+        if finished or time.monotonic() - started >= duration:
+            return
+        time.sleep(interval)
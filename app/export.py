@@ -0,0 +1,175 @@
+import csv
+import io
+import json
+
+from . import db
+from .models import Inspection, ModelRegion
+from .s3_runs import run_inspections
+
+EXPORT_COLUMNS = ['inspection_id', 'run_id', 'model_id', 'image_url', 'pass_fail', 'reason', 'template_id', 'duration_ms', 'created_at']
+
+# Pipeline stages exported as <stage>_ms; region-labelled timings are summed into their stage
+TIMING_STAGES = [
+    's3_download', 'decode', 'variant_select', 'warm_start_verify', 'sift_detect', 'flann_match', 'ransac', 'warp',
+    'optical_flow', 'region_scoring', 'base64_encode', 'bedrock',
+]
+
+COLUMN_TYPES = {
+    'inspection_id': 'int', 'run_id': 'int', 'model_id': 'int', 'template_id': 'int',
+    'pass_fail': 'bool', 'duration_ms': 'float',
+}
+
+PARQUET_BATCH_SIZE = 10000
+CSV_CHUNK_ROWS = 1000
+FETCH_SIZE = 1000
+
+
+def region_columns(model_id):
+    """
+    (region id, column prefix) for each region of a model, on every template.
+    Prefixes are region_<name>, with the id added when two regions share a name.
+    """
+    regions = db.session.query(ModelRegion.id, ModelRegion.name).filter_by(model_id=model_id).order_by(ModelRegion.id).all()
+    names = [name for _, name in regions]
+    return [
+        (region_id, f'region_{name}' if names.count(name) == 1 else f'region_{name}_{region_id}')
+        for region_id, name in regions
+    ]
+
+
+def run_export_columns(run):
+    """Every column a run's export has: the inspection fields, stage timings and each region's score and verdict."""
+    columns = list(EXPORT_COLUMNS)
+    columns += [f'{stage}_ms' for stage in TIMING_STAGES]
+    for _, prefix in region_columns(run.model_id):
+        columns += [f'{prefix}_score', f'{prefix}_pass']
+    return columns
+
+
+def column_type(column):
+    if column in COLUMN_TYPES:
+        return COLUMN_TYPES[column]
+    if column.endswith('_ms') or column.endswith('_score'):
+        return 'float'
+    if column.endswith('_pass'):
+        return 'bool'
+    return 'str'
+
+
+def iter_run_rows(run_id, model_id=None):
+    """
+    Yield one dict per inspection in a run, carried-forward ones included,
+    streamed from a server-side cursor. Only plain columns are
+    fetched, so no ORM objects pile up however long the run is. With the model
+    id, each row also has its stage timings and region scores.
+    """
+    regions = region_columns(model_id) if model_id is not None else []
+    rows = run_inspections(
+        run_id,
+        Inspection.id, Inspection.run_id, Inspection.model_id, Inspection.image_url, Inspection.pass_fail,
+        Inspection.reason, Inspection.template_id, Inspection.duration_ms, Inspection.created_at,
+        Inspection.timings, Inspection.region_results
+    ).yield_per(FETCH_SIZE)
+
+    for (inspection_id, row_run_id, row_model_id, image_url, pass_fail, reason, template_id, duration_ms,
+         created_at, timings, region_results) in rows:
+        row = {
+            'inspection_id': inspection_id,
+            'run_id': row_run_id,
+            'model_id': row_model_id,
+            'image_url': image_url,
+            'pass_fail': pass_fail,
+            'reason': reason,
+            'template_id': template_id,
+            'duration_ms': duration_ms,
+            'created_at': created_at.isoformat() if created_at else None,
+        }
+        if model_id is None:
+            yield row
+            continue
+
+        stage_ms = dict.fromkeys(TIMING_STAGES)
+        for key, ms in json.loads(timings or '{}').items():
+            stage = key.partition(':')[0]
+            if stage in stage_ms:
+                stage_ms[stage] = round((stage_ms[stage] or 0) + ms, 3)
+        row.update((f'{stage}_ms', ms) for stage, ms in stage_ms.items())
+
+        results = json.loads(region_results or '{}')
+        for region_id, prefix in regions:
+            result = results.get(str(region_id)) or {}
+            row[f'{prefix}_score'] = result.get('score')
+            row[f'{prefix}_pass'] = result.get('pass')
+        yield row
+
+
+def iter_csv(rows, columns=EXPORT_COLUMNS):
+    """Yield CSV text in chunks of CSV_CHUNK_ROWS rows, header first, for streaming responses."""
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=columns, extrasaction='ignore')
+    writer.writeheader()
+    for count, row in enumerate(rows, 1):
+        writer.writerow(row)
+        if count % CSV_CHUNK_ROWS == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
+
+
+def write_csv(rows, path, columns=EXPORT_COLUMNS):
+    with open(path, 'w', newline='') as csv_file:
+        for chunk in iter_csv(rows, columns):
+            csv_file.write(chunk)
+
+
+def parquet_schema(columns):
+    import pyarrow as pa
+
+    types = {'int': pa.int64(), 'float': pa.float64(), 'bool': pa.bool_(), 'str': pa.string()}
+    return pa.schema([(column, types[column_type(column)]) for column in columns])
+
+
+def write_parquet(rows, path, columns=EXPORT_COLUMNS):
+    """
+    Write rows to a Parquet file (a path or a binary file object) in row groups
+    of PARQUET_BATCH_SIZE with a fixed schema, so the whole export is never held
+    at once and columns that start out empty keep their type.
+    """
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise RuntimeError("Parquet export needs pyarrow (pip install pyarrow).")
+
+    schema = parquet_schema(columns)
+    batch = {column: [] for column in columns}
+    count = 0
+
+    writer = pq.ParquetWriter(path, schema)
+    try:
+        for row in rows:
+            for column in columns:
+                batch[column].append(row.get(column))
+            count += 1
+            if count == PARQUET_BATCH_SIZE:
+                writer.write_table(pa.Table.from_pydict(batch, schema=schema))
+                batch = {column: [] for column in columns}
+                count = 0
+        if count:
+            writer.write_table(pa.Table.from_pydict(batch, schema=schema))
+    finally:
+        writer.close()
+
+
+def export_rows(rows, path, columns=EXPORT_COLUMNS):
+    """Write rows as CSV, or as Parquet when the path ends in .parquet."""
+    if path.lower().endswith('.parquet'):
+        write_parquet(rows, path, columns)
+    else:
+        write_csv(rows, path, columns)
+
+
+def export_run(run, path):
+    """Write every inspection of a run, with its timings and region scores, to a .csv or .parquet file."""
+    export_rows(iter_run_rows(run.id, run.model_id), path, run_export_columns(run))
@@ -0,0 +1,25 @@
+import importlib
+
+
+class LazyModule:
+    """
+    Stands in for a module until one of its attributes is first used, then
+    imports it. Attributes are cached on the stand-in, so later lookups cost
+    the same as on the module. Used for OpenCV and numpy, which take most of
+    the app's import time but are not needed by `flask db upgrade` and the like.
+    """
+
+    def __init__(self, name):
+        self._name = name
+
+    def __getattr__(self, attr):
+        value = getattr(importlib.import_module(self._name), attr)
+        setattr(self, attr, value)
+        return value
+
+    def __repr__(self):
+        return f'<lazy module {self._name!r}>'
+
+
+def lazy_import(name):
+    return LazyModule(name)
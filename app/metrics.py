@@ -0,0 +1,259 @@
+import json
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+# Histogram buckets in seconds, from a fast crop score up to a slow Bedrock call
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+REGISTRY = []
+
+
+def _format_labels(labelnames, values, extra=None):
+    pairs = list(zip(labelnames, values))
+    if extra:
+        pairs.append(extra)
+    if not pairs:
+        return ''
+    escaped = []
+    for name, value in pairs:
+        value = str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+        escaped.append(f'{name}="{value}"')
+    return '{' + ','.join(escaped) + '}'
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value))
+
+
+class Histogram:
+    """A labelled histogram rendered in the Prometheus text format."""
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._series = {}  # label values -> [bucket counts, sum, count]
+        self._lock = threading.Lock()
+        REGISTRY.append(self)
+
+    def observe(self, value, **labels):
+        key = tuple(str(labels.get(name, '')) for name in self.labelnames)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [[0] * len(self.buckets), 0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[0][i] += 1
+                    break
+            series[1] += value
+            series[2] += 1
+
+    def snapshot(self):
+        """This process's series as JSON-able [label values, [bucket counts, sum, count]] pairs."""
+        with self._lock:
+            return [[list(key), [list(s[0]), s[1], s[2]]] for key, s in self._series.items()]
+
+    def merge(self, merged, snapshot):
+        """Add a snapshot's series into merged, a dict of label values -> state."""
+        for key, (counts, total, count) in snapshot:
+            series = merged.setdefault(tuple(key), [[0] * len(self.buckets), 0.0, 0])
+            series[0] = [a + b for a, b in zip(series[0], counts)]
+            series[1] += total
+            series[2] += count
+
+    def render(self, merged=None):
+        """Render this process's series, or merged ones summed across processes."""
+        lines = [
+            f'# HELP {self.name} {self.documentation}',
+            f'# TYPE {self.name} histogram',
+        ]
+        if merged is None:
+            merged = {}
+            self.merge(merged, self.snapshot())
+        for key, (counts, total, count) in sorted(merged.items()):
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                labels = _format_labels(self.labelnames, key, ('le', _format_value(bound)))
+                lines.append(f'{self.name}_bucket{labels} {cumulative}')
+            labels = _format_labels(self.labelnames, key, ('le', '+Inf'))
+            lines.append(f'{self.name}_bucket{labels} {count}')
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f'{self.name}_sum{labels} {_format_value(total)}')
+            lines.append(f'{self.name}_count{labels} {count}')
+        return lines
+
+
+class Counter:
+    """A labelled counter rendered in the Prometheus text format."""
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._series = {}  # label values -> count
+        self._lock = threading.Lock()
+        REGISTRY.append(self)
+
+    def inc(self, amount=1, **labels):
+        key = tuple(str(labels.get(name, '')) for name in self.labelnames)
+        with self._lock:
+            self._series[key] = self._series.get(key, 0) + amount
+
+    def value(self, **labels):
+        key = tuple(str(labels.get(name, '')) for name in self.labelnames)
+        with self._lock:
+            return self._series.get(key, 0)
+
+    def snapshot(self):
+        """This process's series as JSON-able [label values, count] pairs."""
+        with self._lock:
+            return [[list(key), count] for key, count in self._series.items()]
+
+    def merge(self, merged, snapshot):
+        """Add a snapshot's series into merged, a dict of label values -> count."""
+        for key, count in snapshot:
+            merged[tuple(key)] = merged.get(tuple(key), 0) + count
+
+    def render(self, merged=None):
+        """Render this process's series, or merged ones summed across processes."""
+        lines = [
+            f'# HELP {self.name} {self.documentation}',
+            f'# TYPE {self.name} counter',
+        ]
+        if merged is None:
+            merged = {}
+            self.merge(merged, self.snapshot())
+        for key, count in sorted(merged.items()):
+            lines.append(f'{self.name}{_format_labels(self.labelnames, key)} {_format_value(count)}')
+        return lines
+
+
+stage_seconds = Histogram(
+    'inspection_stage_seconds',
+    'Time spent in each inspection pipeline stage.',
+    labelnames=('stage', 'model', 'region')
+)
+
+
+class StageTimings(dict):
+    """Stage name -> seconds for one inspection, plus the wall time of the whole block."""
+
+    total = 0.0
+
+    def as_json(self):
+        """Serialise the timings in milliseconds for Inspection.timings."""
+        return json.dumps({stage: round(seconds * 1000, 3) for stage, seconds in self.items()})
+
+
+_local = threading.local()
+
+
+@contextmanager
+def collect():
+    """
+    Collect every stage timed on this thread into a StageTimings dict, so the
+    timings for one inspection can be stored alongside it.
+    """
+    timings = StageTimings()
+    previous = getattr(_local, 'timings', None)
+    _local.timings = timings
+    start = time.perf_counter()
+    try:
+        yield timings
+    finally:
+        timings.total = time.perf_counter() - start
+        _local.timings = previous
+
+
+@contextmanager
+def timed(stage, model=None, region=None, region_id=None):
+    """
+    Time a pipeline stage into the stage histogram and the active collector. The
+    histogram is labelled with the region's name; the collected timings key it
+    by region_id when given, which stays unique when names repeat or change.
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        stage_seconds.observe(
+            elapsed,
+            stage=stage,
+            model='' if model is None else model,
+            region='' if region is None else region
+        )
+        timings = getattr(_local, 'timings', None)
+        if timings is not None:
+            label = region if region_id is None else region_id
+            key = stage if label is None else f'{stage}:{label}'
+            timings[key] = timings.get(key, 0.0) + elapsed
+
+
+def write_snapshot(directory):
+    """Write this process's series to <directory>/<pid>.json, replacing its last snapshot."""
+    path = os.path.join(directory, f'{os.getpid()}.json')
+    with open(path + '.tmp', 'w') as snapshot_file:
+        json.dump({metric.name: metric.snapshot() for metric in REGISTRY}, snapshot_file)
+    os.replace(path + '.tmp', path)
+
+
+def clear_snapshots(directory):
+    """Remove the snapshots of an earlier server, whose pids a new one could reuse."""
+    os.makedirs(directory, exist_ok=True)
+    for name in os.listdir(directory):
+        if name.endswith('.json') or name.endswith('.tmp'):
+            os.remove(os.path.join(directory, name))
+
+
+def run_snapshot_loop(directory, interval):
+    while True:
+        time.sleep(interval)
+        try:
+            write_snapshot(directory)
+        except OSError as e:
+            logger.warning("Could not write metrics snapshot: %s", e)
+
+
+def start_snapshot_thread(directory, interval):
+    """Write this process's snapshot every interval seconds on a daemon thread."""
+    thread = threading.Thread(
+        target=run_snapshot_loop, args=(directory, interval), name='metrics-snapshot', daemon=True
+    )
+    thread.start()
+    return thread
+
+
+def render(directory=None):
+    """
+    Render every registered metric in the Prometheus text exposition format.
+    With a directory, every process's snapshot in it is summed, this process's
+    written fresh first, so each scrape sees all of a server's workers. A worker
+    that has exited keeps its last snapshot, so counts never go backwards.
+    """
+    if directory is None:
+        return '\n'.join(line for metric in REGISTRY for line in metric.render()) + '\n'
+
+    write_snapshot(directory)
+    merged = {metric.name: {} for metric in REGISTRY}
+    for name in sorted(os.listdir(directory)):
+        if not name.endswith('.json'):
+            continue
+        try:
+            with open(os.path.join(directory, name)) as snapshot_file:
+                snapshot = json.load(snapshot_file)
+        except (OSError, ValueError):
+            continue  # replaced or removed while we read it
+        for metric in REGISTRY:
+            metric.merge(merged[metric.name], snapshot.get(metric.name, []))
+    return '\n'.join(line for metric in REGISTRY for line in metric.render(merged[metric.name])) + '\n'
@@ -10,19 +10,6 @@ class Model(db.Model):
     description = db.Column(db.Text, nullable=True)
     template_image_filename = db.Column(db.String(256))  # Changed to store only filename
 
-    good_image_1_filename = db.Column(db.String(256))
-    good_image_2_filename = db.Column(db.String(256))
-    good_image_3_filename = db.Column(db.String(256))
-    good_image_4_filename = db.Column(db.String(256))
-    good_image_5_filename = db.Column(db.String(256))
-
-    # Aligned image paths
-    good_image_1_aligned_filename = db.Column(db.String(256))
-    good_image_2_aligned_filename = db.Column(db.String(256))
-    good_image_3_aligned_filename = db.Column(db.String(256))
-    good_image_4_aligned_filename = db.Column(db.String(256))
-    good_image_5_aligned_filename = db.Column(db.String(256))
-
     status = db.Column(db.String(64), default='setup')  # 'setup', 'ready', 'running'
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, onupdate=datetime.utcnow)
@@ -41,13 +28,31 @@ class Model(db.Model):
         return self.get_image_path(self.template_image_filename)
 
 
+class ModelTemplate(db.Model):
+    """
+    An extra template for a product variant or orientation of a model, with its
+    own regions. The model's template_image_filename stays its primary template.
+    """
+    id = db.Column(db.Integer, primary_key=True)
+    model_id = db.Column(db.Integer, db.ForeignKey('model.id'), nullable=False, index=True)
+    name = db.Column(db.String(128), nullable=False)
+    image_filename = db.Column(db.String(256), nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    model = db.relationship('Model', backref=db.backref('templates', lazy=True, order_by='ModelTemplate.id'))
+
+
 class ModelRegion(db.Model):
     id = db.Column(db.Integer, primary_key=True)
-    model_id = db.Column(db.Integer, db.ForeignKey('model.id'), nullable=False)
+    model_id = db.Column(db.Integer, db.ForeignKey('model.id'), nullable=False, index=True)
+    template_id = db.Column(db.Integer, db.ForeignKey('model_template.id'), nullable=True)  # None for the primary template
     name = db.Column(db.String(256))
 
     model_pkl = db.Column(db.String(256), nullable=True)
 
+    status = db.Column(db.String(64), default='pending')  # 'pending', 'trained', 'failed'
+    training_error = db.Column(db.Text, nullable=True)
+
     fail_description = db.Column(db.Text, nullable=True)  # Added
     pass_description = db.Column(db.Text, nullable=True)  # Added
 
@@ -56,37 +61,11 @@ class ModelRegion(db.Model):
     x2 = db.Column(db.Integer, nullable=False)
     y2 = db.Column(db.Integer, nullable=False)
 
-    # Store filenames instead of URLs for bad images
-    bad_image_1_filename = db.Column(db.String(256))
-    bad_image_2_filename = db.Column(db.String(256))
-    bad_image_3_filename = db.Column(db.String(256))
-    bad_image_4_filename = db.Column(db.String(256))
-    bad_image_5_filename = db.Column(db.String(256))
-
-    # Store filenames instead of URLs for aligned bad images
-    bad_image_1_aligned_filename = db.Column(db.String(256))
-    bad_image_2_aligned_filename = db.Column(db.String(256))
-    bad_image_3_aligned_filename = db.Column(db.String(256))
-    bad_image_4_aligned_filename = db.Column(db.String(256))
-    bad_image_5_aligned_filename = db.Column(db.String(256))
-
-    # Store filenames for cropped bad images
-    bad_image_1_crop = db.Column(db.String(256))
-    bad_image_2_crop = db.Column(db.String(256))
-    bad_image_3_crop = db.Column(db.String(256))
-    bad_image_4_crop = db.Column(db.String(256))
-    bad_image_5_crop = db.Column(db.String(256))
-
-    # Store filenames for cropped good images
-    good_image_1_crop = db.Column(db.String(256))
-    good_image_2_crop = db.Column(db.String(256))
-    good_image_3_crop = db.Column(db.String(256))
-    good_image_4_crop = db.Column(db.String(256))
-    good_image_5_crop = db.Column(db.String(256))
-
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, onupdate=datetime.utcnow)
 
+    template = db.relationship('ModelTemplate')
+
     def get_bad_image_path(self, image_filename):
         """Get the full local path for a bad image."""
         if image_filename:
@@ -94,11 +73,46 @@ class ModelRegion(db.Model):
         return None
 
 
-class Run(db.Model):
+def _region_key(context):
+    return context.get_current_parameters().get('region_id') or 0
+
+
+class ReferenceImage(db.Model):
+    """
+    A reference image used to train a model's regions, with its aligned and
+    cropped copies. Good images belong to the whole model (region_id is null) and
+    each region's crop of good image n is a row with that region and ordinal n
+    holding only crop_filename. Bad images belong to one region.
+    """
+    __tablename__ = 'reference_image'
+    __table_args__ = (
+        # On region_key, since NULL region_ids never collide in a unique index
+        db.Index('ix_reference_image_slot', 'model_id', 'region_key', 'kind', 'ordinal', unique=True),
+    )
+
     id = db.Column(db.Integer, primary_key=True)
     model_id = db.Column(db.Integer, db.ForeignKey('model.id'), nullable=False)
+    region_id = db.Column(db.Integer, db.ForeignKey('model_region.id'), nullable=True, index=True)
+    region_key = db.Column(db.Integer, nullable=False, default=_region_key)  # region_id, or 0 for model-wide images
+    template_id = db.Column(db.Integer, db.ForeignKey('model_template.id'), nullable=True)  # good images of a variant
+    kind = db.Column(db.String(16), nullable=False)  # 'good', 'bad'
+    ordinal = db.Column(db.Integer, nullable=False)  # 1-based position within the set
+    filename = db.Column(db.String(256))
+    aligned_filename = db.Column(db.String(256))
+    crop_filename = db.Column(db.String(256))
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+
+class Run(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    model_id = db.Column(db.Integer, db.ForeignKey('model.id'), nullable=False, index=True)
     s3_path = db.Column(db.String(256))
     result = db.Column(db.String(64))  # "55/60 PASS"
+    # Counted in the transactions that write the run's inspections, so progress
+    # is one row away for any process; carried-forward inspections included
+    passed = db.Column(db.Integer, nullable=False, default=0)
+    failed = db.Column(db.Integer, nullable=False, default=0)
+    carried = db.Column(db.Integer, nullable=False, default=0)  # objects an incremental run carried forward
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
 
     # Relationship to Inspections
@@ -107,12 +121,120 @@ class Run(db.Model):
 
 class Inspection(db.Model):
     id = db.Column(db.Integer, primary_key=True)
-    run_id = db.Column(db.Integer, db.ForeignKey('run.id'), nullable=True)
-    model_id = db.Column(db.Integer, db.ForeignKey('model.id'), nullable=False)  # New field to store the model
+    run_id = db.Column(db.Integer, db.ForeignKey('run.id'), nullable=True, index=True)
+    model_id = db.Column(db.Integer, db.ForeignKey('model.id'), nullable=False, index=True)  # New field to store the model
+    template_id = db.Column(db.Integer, db.ForeignKey('model_template.id'), nullable=True)  # variant matched, None for the primary
     image_url = db.Column(db.String(256))
     pass_fail = db.Column(db.Boolean, default=False)
     reason = db.Column(db.Text, nullable=True)
+    timings = db.Column(db.Text, nullable=True)  # JSON of stage name -> milliseconds
+    duration_ms = db.Column(db.Float, nullable=True)
+    region_results = db.Column(db.Text, nullable=True)  # JSON of region id -> name, score and pass
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
 
     # Establish a relationship with the Model
     model = db.relationship('Model', backref='inspections', lazy=True)
+
+    __table_args__ = (
+        # A run's latest failures for its progress stream, read newest first off the index
+        db.Index('ix_inspection_run_failures', 'run_id', 'pass_fail', 'id'),
+    )
+
+
+class RunObject(db.Model):
+    """
+    An S3 object in a run's manifest: its key and ETag when the run listed it,
+    and the inspection holding its result. Objects an incremental run found
+    unchanged point at the inspection from the run before.
+    """
+    id = db.Column(db.Integer, primary_key=True)
+    run_id = db.Column(db.Integer, db.ForeignKey('run.id'), nullable=False)
+    key_hash = db.Column(db.String(40), nullable=False)  # sha1 of the key, short enough to index
+    key = db.Column(db.String(1024), nullable=False)
+    etag = db.Column(db.String(64))
+    inspection_id = db.Column(db.Integer, db.ForeignKey('inspection.id'), nullable=True, index=True)  # None if it failed
+    shard_id = db.Column(db.Integer, db.ForeignKey('run_shard.id'), nullable=True, index=True)  # None unless sharded
+
+    __table_args__ = (
+        db.Index('ix_run_object_lookup', 'run_id', 'key_hash', unique=True),
+    )
+
+
+class RunShard(db.Model):
+    """
+    A slice of a sharded run's manifest that one worker node inspects at a time.
+    Workers claim a shard by leasing it and renew the lease as they commit; a
+    shard whose lease runs out can be claimed by another worker.
+    """
+    id = db.Column(db.Integer, primary_key=True)
+    run_id = db.Column(db.Integer, db.ForeignKey('run.id'), nullable=False, index=True)
+    status = db.Column(db.String(16), nullable=False, default='pending')  # 'planning', 'pending', 'leased', 'done'
+    worker = db.Column(db.String(128), nullable=True)  # holder of the current or last lease
+    lease_expires_at = db.Column(db.DateTime, nullable=True)
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    object_count = db.Column(db.Integer, nullable=False, default=0)
+    inspected = db.Column(db.Integer, nullable=False, default=0)
+    passed = db.Column(db.Integer, nullable=False, default=0)
+    failed = db.Column(db.Integer, nullable=False, default=0)
+    errors = db.Column(db.Integer, nullable=False, default=0)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, onupdate=datetime.utcnow)
+
+
+class InspectionRollup(db.Model):
+    """
+    Inspection counts for a model, or for one of its regions, over an hour or a
+    day, added to in the transaction that writes the inspections. Latencies are
+    kept as counts per bucket of the histogram in app/rollups.py, which add up
+    across rows where percentiles would not.
+    """
+    id = db.Column(db.Integer, primary_key=True)
+    model_id = db.Column(db.Integer, db.ForeignKey('model.id'), nullable=False)
+    region_id = db.Column(db.Integer, nullable=False, default=0)  # 0 for whole inspections
+    period = db.Column(db.String(8), nullable=False)  # 'hour' or 'day'
+    bucket_start = db.Column(db.DateTime, nullable=False)
+    total = db.Column(db.Integer, nullable=False, default=0)
+    passed = db.Column(db.Integer, nullable=False, default=0)
+    failed = db.Column(db.Integer, nullable=False, default=0)
+    score_sum = db.Column(db.Float, nullable=False, default=0)  # regions only
+    latency_ms_sum = db.Column(db.Float, nullable=False, default=0)
+    # Inspections (or region scorings) that took up to each bound, not cumulative
+    latency_le_10 = db.Column(db.Integer, nullable=False, default=0)
+    latency_le_50 = db.Column(db.Integer, nullable=False, default=0)
+    latency_le_100 = db.Column(db.Integer, nullable=False, default=0)
+    latency_le_250 = db.Column(db.Integer, nullable=False, default=0)
+    latency_le_500 = db.Column(db.Integer, nullable=False, default=0)
+    latency_le_1000 = db.Column(db.Integer, nullable=False, default=0)
+    latency_le_2500 = db.Column(db.Integer, nullable=False, default=0)
+    latency_le_5000 = db.Column(db.Integer, nullable=False, default=0)
+    latency_le_10000 = db.Column(db.Integer, nullable=False, default=0)
+    latency_le_30000 = db.Column(db.Integer, nullable=False, default=0)
+    latency_over = db.Column(db.Integer, nullable=False, default=0)
+
+    __table_args__ = (
+        db.Index('ix_inspection_rollup_bucket', 'model_id', 'period', 'bucket_start', 'region_id', unique=True),
+    )
+
+
+class FailureReasonRollup(db.Model):
+    """How many of a model's inspections failed with each reason over an hour or a day."""
+    id = db.Column(db.Integer, primary_key=True)
+    model_id = db.Column(db.Integer, db.ForeignKey('model.id'), nullable=False)
+    period = db.Column(db.String(8), nullable=False)
+    bucket_start = db.Column(db.DateTime, nullable=False)
+    reason_hash = db.Column(db.String(40), nullable=False)  # sha1 of the reason, short enough to index
+    reason = db.Column(db.String(255), nullable=False)
+    count = db.Column(db.Integer, nullable=False, default=0)
+
+    __table_args__ = (
+        db.Index('ix_failure_reason_rollup_bucket', 'model_id', 'period', 'bucket_start', 'reason_hash', unique=True),
+    )
+
+
+class Blob(db.Model):
+    """An uploaded file in the content-addressed store, named <sha256>.<ext>."""
+    id = db.Column(db.Integer, primary_key=True)
+    filename = db.Column(db.String(256), nullable=False, unique=True)
+    size = db.Column(db.BigInteger, nullable=False)
+    refcount = db.Column(db.Integer, nullable=False, default=0)  # DB columns pointing at this blob
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
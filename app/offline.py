@@ -0,0 +1,125 @@
+import glob
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+
+from . import db
+from .batch import is_image_name
+from .inspection import inspect_image
+from .models import Model, Inspection
+from .events import count_run_inspections
+from .rollups import record_inspections
+
+# Set in each worker process by _init_worker
+_worker_model = None
+
+
+def find_images(path):
+    """Image files under a directory (recursively) or matching a glob, sorted so runs are repeatable."""
+    if os.path.isdir(path):
+        paths = (
+            os.path.join(root, filename)
+            for root, _, filenames in os.walk(path)
+            for filename in filenames
+        )
+    else:
+        paths = glob.glob(path, recursive=True)
+    return sorted(os.path.abspath(path) for path in paths if is_image_name(path) and os.path.isfile(path))
+
+
+def image_url_for(path):
+    return 'file://' + os.path.abspath(path)
+
+
+def _init_worker(model_id):
+    """Give each worker process its own app, database connections and copy of the model."""
+    global _worker_model
+    from . import create_app
+
+    app = create_app()
+    app.app_context().push()
+    _worker_model = Model.query.get(model_id)
+    list(_worker_model.regions)  # load once rather than per image
+
+
+def _inspect_file(image_path, station):
+    return inspect_image(image_path, _worker_model, station)
+
+
+def inspected_urls(run_id):
+    """Image URLs a run already has results for, so a resumed run skips them."""
+    urls = db.session.query(Inspection.image_url).filter_by(run_id=run_id).yield_per(1000)
+    return {image_url for image_url, in urls}
+
+
+def inspect_directory(model, paths, run, workers, insert_size, station=None, progress=print):
+    """
+    Inspect local image files across a process pool and write the results to
+    the run in bulk. Each committed batch is a checkpoint: images the run already
+    has results for are skipped, so an interrupted run resumes where it stopped.
+    Images from one station share a warm-start homography within each worker.
+    Returns counts of inspected, passed, failed, skipped and errored images.
+    """
+    done = inspected_urls(run.id)
+    todo = [path for path in paths if image_url_for(path) not in done]
+    counts = {'inspected': 0, 'passed': 0, 'failed': 0, 'skipped': len(paths) - len(todo), 'errors': 0}
+    rows = []
+
+    def flush():
+        if rows:
+            db.session.bulk_insert_mappings(Inspection, rows)
+            record_inspections(rows)
+            count_run_inspections(rows)
+            db.session.commit()
+            del rows[:]
+            progress(f"{counts['inspected'] + counts['skipped']}/{len(paths)} images, {counts['errors']} errors")
+
+    def collect(futures):
+        for future in futures:
+            image_path = pending.pop(future)
+            try:
+                result = future.result()
+            except Exception as e:
+                counts['errors'] += 1
+                progress(f"{image_path}: {type(e).__name__}: {e}")
+                continue
+
+            counts['inspected'] += 1
+            counts['passed' if result['pass_fail'] else 'failed'] += 1
+            rows.append({
+                'run_id': run.id,
+                'model_id': model.id,
+                'image_url': image_url_for(image_path),
+                'pass_fail': result['pass_fail'],
+                'reason': result['reason'],
+                'template_id': result['template_id'],
+                'timings': json.dumps(result['timings']),
+                'duration_ms': result['duration_ms'],
+                'region_results': json.dumps(result['region_results']),
+            })
+        if len(rows) >= insert_size:
+            flush()
+
+    # Forked workers must not share this process's pooled connections
+    db.session.commit()
+    db.engine.dispose()
+
+    pending = {}
+    try:
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(model.id,)) as executor:
+            for image_path in todo:
+                pending[executor.submit(_inspect_file, image_path, station)] = image_path
+                # Bound the images in flight so a huge directory is not queued all at once
+                while len(pending) >= workers * 2:
+                    collect(wait(pending, return_when=FIRST_COMPLETED).done)
+            while pending:
+                collect(wait(pending, return_when=FIRST_COMPLETED).done)
+    finally:
+        # Keep what finished even if the run is interrupted
+        flush()
+
+    total = Inspection.query.filter_by(run_id=run.id).count()
+    passed = Inspection.query.filter_by(run_id=run.id, pass_fail=True).count()
+    run.result = f"{passed}/{total} PASS"
+    db.session.commit()
+    return counts
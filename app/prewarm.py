@@ -0,0 +1,43 @@
+import time
+
+from . import db
+from .align import template_features
+from .lazy import lazy_import
+from .models import Model
+from .variants import model_variants, template_descriptor
+from .warm_start import template_region_stats
+
+cv2 = lazy_import('cv2')
+
+
+def prewarm(app, progress=print):
+    """
+    Do the work the first inspection of each ready model would otherwise pay
+    for: open a database connection, import OpenCV, read each template from
+    disk and fill the per-process caches of template SIFT features, global
+    descriptors and region statistics. A template that fails is reported and
+    skipped.
+    Returns the number of templates warmed.
+    """
+    started = time.monotonic()
+    warmed = 0
+    with app.app_context():
+        models = Model.query.filter_by(status='ready').all()
+        for model in models:
+            variants = model_variants(model)
+            for variant in variants:
+                path = variant.get_template_image_path()
+                template = cv2.imread(path)
+                if template is None:
+                    progress(f"Prewarm: could not load template {path} of model {model.id}")
+                    continue
+
+                template_features(path, template)
+                template_region_stats(template, variant)
+                if len(variants) > 1:
+                    template_descriptor(path)
+                warmed += 1
+        db.session.remove()
+
+    progress(f"Prewarmed {warmed} templates of {len(models)} ready models in {time.monotonic() - started:.1f}s")
+    return warmed
@@ -0,0 +1,123 @@
+import re
+from collections import defaultdict
+
+from . import db
+from .models import ReferenceImage
+from .storage import assign, release_many
+
+# A model needs at least this many good images before its regions are drawn
+MIN_GOOD_IMAGES = 5
+
+
+class ReferenceSet:
+    """A model's reference images grouped for lookup, loaded by load_reference_sets."""
+
+    def __init__(self, model_id):
+        self.model_id = model_id
+        self.good = []  # model-wide good images, by ordinal
+        self.bad = defaultdict(list)  # region id -> bad images, by ordinal
+        self.good_crops = defaultdict(dict)  # region id -> ordinal -> crop row
+
+    def add(self, reference):
+        if reference.region_id is None:
+            self.good.append(reference)
+        elif reference.kind == 'bad':
+            self.bad[reference.region_id].append(reference)
+        else:
+            self.good_crops[reference.region_id][reference.ordinal] = reference
+
+    def originals(self, region_id=None, template_id=None):
+        """Good images of a template (None for the primary), or a region's bad images, that have an uploaded original."""
+        if region_id is None:
+            references = [reference for reference in self.good if reference.template_id == template_id]
+        else:
+            references = self.bad.get(region_id, [])
+        return [reference for reference in references if reference.filename]
+
+    def find(self, kind, ordinal, region_id=None):
+        references = self.good if kind == 'good' else self.bad.get(region_id, [])
+        return next((reference for reference in references if reference.ordinal == ordinal), None)
+
+    def next_ordinal(self, kind, region_id=None):
+        references = self.good if kind == 'good' else self.bad.get(region_id, [])
+        return max((reference.ordinal for reference in references), default=0) + 1
+
+    def all_aligned(self):
+        references = self.good + [reference for region_references in self.bad.values() for reference in region_references]
+        return all(reference.aligned_filename for reference in references if reference.filename)
+
+
+def load_reference_sets(model_ids):
+    """Fetch the reference images of several models in one query. Returns model id -> ReferenceSet."""
+    sets = {model_id: ReferenceSet(model_id) for model_id in model_ids}
+    if not sets:
+        return sets
+
+    references = ReferenceImage.query.filter(ReferenceImage.model_id.in_(list(sets))).order_by(
+        ReferenceImage.model_id, ReferenceImage.region_key, ReferenceImage.kind, ReferenceImage.ordinal
+    )
+    for reference in references:
+        sets[reference.model_id].add(reference)
+    return sets
+
+
+def load_reference_set(model_id):
+    return load_reference_sets([model_id])[model_id]
+
+
+def set_reference(reference_set, kind, ordinal, filename, region_id=None, template_id=None):
+    """
+    Point a good or bad reference slot at an uploaded blob, creating the row if
+    the slot is new. Good images belong to a template (None for the primary).
+    Replacing an image clears its aligned copy. Returns the row, or None if the
+    slot already held this image.
+    """
+    reference = reference_set.find(kind, ordinal, region_id)
+    if reference is None:
+        reference = ReferenceImage(
+            model_id=reference_set.model_id, region_id=region_id, template_id=template_id, kind=kind, ordinal=ordinal
+        )
+        db.session.add(reference)
+        reference_set.add(reference)
+    elif reference.filename == filename:
+        return None
+
+    assign(reference, 'filename', filename)
+    reference.aligned_filename = None
+    return reference
+
+
+def set_crop(reference_set, kind, ordinal, region_id, crop_filename):
+    """Record a region's crop of a reference image."""
+    if kind == 'bad':
+        reference = reference_set.find('bad', ordinal, region_id)
+    else:
+        reference = reference_set.good_crops[region_id].get(ordinal)
+        if reference is None:
+            reference = ReferenceImage(model_id=reference_set.model_id, region_id=region_id, kind='good', ordinal=ordinal)
+            db.session.add(reference)
+            reference_set.add(reference)
+    reference.crop_filename = crop_filename
+
+
+def uploaded_files(files, prefix):
+    """
+    (ordinal, file) for each non-empty upload named <prefix>_<ordinal>, in order,
+    followed by (None, file) for each file in the multi-file field <prefix>s.
+    """
+    numbered = []
+    pattern = re.compile(re.escape(prefix) + r'_(\d+)$')
+    for name in files:
+        match = pattern.match(name)
+        if match and files[name].filename:
+            numbered.append((int(match.group(1)), files[name]))
+    numbered.sort(key=lambda item: item[0])
+    extra = [(None, file) for file in files.getlist(prefix + 's') if file.filename]
+    return numbered + extra
+
+
+def delete_references(model_id):
+    """Drop the blob references of a model's reference images and delete the rows in bulk."""
+    filenames = db.session.query(ReferenceImage.filename).filter_by(model_id=model_id)
+    release_many(filename for filename, in filenames)
+    ReferenceImage.query.filter_by(model_id=model_id).delete(synchronize_session=False)
@@ -0,0 +1,285 @@
+import hashlib
+import json
+from collections import defaultdict
+from datetime import datetime, timedelta
+
+from . import db
+from .models import Inspection, InspectionRollup, FailureReasonRollup, ModelRegion
+
+PERIODS = ('hour', 'day')
+
+# Upper bounds in milliseconds of the latency histogram kept per rollup row,
+# matching the latency_le_* columns, with latency_over past the last one
+LATENCY_BOUNDS_MS = (10, 50, 100, 250, 500, 1000, 2500, 5000, 10000, 30000)
+LATENCY_COLUMNS = [f'latency_le_{bound}' for bound in LATENCY_BOUNDS_MS] + ['latency_over']
+COUNT_COLUMNS = ['total', 'passed', 'failed', 'score_sum', 'latency_ms_sum'] + LATENCY_COLUMNS
+
+REASON_LENGTH = 255
+BACKFILL_CHUNK = 10000
+
+
+def bucket_start(timestamp, period):
+    """The start of the hour or day a timestamp falls in."""
+    if period == 'hour':
+        return timestamp.replace(minute=0, second=0, microsecond=0)
+    return timestamp.replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+def latency_column(ms):
+    for bound, column in zip(LATENCY_BOUNDS_MS, LATENCY_COLUMNS):
+        if ms <= bound:
+            return column
+    return 'latency_over'
+
+
+def reason_key(reason):
+    """(hash, text) a failure reason is counted under, the text cut to fit its column."""
+    reason = (reason or '')[:REASON_LENGTH]
+    return hashlib.sha1(reason.encode('utf-8')).hexdigest(), reason
+
+
+def _add(deltas, key, passed, latency_ms=None, score=None):
+    delta = deltas.get(key)
+    if delta is None:
+        delta = deltas[key] = dict.fromkeys(COUNT_COLUMNS, 0)
+    delta['total'] += 1
+    delta['passed' if passed else 'failed'] += 1
+    if score is not None:
+        delta['score_sum'] += score
+    if latency_ms is not None:
+        delta['latency_ms_sum'] += latency_ms
+        delta[latency_column(latency_ms)] += 1
+
+
+def aggregate(rows, now=None):
+    """
+    Sum inspection insert mappings into rollup increments. A row without
+    created_at is counted at now. Regions are timed by the stage timings labelled
+    with their id. Returns ({(model_id, region_id, period, bucket_start): counts},
+    {(model_id, period, bucket_start, reason_hash): [reason, count]}).
+    """
+    now = now or datetime.utcnow()
+    deltas = {}
+    reasons = {}
+    for row in rows:
+        model_id, passed = row['model_id'], bool(row['pass_fail'])
+        created_at = row.get('created_at') or now
+
+        region_ms = defaultdict(float)  # by the label after the stage name
+        for key, ms in json.loads(row.get('timings') or '{}').items():
+            stage, _, region = key.partition(':')
+            if region:
+                region_ms[region] += ms
+        results = json.loads(row.get('region_results') or '{}')
+        failure = None if passed else reason_key(row.get('reason'))
+
+        for period in PERIODS:
+            start = bucket_start(created_at, period)
+            _add(deltas, (model_id, 0, period, start), passed, row.get('duration_ms'))
+            for region_id, result in results.items():
+                # Inspections timed before timings were keyed by region id carry its name
+                ms = region_ms[region_id] if region_id in region_ms else region_ms.get(result.get('name'))
+                _add(deltas, (model_id, int(region_id), period, start), result.get('pass'), ms, result.get('score'))
+            if failure:
+                reason = reasons.setdefault((model_id, period, start, failure[0]), [failure[1], 0])
+                reason[1] += 1
+    return deltas, reasons
+
+
+def _upsert(model, key_columns, rows, counts):
+    """
+    Insert rows, or add their counts to the rows already there with the same
+    key. MySQL and PostgreSQL do it in one statement; elsewhere each row is an
+    UPDATE and, if nothing matched, an INSERT, which is safe on SQLite because
+    the first write locks the database until commit.
+    """
+    if not rows:
+        return
+    table = model.__table__
+    dialect = db.session.get_bind().dialect.name
+    if dialect == 'mysql':
+        from sqlalchemy.dialects.mysql import insert
+        statement = insert(table).values(rows)
+        db.session.execute(statement.on_duplicate_key_update(
+            {column: table.c[column] + statement.inserted[column] for column in counts}
+        ))
+    elif dialect == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert
+        statement = insert(table).values(rows)
+        db.session.execute(statement.on_conflict_do_update(
+            index_elements=key_columns,
+            set_={column: table.c[column] + statement.excluded[column] for column in counts}
+        ))
+    else:
+        for row in rows:
+            updated = db.session.execute(
+                table.update().where(db.and_(*(table.c[column] == row[column] for column in key_columns))).values(
+                    {column: table.c[column] + row[column] for column in counts}
+                )
+            )
+            if not updated.rowcount:
+                db.session.execute(table.insert().values(row))
+
+
+def apply(deltas, reasons):
+    """Add aggregated increments to the rollup tables, in key order so concurrent writers lock rows alike."""
+    _upsert(InspectionRollup, ['model_id', 'period', 'bucket_start', 'region_id'], [
+        dict(counts, model_id=model_id, region_id=region_id, period=period, bucket_start=start)
+        for (model_id, region_id, period, start), counts in sorted(deltas.items())
+    ], COUNT_COLUMNS)
+    _upsert(FailureReasonRollup, ['model_id', 'period', 'bucket_start', 'reason_hash'], [
+        {'model_id': model_id, 'period': period, 'bucket_start': start, 'reason_hash': hashed, 'reason': reason, 'count': count}
+        for (model_id, period, start, hashed), (reason, count) in sorted(reasons.items())
+    ], ['count'])
+
+
+def record_inspections(rows):
+    """
+    Add inspection insert mappings to the rollups. Call it before committing
+    the inspections, so the counts are written, or rolled back, with them.
+    """
+    if rows:
+        apply(*aggregate(rows))
+
+
+def delete_rollups(model_id=None, since=None):
+    """Delete the rollup rows of a model, or of every model, from the bucket holding since onwards."""
+    for model in (InspectionRollup, FailureReasonRollup):
+        query = model.query
+        if model_id is not None:
+            query = query.filter(model.model_id == model_id)
+        if since is not None:
+            query = query.filter(model.bucket_start >= bucket_start(since, 'day'))
+        query.delete(synchronize_session=False)
+
+
+def backfill(model_id=None, since=None, progress=print):
+    """
+    Rebuild the rollups of a model, or of every model, from the inspection
+    table, from the start of the day holding since (or from the beginning).
+    Inspections are read in id order a chunk at a time and each chunk's counts
+    are committed, so memory stays flat. Inspections written while it runs are
+    counted by their writers. Returns the number of inspections counted.
+    """
+    since = bucket_start(since, 'day') if since else None
+    until = datetime.utcnow()
+    delete_rollups(model_id, since)
+    db.session.commit()
+
+    query = db.session.query(
+        Inspection.id, Inspection.model_id, Inspection.pass_fail, Inspection.reason, Inspection.duration_ms,
+        Inspection.timings, Inspection.region_results, Inspection.created_at
+    ).filter(Inspection.created_at < until)
+    if model_id is not None:
+        query = query.filter(Inspection.model_id == model_id)
+    if since is not None:
+        query = query.filter(Inspection.created_at >= since)
+
+    counted = 0
+    last_id = 0
+    while True:
+        chunk = query.filter(Inspection.id > last_id).order_by(Inspection.id).limit(BACKFILL_CHUNK).all()
+        if not chunk:
+            break
+        last_id = chunk[-1].id
+        apply(*aggregate(row._asdict() for row in chunk))
+        db.session.commit()
+        counted += len(chunk)
+        progress(f"{counted} inspections counted")
+    return counted
+
+
+def percentile(counts, q):
+    """
+    Estimate a latency percentile (q from 0 to 1) from histogram bucket counts in
+    LATENCY_COLUMNS order, interpolating within the bucket it falls in. Past the
+    last bound the last bound is returned. None if there are no counts.
+    """
+    total = sum(counts)
+    if not total:
+        return None
+    rank = q * total
+    cumulative = 0
+    lower = 0
+    for bound, count in zip(LATENCY_BOUNDS_MS, counts):
+        if count and cumulative + count >= rank:
+            return lower + (bound - lower) * (rank - cumulative) / count
+        cumulative += count
+        lower = bound
+    return float(LATENCY_BOUNDS_MS[-1])
+
+
+def _summary(row, scored=False):
+    """
+    A dict of the summed counts, pass rate and latency percentiles of a rollup
+    query row. Only region rows are scored; mean_score is None for the others.
+    """
+    total, passed, failed, score_sum, latency_ms_sum = row[:5]
+    latency_counts = [int(count or 0) for count in row[5:]]
+    timed = sum(latency_counts)
+    return {
+        'total': int(total or 0),
+        'passed': int(passed or 0),
+        'failed': int(failed or 0),
+        'pass_rate': (passed or 0) / total if total else None,
+        'mean_score': (score_sum or 0) / total if scored and total else None,
+        'mean_ms': (latency_ms_sum or 0) / timed if timed else None,
+        'p50_ms': percentile(latency_counts, 0.5),
+        'p95_ms': percentile(latency_counts, 0.95),
+        'p99_ms': percentile(latency_counts, 0.99),
+    }
+
+
+def _count_columns(summed=True):
+    columns = [getattr(InspectionRollup, column) for column in COUNT_COLUMNS]
+    return [db.func.sum(column) for column in columns] if summed else columns
+
+
+def _window(query, period, since):
+    return query.filter(
+        InspectionRollup.period == period, InspectionRollup.bucket_start >= bucket_start(since, period)
+    )
+
+
+def model_summaries(period, since):
+    """Model id -> summary of its inspections from the bucket holding since onwards."""
+    rows = _window(db.session.query(
+        InspectionRollup.model_id, *_count_columns()
+    ), period, since).filter(InspectionRollup.region_id == 0).group_by(InspectionRollup.model_id)
+    return {row[0]: _summary(row[1:]) for row in rows}
+
+
+def model_series(model_id, period, since):
+    """(bucket start, summary) for each hour or day of a model's inspections, oldest first."""
+    rows = _window(db.session.query(
+        InspectionRollup.bucket_start, *_count_columns(summed=False)
+    ), period, since).filter(
+        InspectionRollup.model_id == model_id, InspectionRollup.region_id == 0
+    ).order_by(InspectionRollup.bucket_start)
+    return [(row[0], _summary(row[1:])) for row in rows]
+
+
+def region_summaries(model_id, period, since):
+    """(region id, region name, summary) for each region of a model that was scored in the window."""
+    rows = _window(db.session.query(
+        InspectionRollup.region_id, ModelRegion.name, *_count_columns()
+    ), period, since).outerjoin(ModelRegion, ModelRegion.id == InspectionRollup.region_id).filter(
+        InspectionRollup.model_id == model_id, InspectionRollup.region_id != 0
+    ).group_by(InspectionRollup.region_id, ModelRegion.name).order_by(InspectionRollup.region_id)
+    return [(row[0], row[1], _summary(row[2:], scored=True)) for row in rows]
+
+
+def top_reasons(model_id, period, since, limit=10):
+    """(reason, count) for a model's most common failure reasons in the window."""
+    count = db.func.sum(FailureReasonRollup.count)
+    return db.session.query(FailureReasonRollup.reason, count).filter(
+        FailureReasonRollup.model_id == model_id,
+        FailureReasonRollup.period == period,
+        FailureReasonRollup.bucket_start >= bucket_start(since, period)
+    ).group_by(FailureReasonRollup.reason_hash, FailureReasonRollup.reason).order_by(count.desc()).limit(limit).all()
+
+
+def window_start(period, count):
+    """The start of the window covering the last count hours or days, the current one included."""
+    step = timedelta(hours=1) if period == 'hour' else timedelta(days=1)
+    return bucket_start(datetime.utcnow(), period) - step * (count - 1)
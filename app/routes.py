@@ -1,24 +1,31 @@
-from flask import Blueprint, render_template, request, redirect, url_for, session, current_app
-
-from .align import align_and_crop_regions, crop_regions
-from .bedrock import train_bedrock
-from .models import db, Model, ModelRegion, Run, Inspection
-from . import images
-import boto3
+from flask import Blueprint, Response, render_template, request, redirect, url_for, session, current_app, stream_with_context, abort, send_file
+from flask_uploads import UploadNotAllowed
+from werkzeug.security import safe_join
+
+from .align import align_and_crop_regions
+from .batch import iter_uploaded_images
+from .events import count_run_inspections, stream_run_events
+from .export import iter_csv, iter_run_rows, run_export_columns, write_parquet
+from .inspection import inspect_image
+from .references import (
+    MIN_GOOD_IMAGES, ReferenceSet, load_reference_set, set_reference, set_crop, uploaded_files, delete_references
+)
+from .rollups import PERIODS, delete_rollups, model_summaries, model_series, record_inspections, region_summaries, top_reasons, window_start
+from .s3_runs import run_inspections, start_run_s3
+from .shards import has_shards, run_progress, start_plan_run
+from .storage import save_upload, assign, acquire, acquire_many, release, upload_filename
+from .thumbnails import THUMBNAIL_SIZES, get_thumbnail
+from .training import train_regions
+from .variants import model_variants, variant_for
+from .models import db, Model, ModelTemplate, ModelRegion, Run, RunObject, RunShard, Inspection
+from . import images, metrics
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+import json
 import os
+import tempfile
 
 main = Blueprint('main', __name__)
 
-# AWS S3 client initialization
-s3_client = boto3.client('s3')
-
-
-def run_inspection(image):
-    """Mock function to return 'pass' for every image."""
-    pass_fail = True  # Simulated "pass" result
-    reason = "All regions passed"
-    return pass_fail, reason
-
 
 @main.route('/models/<int:model_id>/inspect', methods=['GET', 'POST'])
 def inspect(model_id):
@@ -28,22 +35,33 @@ def inspect(model_id):
         image = request.files['image']  # Get the uploaded image
         if image:
             # Save the uploaded image to the uploads folder
-            filename = images.save(image)
+            filename = save_upload(image)
             image_path = url_for('static', filename=f'uploads/{filename}')
 
-            # Mock running inspection
-            pass_fail, reason = run_inspection(image_path)
+            # Align, score and inspect the same way as batch and S3 runs
+            try:
+                result = inspect_image(images.path(filename), model, request.form.get('station') or None)
+            except ValueError as e:
+                abort(400, description=str(e))
 
             # Create new Inspection instance and link it to the model
-            new_inspection = Inspection(
-                run_id=None,  # Assuming there is no run associated yet
-                model_id=model.id,  # Link to the model
-                image_url=image_path,
-                pass_fail=pass_fail,
-                reason=reason
-            )
+            row = {
+                'run_id': None,  # Assuming there is no run associated yet
+                'model_id': model.id,  # Link to the model
+                'image_url': image_path,
+                'pass_fail': result['pass_fail'],
+                'reason': result['reason'],
+                'template_id': result['template_id'],
+                'timings': json.dumps(result['timings']),
+                'duration_ms': result['duration_ms'],
+                'region_results': json.dumps(result['region_results']),
+            }
+            acquire(filename)
+            new_inspection = Inspection(**row)
             db.session.add(new_inspection)
-            db.session.commit()
+            record_inspections([row])
+            with metrics.timed('db_commit', model=model.id):
+                db.session.commit()
 
             # Redirect to the result page with the inspection ID
             return redirect(url_for('main.inspection_result', inspection_id=new_inspection.id))
@@ -52,6 +70,122 @@ def inspect(model_id):
 
 
 
+def _inspect_with_app_context(app, image_path, model, station=None):
+    with app.app_context():
+        return inspect_image(image_path, model, station)
+
+
+@main.route('/models/<int:model_id>/inspect/batch', methods=['POST'])
+def inspect_batch(model_id):
+    """
+    Inspect a batch of images uploaded as a multipart form (image and/or zip parts)
+    or a raw zip body. Images are inspected as they arrive and one NDJSON result is
+    streamed back per image as it finishes. Pass ?run=1 to record the inspections
+    under a new Run, or ?run_id=<id> to add them to an existing one, and
+    ?station=<name> to reuse that camera's homography between images.
+    """
+    model = Model.query.get_or_404(model_id)
+
+    run = None
+    if request.args.get('run_id'):
+        run = Run.query.filter_by(id=request.args.get('run_id', type=int), model_id=model.id).first_or_404()
+    elif request.args.get('run'):
+        run = Run(model_id=model.id, s3_path=request.args.get('source') or 'batch upload')
+        db.session.add(run)
+        db.session.commit()
+    run_id = run.id if run else None
+
+    # Load the regions and templates before handing the model to worker threads
+    regions = list(model.regions)
+    list(model.templates)
+    app = current_app._get_current_object()
+    workers = current_app.config['BATCH_INSPECT_WORKERS']
+    insert_size = current_app.config['BATCH_INSERT_SIZE']
+    station = request.args.get('station')
+
+    def generate():
+        rows = []
+        counts = {'total': 0, 'passed': 0, 'failed': 0, 'errors': 0}
+        pending = {}
+
+        def flush():
+            if rows:
+                with metrics.timed('db_commit', model=model.id):
+                    acquire_many(row.pop('blob_filename') for row in rows)
+                    db.session.bulk_insert_mappings(Inspection, rows)
+                    record_inspections(rows)
+                    count_run_inspections(rows)
+                    db.session.commit()
+                del rows[:]
+
+        def collect(futures):
+            for future in futures:
+                filename, image_url, blob_filename = pending.pop(future)
+                counts['total'] += 1
+                try:
+                    result = future.result()
+                except Exception as e:
+                    counts['errors'] += 1
+                    yield json.dumps({'filename': filename, 'image_url': image_url, 'error': f"{type(e).__name__}: {e}"}) + '\n'
+                    continue
+
+                counts['passed' if result['pass_fail'] else 'failed'] += 1
+                rows.append({
+                    'run_id': run_id,
+                    'model_id': model.id,
+                    'image_url': image_url,
+                    'pass_fail': result['pass_fail'],
+                    'reason': result['reason'],
+                    'template_id': result['template_id'],
+                    'timings': json.dumps(result['timings']),
+                    'duration_ms': result['duration_ms'],
+                    'region_results': json.dumps(result['region_results']),
+                    'blob_filename': blob_filename,
+                })
+                yield json.dumps(dict(result, filename=filename, image_url=image_url, run_id=run_id, error=None)) + '\n'
+
+            if len(rows) >= insert_size:
+                flush()
+
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            try:
+                for upload in iter_uploaded_images(request):
+                    try:
+                        filename = save_upload(upload)
+                    except UploadNotAllowed:
+                        counts['total'] += 1
+                        counts['errors'] += 1
+                        yield json.dumps({'filename': upload.filename, 'error': "File type not allowed"}) + '\n'
+                        continue
+                    finally:
+                        upload.close()
+
+                    image_path = images.path(filename)
+                    image_url = url_for('static', filename=f'uploads/{filename}')
+                    future = executor.submit(_inspect_with_app_context, app, image_path, model, station)
+                    pending[future] = (upload.filename, image_url, filename)
+
+                    # Bound the images in flight so a large upload is never all on disk at once
+                    while len(pending) >= workers * 2:
+                        yield from collect(wait(pending, return_when=FIRST_COMPLETED).done)
+            except ValueError as e:
+                yield json.dumps({'error': str(e)}) + '\n'
+
+            while pending:
+                yield from collect(wait(pending, return_when=FIRST_COMPLETED).done)
+
+        flush()
+
+        if run is not None:
+            passed, failed = db.session.query(Run.passed, Run.failed).filter(Run.id == run_id).one()
+            Run.query.filter_by(id=run_id).update({'result': f"{passed}/{passed + failed} PASS"})
+            db.session.commit()
+
+        yield json.dumps({'summary': dict(counts, run_id=run_id)}) + '\n'
+
+    return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+
+
 @main.route('/inspection_result/<int:inspection_id>')
 def inspection_result(inspection_id):
     # Retrieve the inspection data from the database using the inspection_id
@@ -109,8 +243,8 @@ def upload_template_image(model_id):
     session['model_id'] = model_id
 
     if request.method == 'POST' and 'template_image' in request.files:
-        filename = images.save(request.files['template_image'])  # Save only the filename
-        model.template_image_filename = filename
+        filename = save_upload(request.files['template_image'])  # Save only the filename
+        assign(model, 'template_image_filename', filename)
         db.session.commit()
 
         return redirect(url_for('main.upload_good_images', model_id=model_id))
@@ -126,10 +260,10 @@ def upload_good_images(model_id):
     session['model_id'] = model_id
 
     if request.method == 'POST':
-        for i in range(1, 6):
-            if f'good_image_{i}' in request.files:
-                filename = images.save(request.files[f'good_image_{i}'])  # Store only filename
-                setattr(model, f'good_image_{i}_filename', filename)
+        references = load_reference_set(model_id)
+        for ordinal, upload in uploaded_files(request.files, 'good_image'):
+            filename = save_upload(upload)  # Store only filename
+            set_reference(references, 'good', ordinal or references.next_ordinal('good'), filename)
         db.session.commit()
 
         return redirect(url_for('main.draw_regions', model_id=model_id))
@@ -137,12 +271,41 @@ def upload_good_images(model_id):
     return render_template('model_good_images.html', model=model)
 
 
+@main.route('/models/<int:model_id>/templates', methods=['GET', 'POST'])
+def model_templates(model_id):
+    model = Model.query.get_or_404(model_id)
+    session['model_id'] = model_id
+
+    # An extra template for another product variant or camera angle, with its
+    # own good images. Its regions are drawn on it like the primary template's.
+    if request.method == 'POST' and request.files.get('template_image') and request.files['template_image'].filename:
+        template = ModelTemplate(model_id=model_id, name=request.form['name'])
+        assign(template, 'image_filename', save_upload(request.files['template_image']))
+        db.session.add(template)
+        db.session.flush()
+
+        references = load_reference_set(model_id)
+        for _, upload in uploaded_files(request.files, 'good_image'):
+            set_reference(references, 'good', references.next_ordinal('good'), save_upload(upload), template_id=template.id)
+        db.session.commit()
+
+        return redirect(url_for('main.draw_regions', model_id=model_id, template_id=template.id))
+
+    references = load_reference_set(model_id)
+    return render_template('model_templates.html', model=model, variants=model_variants(model), references=references)
+
+
 @main.route('/models/upload_region_images', methods=['POST'])
 def upload_region_images():
     model_id = session.get('model_id')
     if not model_id:
         return redirect(url_for('main.model_create'))
 
+    # Regions drawn on an extra template belong to it
+    template_id = request.form.get('template_id', type=int)
+    if template_id is not None and not ModelTemplate.query.filter_by(id=template_id, model_id=model_id).count():
+        abort(404)
+
     x1 = request.form['x1']
     y1 = request.form['y1']
     x2 = request.form['x2']
@@ -151,19 +314,15 @@ def upload_region_images():
     fail_description = request.form['fail_description']
     pass_description = request.form['pass_description']
 
-    bad_images = []
-    for i in range(1, 6):
-        if f'bad_image_{i}' in request.files:
-            filename = images.save(request.files[f'bad_image_{i}'])
-            bad_images.append(filename)
-
-    new_region = ModelRegion(model_id=model_id, x1=x1, y1=y1, x2=x2, y2=y2, name=region_name)
-
-    # Assign the saved filenames to the new region
-    for i, filename in enumerate(bad_images, 1):
-        setattr(new_region, f'bad_image_{i}_filename', filename)
-
+    new_region = ModelRegion(model_id=model_id, template_id=template_id, x1=x1, y1=y1, x2=x2, y2=y2, name=region_name)
     db.session.add(new_region)
+    db.session.flush()
+
+    # Save the bad images as the new region's references
+    references = ReferenceSet(model_id)
+    for ordinal, (_, upload) in enumerate(uploaded_files(request.files, 'bad_image'), 1):
+        filename = save_upload(upload)
+        set_reference(references, 'bad', ordinal, filename, region_id=new_region.id)
     db.session.commit()
 
     # Save fail and pass descriptions for the model
@@ -172,7 +331,7 @@ def upload_region_images():
     model.pass_description = pass_description
     db.session.commit()
 
-    return redirect(url_for('main.draw_regions', model_id=model_id))
+    return redirect(url_for('main.draw_regions', model_id=model_id, template_id=template_id))
 
 
 @main.route('/models/draw_regions/<int:model_id>', methods=['GET', 'POST'])
@@ -182,7 +341,11 @@ def draw_regions(model_id):
         return redirect(url_for('main.model_create'))
     session['model_id'] = model_id
 
-    return render_template('model_regions.html', model=model)
+    variant = variant_for(model, request.args.get('template_id', type=int))
+    if variant is None:
+        abort(404)
+
+    return render_template('model_regions.html', model=model, variant=variant)
 
 
 @main.route('/regions/<int:region_id>/data', methods=['GET'])
@@ -194,17 +357,22 @@ def get_region_data(region_id):
         'y1': region.y1,
         'x2': region.x2,
         'y2': region.y2,
-        'bad_image_1_url': region.bad_image_1_url,
-        'bad_image_2_url': region.bad_image_2_url,
-        'bad_image_3_url': region.bad_image_3_url,
-        'bad_image_4_url': region.bad_image_4_url,
-        'bad_image_5_url': region.bad_image_5_url,
+        'bad_image_urls': [
+            url_for('static', filename=f'uploads/{reference.filename}')
+            for reference in load_reference_set(region.model_id).originals(region.id)
+        ],
         'fail_description': region.fail_description,
         'pass_description': region.pass_description
     }
     return region_data
 
 
+def _align_reference(reference, model):
+    """Align a reference image onto the template, recording the aligned filename or None."""
+    aligned_image_path = align_and_crop_regions(images.path(reference.filename), model)
+    reference.aligned_filename = os.path.basename(aligned_image_path) if aligned_image_path else None
+
+
 @main.route('/models/finish_regions', methods=['POST'])
 def finish_regions():
     model_id = session.get('model_id')
@@ -212,29 +380,15 @@ def finish_regions():
         return redirect(url_for('main.model_create'))
 
     model = Model.query.get(model_id)
+    references = load_reference_set(model_id)
 
-    # Process good images and align them
-    for i in range(1, 6):
-        good_image_filename = getattr(model, f'good_image_{i}_filename')  # Now fetching filename
-        if good_image_filename:
-            good_image_path = os.path.join('app/static/uploads', good_image_filename)
-            aligned_image_path = align_and_crop_regions(good_image_path, model)
-            if aligned_image_path:
-                setattr(model, f'good_image_{i}_aligned_filename', os.path.basename(aligned_image_path))  # Save filename
-            else:
-                setattr(model, f'good_image_{i}_aligned_filename', None)
-
-    # Process bad images for each region and align them
-    for region in model.regions:
-        for i in range(1, 6):
-            bad_image_filename = getattr(region, f'bad_image_{i}_filename')  # Now fetching filename
-            if bad_image_filename:
-                bad_image_path = os.path.join('app/static/uploads', bad_image_filename)
-                aligned_image_path = align_and_crop_regions(bad_image_path, model)
-                if aligned_image_path:
-                    setattr(region, f'bad_image_{i}_aligned_filename', os.path.basename(aligned_image_path))  # Save filename
-                else:
-                    setattr(region, f'bad_image_{i}_aligned_filename', None)
+    # Align each template's good images and its regions' bad images onto it
+    for variant in model_variants(model):
+        for reference in references.originals(template_id=variant.template_id):
+            _align_reference(reference, variant)
+        for region in variant.regions:
+            for reference in references.originals(region.id):
+                _align_reference(reference, variant)
 
     db.session.commit()
 
@@ -245,94 +399,87 @@ def finish_regions():
 def review_images(model_id):
     model = Model.query.get_or_404(model_id)
 
+    references = load_reference_set(model_id)
+    variants = {variant.template_id: variant for variant in model_variants(model)}
+
     # If new images were uploaded, handle alignment
     if request.method == 'POST':
-        for i in range(1, 6):
-            if f'good_image_{i}' in request.files:
-                filename = images.save(request.files[f'good_image_{i}'])
-                setattr(model, f'good_image_{i}_filename', filename)  # Save the filename instead of URL
-                good_image_path = os.path.join('app/static/uploads', filename)
-                aligned_image_path = align_and_crop_regions(good_image_path, model)
-                if aligned_image_path:
-                    setattr(model, f'good_image_{i}_aligned_filename', os.path.basename(aligned_image_path))  # Save filename
-                else:
-                    setattr(model, f'good_image_{i}_aligned_filename', None)
+        for ordinal, upload in uploaded_files(request.files, 'good_image'):
+            # A replaced image keeps its template; extra uploads go to the primary
+            existing = references.find('good', ordinal) if ordinal else None
+            template_id = existing.template_id if existing else None
+            ordinal = ordinal or references.next_ordinal('good')
+            reference = set_reference(references, 'good', ordinal, save_upload(upload), template_id=template_id)
+            if reference is None:
+                continue  # Same image uploaded again, nothing to realign
+            # Good images are shared by every region on their template, so all of them need retraining
+            variant = variants[template_id]
+            for region in variant.regions:
+                region.status = 'pending'
+            _align_reference(reference, variant)
 
         for region in model.regions:
-            for i in range(1, 6):
-                if f'bad_image_{region.id}_{i}' in request.files:
-                    filename = images.save(request.files[f'bad_image_{region.id}_{i}'])
-                    setattr(region, f'bad_image_{i}_filename', filename)  # Save the filename instead of URL
-                    bad_image_path = os.path.join('app/static/uploads', filename)
-                    aligned_image_path = align_and_crop_regions(bad_image_path, model)
-                    if aligned_image_path:
-                        setattr(region, f'bad_image_{i}_aligned_filename', os.path.basename(aligned_image_path))  # Save filename
-                    else:
-                        setattr(region, f'bad_image_{i}_aligned_filename', None)
+            for ordinal, upload in uploaded_files(request.files, f'bad_image_{region.id}'):
+                ordinal = ordinal or references.next_ordinal('bad', region.id)
+                reference = set_reference(references, 'bad', ordinal, save_upload(upload), region_id=region.id)
+                if reference is None:
+                    continue  # Same image uploaded again, nothing to realign
+                region.status = 'pending'
+                _align_reference(reference, variants[region.template_id])
 
         db.session.commit()
 
     # Check if all images are aligned
-    all_images_aligned = True
-    missing_good_images = {}
-    for i in range(1, 6):
-        aligned_image = getattr(model, f'good_image_{i}_aligned_filename')
-        if not aligned_image:
-            missing_good_images[f'good_image_{i}'] = True
-            all_images_aligned = False
-
-    missing_bad_images_by_region = {}
-    for region in model.regions:
-        missing_bad_images = {}
-        for i in range(1, 6):
-            aligned_image = getattr(region, f'bad_image_{i}_aligned_filename')
-            if not aligned_image:
-                missing_bad_images[f'bad_image_{i}'] = True
-                all_images_aligned = False
-        missing_bad_images_by_region[region.name] = missing_bad_images
-
-    if all_images_aligned:
+    if references.all_aligned():
         return render_template('model_review_images.html', all_images_aligned=True, model=model)
 
-    return render_template('model_review_images.html', model=model, missing_good_images=missing_good_images, missing_bad_images_by_region=missing_bad_images_by_region, all_images_aligned=False)
+    return render_template('model_review_images.html', model=model, references=references, all_images_aligned=False)
 
 
 @main.route('/models/finish/<int:model_id>', methods=['POST'])
 def finish_model(model_id):
     model = Model.query.get_or_404(model_id)
+    output_dir = current_app.config['UPLOADED_IMAGES_DEST']
+
+    # Regions that already trained successfully are skipped, so a retry after a
+    # partial failure only re-trains the regions that failed
+    pending_regions = [region for region in model.regions if region.status != 'trained']
+    references = load_reference_set(model_id)
+
+    # Regions are independent, so they are cropped and trained concurrently
+    results = train_regions(
+        current_app._get_current_object(),
+        model,
+        pending_regions,
+        references,
+        output_dir,
+        current_app.config['TRAINING_MAX_WORKERS']
+    )
+
+    # Apply the results on this thread - the workers never touch the session
+    for region in pending_regions:
+        result = results[region.id]
+        for ordinal, crop_filename in result['good_crops'].items():
+            set_crop(references, 'good', ordinal, region.id, crop_filename)
+        for ordinal, crop_filename in result['bad_crops'].items():
+            set_crop(references, 'bad', ordinal, region.id, crop_filename)
+
+        if result['error']:
+            region.status = 'failed'
+            region.training_error = result['error']
+        else:
+            region.status = 'trained'
+            region.training_error = None
+            region.model_pkl = f"{region.id}.pkl"
 
-    # For each region, align good and bad images, crop regions, and save URLs
-    for region in model.regions:
-        good_img_urls = []
-        bad_img_urls = []
-        output_dir = current_app.config['UPLOADED_IMAGES_DEST']
-
-        # Align and crop good images
-        for i in range(1, 6):
-            good_image_filename = getattr(model, f'good_image_{i}_aligned_filename')
-            if good_image_filename:
-                good_image_path = os.path.join(output_dir, good_image_filename)
-                cropped_good_image = crop_regions(good_image_path, model, region)
-                if cropped_good_image:
-                    setattr(region, f'good_image_{i}_crop', os.path.basename(cropped_good_image))
-                    good_img_urls.append(cropped_good_image)
-
-        # Align and crop bad images
-        for i in range(1, 6):
-            bad_image_filename = getattr(region, f'bad_image_{i}_aligned_filename')
-            if bad_image_filename:
-                bad_image_path = os.path.join(output_dir, bad_image_filename)
-                cropped_bad_image = crop_regions(bad_image_path, model, region)
-                if cropped_bad_image:
-                    setattr(region, f'bad_image_{i}_crop', os.path.basename(cropped_bad_image))
-                    bad_img_urls.append(cropped_bad_image)
-
-        # Run bedrock training
-        train_bedrock(good_img_urls, bad_img_urls, region)
-
-    model.status = 'ready'
+    failed_regions = [region for region in model.regions if region.status != 'trained']
+    if not failed_regions:
+        model.status = 'ready'
     db.session.commit()
 
+    if failed_regions:
+        return render_template('model_training_report.html', model=model, failed_regions=failed_regions)
+
     return redirect(url_for('main.model_list'))
 
 
@@ -344,46 +491,52 @@ def model_detail(model_id):
     if model.status == 'setup':
         if not model.template_image_filename:
             return redirect(url_for('main.upload_template_image', model_id=model_id))
-        elif not all([
-            model.good_image_1_filename,
-            model.good_image_2_filename,
-            model.good_image_3_filename,
-            model.good_image_4_filename,
-            model.good_image_5_filename
-        ]):
+
+        references = load_reference_set(model_id)
+        if len(references.originals()) < MIN_GOOD_IMAGES:
             return redirect(url_for('main.upload_good_images', model_id=model_id))
+        elif any(reference.aligned_filename for reference in references.originals()):
+            return redirect(url_for('main.review_images', model_id=model_id))
         else:
-            # Check if all good images have aligned versions
-            all_images_aligned = any([
-                getattr(model, f'good_image_{i}_aligned_filename') for i in range(1, 6)
-            ])
-            if all_images_aligned:
-                return redirect(url_for('main.review_images', model_id=model_id))
-            else:
-                return redirect(url_for('main.draw_regions', model_id=model_id))
-
-    # Generate full image URLs/paths for template and good images
+            return redirect(url_for('main.draw_regions', model_id=model_id))
+
+    # Generate full image URLs/paths for the template
     template_image_url = model.get_image_path(model.template_image_filename)
-    good_images_urls = [
-        model.get_image_path(model.good_image_1_filename),
-        model.get_image_path(model.good_image_2_filename),
-        model.get_image_path(model.good_image_3_filename),
-        model.get_image_path(model.good_image_4_filename),
-        model.get_image_path(model.good_image_5_filename),
-    ]
+    references = load_reference_set(model_id)
 
-    return render_template('model_detail.html', model=model, template_image_url=template_image_url)
+    return render_template(
+        'model_detail.html', model=model, template_image_url=template_image_url, references=references,
+        variants=model_variants(model)
+    )
 
 
 @main.route('/models/<int:model_id>/delete', methods=['POST'])
 def delete_model(model_id):
     model = Model.query.get_or_404(model_id)
 
-    # Remove all related regions for this model
-    ModelRegion.query.filter_by(model_id=model_id).delete()
-
-    # Delete the model
-    db.session.delete(model)
+    # Drop the model's references to its uploaded images
+    release(model.template_image_filename)
+    for template in model.templates:
+        release(template.image_filename)
+
+    # ...and its inspections' references, counted in the database rather than loaded
+    inspection_images = db.session.query(Inspection.image_url, db.func.count(Inspection.id)) \
+        .filter_by(model_id=model_id).group_by(Inspection.image_url)
+    for image_url, count in inspection_images:
+        release(upload_filename(image_url), count)
+
+    # Delete children before parents with one statement per table. The files left
+    # behind are picked up by the storage GC.
+    run_ids = db.session.query(Run.id).filter_by(model_id=model_id)
+    RunObject.query.filter(RunObject.run_id.in_(run_ids)).delete(synchronize_session=False)
+    RunShard.query.filter(RunShard.run_id.in_(run_ids)).delete(synchronize_session=False)
+    Inspection.query.filter_by(model_id=model_id).delete(synchronize_session=False)
+    Run.query.filter_by(model_id=model_id).delete(synchronize_session=False)
+    delete_rollups(model_id)
+    delete_references(model_id)
+    ModelRegion.query.filter_by(model_id=model_id).delete(synchronize_session=False)
+    ModelTemplate.query.filter_by(model_id=model_id).delete(synchronize_session=False)
+    Model.query.filter_by(id=model_id).delete(synchronize_session=False)
     db.session.commit()
 
     return redirect(url_for('main.model_list'))
@@ -391,38 +544,162 @@ def delete_model(model_id):
 
 @main.route('/models/<int:model_id>/run', methods=['POST'])
 def run_model(model_id):
+    """
+    Start inspecting the images under an S3 path and go to the run's page. With
+    incremental set, only objects that are new or changed since the last run on
+    the same path are inspected. With sharded set, the objects are only listed
+    into shards, in the background, for `flask run-worker` processes to inspect.
+    """
     model = Model.query.get_or_404(model_id)
-    model.status = 'running'
-    db.session.commit()
-
     s3_path = request.form['s3_path']
-    new_run = Run(model_id=model.id, s3_path=s3_path)
-    db.session.add(new_run)
-    db.session.commit()
-
-    # Simulate S3 image processing
-    for i in range(10):  # Mock 10 images for the run
-        image_url = f"https://mocked-s3-url.com/image_{i}.jpg"
-        pass_fail, reason = run_inspection(image_url)
-        inspection = Inspection(run_id=new_run.id, image_url=image_url, pass_fail=pass_fail, reason=reason)
-        db.session.add(inspection)
+    incremental = bool(request.form.get('incremental'))
 
-    db.session.commit()
+    if request.form.get('sharded'):
+        new_run = Run(model_id=model.id, s3_path=s3_path)
+        db.session.add(new_run)
+        db.session.commit()
+        # Listing a large prefix takes a while; workers claim shards as they are written
+        start_plan_run(new_run, incremental, current_app.config['RUN_SHARD_SIZE'])
+        return redirect(url_for('main.run_detail', run_id=new_run.id))
 
-    model.status = 'ready'
+    model.status = 'running'
+    new_run = Run(model_id=model.id, s3_path=s3_path)
+    db.session.add(new_run)
     db.session.commit()
 
+    # The run page follows its progress while a background thread inspects
+    start_run_s3(model, new_run, incremental, request.form.get('station') or None)
     return redirect(url_for('main.run_detail', run_id=new_run.id))
 
 
 @main.route('/runs/<int:run_id>')
 def run_detail(run_id):
     run = Run.query.get_or_404(run_id)
-    inspections = Inspection.query.filter_by(run_id=run_id).all()
-    return render_template('run_detail.html', run=run, inspections=inspections)
+    # An incremental run's unchanged objects keep their inspection from an earlier run
+    inspections = run_inspections(run_id).all()
+    progress = run_progress(run_id) if has_shards(run_id) else None
+    return render_template('run_detail.html', run=run, inspections=inspections, progress=progress)
+
+
+@main.route('/runs/<int:run_id>/export.<fmt>')
+def export_run(run_id, fmt):
+    """
+    Download a run's inspections with their stage timings and region scores.
+    CSV is streamed as it is read; Parquet is written to a temporary file first,
+    since its footer comes last, then streamed from there.
+    """
+    run = Run.query.get_or_404(run_id)
+    columns = run_export_columns(run)
+    rows = iter_run_rows(run.id, run.model_id)
+    filename = f'run_{run.id}.{fmt}'
+    headers = {'Content-Disposition': f'attachment; filename={filename}'}
+
+    if fmt == 'csv':
+        return Response(stream_with_context(iter_csv(rows, columns)), mimetype='text/csv', headers=headers)
+    if fmt != 'parquet':
+        abort(404)
+
+    parquet_file = tempfile.TemporaryFile()
+    try:
+        write_parquet(rows, parquet_file, columns)
+    except RuntimeError as e:
+        parquet_file.close()
+        abort(501, description=str(e))
+    parquet_file.seek(0)
+
+    def generate():
+        with parquet_file:
+            for chunk in iter(lambda: parquet_file.read(1024 * 1024), b''):
+                yield chunk
+
+    return Response(generate(), mimetype='application/vnd.apache.parquet', headers=headers)
+
+
+@main.route('/runs/<int:run_id>/events')
+def run_events(run_id):
+    """
+    Server-Sent Events stream of a run's progress, polled from the run's
+    counters so it works from any web worker whichever process runs the run.
+    """
+    Run.query.get_or_404(run_id)
+    sharded = has_shards(run_id)
+    db.session.commit()
+
+    def shard_progress(run_id):
+        # Sharded runs add the shard counts aggregated across their workers
+        return {'progress': run_progress(run_id)}
+
+    return Response(
+        stream_with_context(stream_run_events(
+            run_id,
+            shard_progress if sharded else None,
+            interval=current_app.config['EVENTS_POLL_SECONDS'],
+            duration=current_app.config['EVENTS_STREAM_SECONDS']
+        )),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
 
 
 @main.route('/runs')
 def run_list():
     runs = Run.query.all()
     return render_template('run_list.html', runs=runs)
+
+
+@main.route('/analytics')
+def analytics():
+    """
+    Pass rates, failure reasons and latency percentiles per model, and per
+    region for ?model_id=<id>, over the last ?count= hours or days (?period=).
+    Read from the rollup tables only, never the inspections themselves.
+    """
+    period = request.args.get('period') if request.args.get('period') in PERIODS else 'day'
+    count = max(1, min(request.args.get('count', type=int) or (24 if period == 'hour' else 30), 1000))
+    since = window_start(period, count)
+
+    models = Model.query.order_by(Model.name).all()
+    summaries = model_summaries(period, since)
+    model = None
+    series, regions, reasons = [], [], []
+    if request.args.get('model_id'):
+        model = Model.query.get_or_404(request.args.get('model_id', type=int))
+        series = model_series(model.id, period, since)
+        regions = region_summaries(model.id, period, since)
+        reasons = top_reasons(model.id, period, since)
+
+    return render_template(
+        'analytics.html', models=models, summaries=summaries, model=model, series=series, regions=regions,
+        reasons=reasons, period=period, count=count
+    )
+
+
+@main.route('/thumbs/<int:size>/<path:filename>')
+def thumbnail(size, filename):
+    """Serve a downscaled copy of an uploaded image, generated on first request."""
+    if size not in THUMBNAIL_SIZES:
+        abort(404)
+
+    source_path = safe_join(current_app.config['UPLOADED_IMAGES_DEST'], filename)
+    if source_path is None or not os.path.isfile(source_path):
+        abort(404)
+
+    try:
+        thumbnail_path, digest = get_thumbnail(source_path, size)
+    except ValueError:
+        abort(404)
+
+    # Uploads are never overwritten, so a thumbnail URL always means the same bytes
+    etag = f'{digest}-{size}'
+    if request.if_none_match.contains(etag):
+        response = Response(status=304)
+    else:
+        response = send_file(thumbnail_path, mimetype='image/jpeg', conditional=False, add_etags=False)
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'public, max-age=31536000, immutable'
+    return response
+
+
+@main.route('/metrics')
+def metrics_endpoint():
+    return Response(metrics.render(current_app.config['METRICS_DIR']), mimetype='text/plain; version=0.0.4; charset=utf-8')
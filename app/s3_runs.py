@@ -0,0 +1,290 @@
+import hashlib
+import json
+import os
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+
+from flask import current_app
+
+from . import db, metrics
+from .batch import is_image_name
+from .inspection import inspect_image
+from .models import Model, Run, RunObject, Inspection
+from .events import add_run_counts, count_run_inspections
+from .rollups import record_inspections
+
+# Keys per ListObjectsV2 page, which is also the batch the manifest diff looks up at once
+LIST_PAGE_SIZE = 1000
+
+_s3_client = None
+_s3_client_lock = threading.Lock()
+_worker = threading.local()  # each worker thread's own copy of the model
+_run_executor = None  # runs started from the web app, created on first use
+_run_executor_lock = threading.Lock()
+
+
+def get_s3_client():
+    """A boto3 S3 client shared by every thread, created on first use."""
+    global _s3_client
+    with _s3_client_lock:
+        if _s3_client is None:
+            import boto3
+            _s3_client = boto3.client('s3', endpoint_url=current_app.config['S3_ENDPOINT_URL'])
+        return _s3_client
+
+
+def parse_s3_path(s3_path):
+    """(bucket, prefix) for s3://bucket/prefix, or for a bare prefix in S3_BUCKET."""
+    if s3_path.startswith('s3://'):
+        bucket, _, prefix = s3_path[len('s3://'):].partition('/')
+    else:
+        bucket, prefix = current_app.config['S3_BUCKET'], s3_path.lstrip('/')
+    if not bucket:
+        raise ValueError(f"No bucket in {s3_path} and S3_BUCKET is not set.")
+    return bucket, prefix
+
+
+def key_hash(key):
+    return hashlib.sha1(key.encode('utf-8')).hexdigest()
+
+
+def iter_object_pages(client, bucket, prefix):
+    """Yield the images under a prefix one listing page at a time, as lists of (key, etag)."""
+    paginator = client.get_paginator('list_objects_v2')
+    pages = paginator.paginate(Bucket=bucket, Prefix=prefix, PaginationConfig={'PageSize': LIST_PAGE_SIZE})
+    for page in pages:
+        yield [
+            (item['Key'], item['ETag'].strip('"'))
+            for item in page.get('Contents', [])
+            if is_image_name(item['Key'])
+        ]
+
+
+def run_inspections(run_id, *columns):
+    """
+    Query a run's inspections, or the given columns of them, in the order they
+    were listed. A run with a manifest is read through it, which takes in the
+    inspections it carried forward; other runs by run_id.
+    """
+    query = db.session.query(*columns) if columns else Inspection.query
+    if db.session.query(RunObject.query.filter_by(run_id=run_id).exists()).scalar():
+        return query.join(RunObject, RunObject.inspection_id == Inspection.id).filter(
+            RunObject.run_id == run_id
+        ).order_by(RunObject.id)
+    return query.filter(Inspection.run_id == run_id).order_by(Inspection.id)
+
+
+def base_run_for(run):
+    """The latest earlier run of the same model on the same path that finished with a manifest, or None."""
+    return Run.query.filter(
+        Run.model_id == run.model_id,
+        Run.s3_path == run.s3_path,
+        Run.id < run.id,
+        Run.result.isnot(None),
+        db.session.query(RunObject.id).filter(RunObject.run_id == Run.id).exists()
+    ).order_by(Run.id.desc()).first()
+
+
+def diff_page(base_run_id, objects):
+    """
+    Split a listing page against the base run's manifest with one indexed lookup.
+    Returns ([(key, etag, inspection id, pass_fail)] for objects whose ETag is
+    unchanged, [(key, etag)] for objects that are new, changed or failed before).
+    """
+    if base_run_id is None or not objects:
+        return [], objects
+
+    listed = {key_hash(key): (key, etag) for key, etag in objects}
+    previous = db.session.query(
+        RunObject.key_hash, RunObject.key, RunObject.etag, RunObject.inspection_id, Inspection.pass_fail
+    ).join(Inspection, Inspection.id == RunObject.inspection_id).filter(
+        RunObject.run_id == base_run_id,
+        RunObject.key_hash.in_(list(listed))
+    )
+
+    unchanged = [
+        (key, etag, inspection_id, pass_fail)
+        for hashed, key, etag, inspection_id, pass_fail in previous
+        if listed[hashed] == (key, etag)
+    ]
+    carried = {key for key, _, _, _ in unchanged}
+    return unchanged, [(key, etag) for key, etag in objects if key not in carried]
+
+
+def _worker_model(model_id):
+    """The model loaded in this thread's session, so workers never share ORM objects."""
+    model = getattr(_worker, 'model', None)
+    if model is None or model.id != model_id:
+        model = _worker.model = Model.query.get(model_id)
+        list(model.regions)
+        list(model.templates)
+    return model
+
+
+def inspect_object(app, client, bucket, key, model_id, station=None):
+    """Download an object to a temporary file and inspect it."""
+    with app.app_context():
+        model = _worker_model(model_id)
+        suffix = os.path.splitext(key)[1]
+        with tempfile.NamedTemporaryFile(suffix=suffix) as image_file:
+            with metrics.timed('s3_download', model=model.id):
+                client.download_fileobj(bucket, key, image_file)
+                image_file.flush()
+            return inspect_image(image_file.name, model, station)
+
+
+def inspection_row(run_id, model_id, bucket, key, result):
+    """The Inspection insert mapping for an inspected object."""
+    return {
+        'run_id': run_id,
+        'model_id': model_id,
+        'image_url': f's3://{bucket}/{key}',
+        'pass_fail': result['pass_fail'],
+        'reason': result['reason'],
+        'template_id': result['template_id'],
+        'timings': json.dumps(result['timings']),
+        'duration_ms': result['duration_ms'],
+        'region_results': json.dumps(result['region_results']),
+    }
+
+
+def run_s3(model, run, incremental=False, workers=4, insert_size=100, station=None, progress=print):
+    """
+    Inspect the images under a run's S3 path and record each object's key and
+    ETag in the run's manifest. An incremental run diffs each listing page
+    against the manifest of the last finished run on the same path, inspects
+    only new or changed objects and carries the rest forward by pointing at the
+    earlier inspection. The run's counters are updated with each committed
+    batch. Returns counts.
+    """
+    bucket, prefix = parse_s3_path(run.s3_path)
+    client = get_s3_client()
+    app = current_app._get_current_object()
+    model_id, run_id = model.id, run.id  # read once; commits expire the instances
+    base_run = base_run_for(run) if incremental else None
+    base_run_id = base_run.id if base_run else None
+    if base_run:
+        progress(f"Run {run.id}: incremental from run {base_run.id}")
+
+    counts = {'listed': 0, 'inspected': 0, 'carried': 0, 'passed': 0, 'failed': 0, 'errors': 0}
+    inspections = []
+    objects = []
+    carried = {'passed': 0, 'failed': 0}  # carried forward since the last flush
+
+    def flush():
+        if inspections:
+            # return_defaults fills in the ids the manifest rows point at
+            db.session.bulk_insert_mappings(Inspection, [row for row, _ in inspections], return_defaults=True)
+            objects.extend(dict(manifest, inspection_id=row['id']) for row, manifest in inspections)
+            record_inspections([row for row, _ in inspections])
+            count_run_inspections([row for row, _ in inspections])
+        if objects:
+            db.session.bulk_insert_mappings(RunObject, objects)
+        add_run_counts(run_id, carried['passed'], carried['failed'], carried['passed'] + carried['failed'])
+        db.session.commit()
+        del inspections[:]
+        del objects[:]
+        carried.update(passed=0, failed=0)
+
+    def collect(futures):
+        for future in futures:
+            key, etag = pending.pop(future)
+            manifest = {'run_id': run_id, 'key_hash': key_hash(key), 'key': key, 'etag': etag}
+            try:
+                result = future.result()
+            except Exception as e:
+                counts['errors'] += 1
+                progress(f"{key}: {type(e).__name__}: {e}")
+                objects.append(dict(manifest, inspection_id=None))
+                continue
+
+            counts['inspected'] += 1
+            counts['passed' if result['pass_fail'] else 'failed'] += 1
+            inspections.append((inspection_row(run_id, model_id, bucket, key, result), manifest))
+        if len(inspections) + len(objects) >= insert_size:
+            flush()
+
+    pending = {}
+    try:
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            for page in iter_object_pages(client, bucket, prefix):
+                counts['listed'] += len(page)
+                unchanged, todo = diff_page(base_run_id, page)
+
+                for key, etag, inspection_id, pass_fail in unchanged:
+                    counts['carried'] += 1
+                    counts['passed' if pass_fail else 'failed'] += 1
+                    carried['passed' if pass_fail else 'failed'] += 1
+                    objects.append({
+                        'run_id': run_id, 'key_hash': key_hash(key), 'key': key, 'etag': etag,
+                        'inspection_id': inspection_id
+                    })
+                if len(objects) >= insert_size:
+                    flush()
+
+                for key, etag in todo:
+                    pending[executor.submit(inspect_object, app, client, bucket, key, model_id, station)] = (key, etag)
+                    # Bound the objects in flight so a huge prefix is not queued all at once
+                    while len(pending) >= workers * 2:
+                        collect(wait(pending, return_when=FIRST_COMPLETED).done)
+                progress(f"{counts['listed']} listed, {counts['inspected']} inspected, {counts['carried']} unchanged")
+            while pending:
+                collect(wait(pending, return_when=FIRST_COMPLETED).done)
+    finally:
+        # Keep what finished even if the run is interrupted
+        flush()
+
+    run.result = f"{counts['passed']}/{counts['passed'] + counts['failed']} PASS"
+    db.session.commit()
+    return counts
+
+
+def _run_in_background(app, model_id, run_id, incremental, station):
+    with app.app_context():
+        model = Model.query.get(model_id)
+        run = Run.query.get(run_id)
+        try:
+            run_s3(
+                model,
+                run,
+                incremental=incremental,
+                workers=app.config['BATCH_INSPECT_WORKERS'],
+                insert_size=app.config['BATCH_INSERT_SIZE'],
+                station=station
+            )
+        except Exception as e:
+            db.session.rollback()
+            print(f"Run {run_id} failed: {type(e).__name__}: {e}")
+            # A result ends the run's progress stream; keep the counts it reached
+            passed, failed = db.session.query(Run.passed, Run.failed).filter(Run.id == run_id).one()
+            Run.query.filter_by(id=run_id, result=None).update(
+                {'result': f"{passed}/{passed + failed} PASS, stopped ({type(e).__name__})"[:64]},
+                synchronize_session=False
+            )
+        finally:
+            Model.query.filter_by(id=model_id).update({'status': 'ready'}, synchronize_session=False)
+            db.session.commit()
+            db.session.remove()
+
+
+def submit_background(fn, *args):
+    """
+    Call fn(app, *args) on a background thread of this process and return its
+    future. At most BACKGROUND_RUNS of these go at a time and the rest wait
+    their turn.
+    """
+    global _run_executor
+    app = current_app._get_current_object()
+    with _run_executor_lock:
+        if _run_executor is None:
+            _run_executor = ThreadPoolExecutor(max_workers=app.config['BACKGROUND_RUNS'], thread_name_prefix='run')
+    return _run_executor.submit(fn, app, *args)
+
+
+def start_run_s3(model, run, incremental=False, station=None):
+    """
+    Start run_s3 for a run on a background thread of this process and return at
+    once; progress is followed through the run's counters.
+    """
+    return submit_background(_run_in_background, model.id, run.id, incremental, station)
@@ -0,0 +1,443 @@
+import os
+import socket
+import time
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from datetime import datetime, timedelta
+
+from flask import current_app
+
+from . import db
+from .events import add_run_counts, count_run_inspections
+from .models import Run, RunObject, RunShard, Inspection
+from .rollups import record_inspections
+from .s3_runs import (
+    base_run_for, diff_page, get_s3_client, inspect_object, inspection_row, iter_object_pages, key_hash, parse_s3_path,
+    submit_background
+)
+
+
+class LeaseLost(Exception):
+    """Another worker has taken over a shard this worker was inspecting."""
+
+
+def worker_name():
+    return f'{socket.gethostname()}:{os.getpid()}'
+
+
+def plan_run(run, incremental=False, shard_size=500, progress=print):
+    """
+    List a run's S3 path into its manifest and cut the objects that need
+    inspecting into shards of shard_size for worker nodes to claim. Unchanged
+    objects of an incremental run are carried forward here and belong to no
+    shard. Each shard becomes claimable once all of its objects are written, so
+    workers can start while a large prefix is still being listed. If listing
+    fails, the shards planned so far are opened and the error is raised; the run
+    then covers what was listed, and an incremental run picks up the rest.
+    Returns the number of shards.
+    """
+    bucket, prefix = parse_s3_path(run.s3_path)
+    run_id = run.id
+    base_run = base_run_for(run) if incremental else None
+    base_run_id = base_run.id if base_run else None
+    if base_run:
+        progress(f"Run {run_id}: incremental from run {base_run_id}")
+
+    shard_ids = []
+    shard_count = 0  # objects in the last shard
+    listed = carried = 0
+
+    try:
+        for page in iter_object_pages(get_s3_client(), bucket, prefix):
+            listed += len(page)
+            unchanged, todo = diff_page(base_run_id, page)
+            objects = [
+                {'run_id': run_id, 'key_hash': key_hash(key), 'key': key, 'etag': etag, 'inspection_id': inspection_id}
+                for key, etag, inspection_id, _ in unchanged
+            ]
+            carried += len(unchanged)
+            carried_passed = sum(1 for _, _, _, pass_fail in unchanged if pass_fail)
+            add_run_counts(run_id, carried_passed, len(unchanged) - carried_passed, len(unchanged))
+
+            full = []
+            for key, etag in todo:
+                if not shard_ids or shard_count >= shard_size:
+                    if shard_ids:
+                        full.append(shard_ids[-1])
+                    shard = RunShard(run_id=run_id, status='planning')
+                    db.session.add(shard)
+                    db.session.flush()
+                    shard_ids.append(shard.id)
+                    shard_count = 0
+                shard_count += 1
+                objects.append({'run_id': run_id, 'key_hash': key_hash(key), 'key': key, 'etag': etag, 'shard_id': shard_ids[-1]})
+
+            db.session.bulk_insert_mappings(RunObject, objects)
+            _open_shards(full, shard_size)
+            db.session.commit()
+            progress(f"{listed} listed, {carried} unchanged, {len(shard_ids)} shards")
+    except Exception:
+        # Hand what was listed before the failure to the workers, so the run
+        # finishes over it instead of waiting forever on a shard being planned
+        db.session.rollback()
+        _release_planning_shards(run_id)
+        finish_run_if_done(run_id)
+        raise
+
+    if shard_ids:
+        _open_shards(shard_ids[-1:], shard_count)
+    db.session.commit()
+
+    finish_run_if_done(run_id)
+    return len(shard_ids)
+
+
+def _plan_in_background(app, run_id, incremental, shard_size):
+    with app.app_context():
+        try:
+            plan_run(Run.query.get(run_id), incremental, shard_size)
+        except Exception as e:
+            # plan_run has already opened what it listed, so the run still finishes
+            print(f"Planning run {run_id} failed: {type(e).__name__}: {e}")
+        finally:
+            db.session.remove()
+
+
+def start_plan_run(run, incremental=False, shard_size=500):
+    """
+    Plan a run on a background thread of this process and return at once, so
+    listing a large prefix does not hold up a web request. Workers can claim
+    each shard as soon as it is written.
+    """
+    return submit_background(_plan_in_background, run.id, incremental, shard_size)
+
+
+def _release_planning_shards(run_id):
+    """Open a run's shards still being planned with the objects committed to them so far."""
+    counts = db.session.query(RunObject.shard_id, db.func.count(RunObject.id)).join(
+        RunShard, RunShard.id == RunObject.shard_id
+    ).filter(RunShard.run_id == run_id, RunShard.status == 'planning').group_by(RunObject.shard_id).all()
+    for shard_id, object_count in counts:
+        _open_shards([shard_id], object_count)
+    db.session.commit()
+
+
+def _open_shards(shard_ids, object_count):
+    if shard_ids:
+        RunShard.query.filter(RunShard.id.in_(shard_ids)).update(
+            {'status': 'pending', 'object_count': object_count}, synchronize_session=False
+        )
+
+
+def _claimable(now):
+    return db.or_(
+        RunShard.status == 'pending',
+        db.and_(RunShard.status == 'leased', RunShard.lease_expires_at < now)
+    )
+
+
+def claim_shard(worker, lease_seconds, run_id=None):
+    """
+    Lease the next pending shard, or one whose lease has run out, to a worker.
+    The lease is taken with a conditional UPDATE, so when two workers race for
+    the same shard exactly one of them gets it. Returns the shard id or None.
+    """
+    while True:
+        now = datetime.utcnow()
+        candidates = db.session.query(RunShard.id).filter(_claimable(now))
+        if run_id is not None:
+            candidates = candidates.filter(RunShard.run_id == run_id)
+        candidate = candidates.order_by(RunShard.id).first()
+        if candidate is None:
+            db.session.commit()
+            return None
+
+        claimed = RunShard.query.filter(RunShard.id == candidate.id, _claimable(now)).update({
+            'status': 'leased',
+            'worker': worker,
+            'lease_expires_at': now + timedelta(seconds=lease_seconds),
+            'attempts': RunShard.attempts + 1,
+        }, synchronize_session=False)
+        db.session.commit()
+        if claimed:
+            return candidate.id
+
+
+def steal_shard(worker, lease_seconds, run_id=None, min_objects=20):
+    """
+    Split the uninspected half off the live shard with the most work left and
+    lease it to an idle worker as a new shard. The holder works through its
+    objects in id order, so the upper half is taken; the objects are moved with
+    a conditional UPDATE on their shard, and the holder drops them from its
+    queue at its next commit. Shards with fewer than twice min_objects left are
+    not split. Returns the new shard id or None.
+    """
+    now = datetime.utcnow()
+    remaining = RunShard.object_count - RunShard.inspected - RunShard.errors
+    victims = db.session.query(RunShard.id, RunShard.run_id).filter(
+        RunShard.status == 'leased', RunShard.lease_expires_at >= now, RunShard.worker != worker,
+        remaining >= 2 * min_objects
+    )
+    if run_id is not None:
+        victims = victims.filter(RunShard.run_id == run_id)
+    victim = victims.order_by(remaining.desc()).first()
+    if victim is None:
+        db.session.commit()
+        return None
+
+    todo = [object_id for object_id, in db.session.query(RunObject.id).filter(
+        RunObject.shard_id == victim.id, RunObject.inspection_id.is_(None)
+    ).order_by(RunObject.id)]
+    if len(todo) < 2 * min_objects:
+        db.session.commit()
+        return None
+
+    shard = RunShard(
+        run_id=victim.run_id, status='leased', worker=worker,
+        lease_expires_at=now + timedelta(seconds=lease_seconds), attempts=1
+    )
+    db.session.add(shard)
+    db.session.flush()
+    moved = RunObject.query.filter(
+        RunObject.shard_id == victim.id, RunObject.inspection_id.is_(None), RunObject.id >= todo[len(todo) // 2]
+    ).update({'shard_id': shard.id}, synchronize_session=False)
+    if not moved:
+        db.session.rollback()
+        return None
+    shard.object_count = moved
+    RunShard.query.filter_by(id=victim.id).update(
+        {'object_count': RunShard.object_count - moved}, synchronize_session=False
+    )
+    db.session.commit()
+    return shard.id
+
+
+def renew_lease(shard_id, worker, lease_seconds, **increments):
+    """
+    Extend a worker's lease on a shard, adding to the shard's counters in the
+    same statement. Raises LeaseLost if the lease has been taken over.
+    """
+    values = {name: getattr(RunShard, name) + value for name, value in increments.items()}
+    values['lease_expires_at'] = datetime.utcnow() + timedelta(seconds=lease_seconds)
+    renewed = RunShard.query.filter_by(id=shard_id, worker=worker, status='leased').update(
+        values, synchronize_session=False
+    )
+    if not renewed:
+        raise LeaseLost(shard_id)
+
+
+def write_inspections(rows):
+    """
+    Insert inspections given as (insert mapping, run object id) and point their
+    run objects at them. A run object that already has an inspection keeps it
+    and the new row is dropped, so an image inspected twice (by a worker whose
+    shard was taken over) is only recorded once per run. Returns the mappings
+    written.
+    """
+    # return_defaults fills in the ids the run objects point at
+    db.session.bulk_insert_mappings(Inspection, [row for row, _ in rows], return_defaults=True)
+    written, duplicates = [], []
+    for row, object_id in rows:
+        updated = RunObject.query.filter(RunObject.id == object_id, RunObject.inspection_id.is_(None)).update(
+            {'inspection_id': row['id']}, synchronize_session=False
+        )
+        (written if updated else duplicates).append(row)
+    if duplicates:
+        Inspection.query.filter(Inspection.id.in_([row['id'] for row in duplicates])).delete(synchronize_session=False)
+    record_inspections(written)
+    count_run_inspections(written)
+    return written
+
+
+def process_shard(shard_id, worker, workers, insert_size, lease_seconds, station=None, progress=print):
+    """
+    Inspect the objects of a leased shard that have no result yet, committing in
+    batches and renewing the lease with each one, then mark the shard done.
+    Objects an idle worker has split off the shard since are skipped. Raises
+    LeaseLost, with the current batch rolled back, if the lease is lost.
+    """
+    shard = RunShard.query.get(shard_id)
+    run = Run.query.get(shard.run_id)
+    run_id, model_id = run.id, run.model_id
+    bucket, _ = parse_s3_path(run.s3_path)
+    todo = db.session.query(RunObject.id, RunObject.key).filter(
+        RunObject.shard_id == shard_id, RunObject.inspection_id.is_(None)
+    ).order_by(RunObject.id).all()
+    mine = {object_id for object_id, _ in todo}
+    db.session.commit()
+
+    client = get_s3_client()
+    app = current_app._get_current_object()
+    rows = []
+    errors = [0]
+    renewed_at = [time.monotonic()]
+
+    def flush():
+        written = write_inspections(rows) if rows else []
+        passed = sum(1 for row in written if row['pass_fail'])
+        renew_lease(
+            shard_id, worker, lease_seconds,
+            inspected=len(written), passed=passed, failed=len(written) - passed, errors=errors[0]
+        )
+        db.session.commit()
+        del rows[:]
+        errors[0] = 0
+        renewed_at[0] = time.monotonic()
+        # Objects another worker has stolen are no longer this shard's
+        mine.intersection_update(object_id for object_id, in db.session.query(RunObject.id).filter(
+            RunObject.shard_id == shard_id, RunObject.inspection_id.is_(None)
+        ))
+        db.session.commit()
+
+    def collect(futures):
+        for future in futures:
+            object_id, key = pending.pop(future)
+            try:
+                result = future.result()
+            except Exception as e:
+                errors[0] += 1
+                progress(f"{key}: {type(e).__name__}: {e}")
+                continue
+            rows.append((inspection_row(run_id, model_id, bucket, key, result), object_id))
+        # Renew well before the lease runs out even when images are slow
+        if len(rows) >= insert_size or time.monotonic() - renewed_at[0] > lease_seconds / 3:
+            flush()
+
+    pending = {}
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        try:
+            for object_id, key in todo:
+                if object_id not in mine:
+                    continue
+                pending[executor.submit(inspect_object, app, client, bucket, key, model_id, station)] = (object_id, key)
+                while len(pending) >= workers * 2:
+                    collect(wait(pending, return_when=FIRST_COMPLETED).done)
+            while pending:
+                collect(wait(pending, return_when=FIRST_COMPLETED).done)
+            flush()
+        except LeaseLost:
+            db.session.rollback()
+            for future in pending:
+                future.cancel()
+            raise
+
+    complete_shard(shard_id, worker)
+    finish_run_if_done(run_id)
+
+
+def complete_shard(shard_id, worker):
+    """
+    Mark a leased shard done, recounting its results from its run objects so
+    work split between several holders of the lease is counted exactly once.
+    """
+    total, inspected, passed = db.session.query(
+        db.func.count(RunObject.id),
+        db.func.count(RunObject.inspection_id),
+        db.func.sum(db.case([(Inspection.pass_fail == True, 1)], else_=0))  # noqa: E712
+    ).outerjoin(Inspection, Inspection.id == RunObject.inspection_id).filter(RunObject.shard_id == shard_id).one()
+    passed = int(passed or 0)
+
+    completed = RunShard.query.filter_by(id=shard_id, worker=worker, status='leased').update({
+        'status': 'done',
+        'lease_expires_at': None,
+        'object_count': total,
+        'inspected': inspected,
+        'passed': passed,
+        'failed': inspected - passed,
+        'errors': total - inspected,
+    }, synchronize_session=False)
+    db.session.commit()
+    if not completed:
+        raise LeaseLost(shard_id)
+
+
+def run_counts(run_id):
+    """(total, passed) over the inspections in a run's manifest, carried forward ones included."""
+    total, passed = db.session.query(
+        db.func.count(Inspection.id),
+        db.func.sum(db.case([(Inspection.pass_fail == True, 1)], else_=0))  # noqa: E712
+    ).join(RunObject, RunObject.inspection_id == Inspection.id).filter(RunObject.run_id == run_id).one()
+    return total, int(passed or 0)
+
+
+def finish_run_if_done(run_id):
+    """Record a sharded run's result once every shard is done. Returns the result or None."""
+    remaining = RunShard.query.filter(RunShard.run_id == run_id, RunShard.status != 'done').count()
+    if remaining:
+        db.session.commit()
+        return None
+
+    total, passed = run_counts(run_id)
+    result = f"{passed}/{total} PASS"
+    # Whichever worker finishes last records it; a later recount changes nothing
+    Run.query.filter(Run.id == run_id, Run.result.is_(None)).update({'result': result}, synchronize_session=False)
+    db.session.commit()
+    return result
+
+
+def run_worker(worker=None, run_id=None, workers=4, insert_size=100, lease_seconds=300, poll_interval=5,
+               exit_when_idle=False, station=None, steal_min_objects=20, progress=print):
+    """
+    Claim and inspect shards until there are none left (with exit_when_idle)
+    or forever, polling for new runs. With nothing left to claim, a worker
+    steals half of the largest shard another worker is still inspecting. Any
+    number of these can run on any number of nodes against the same database.
+    Returns the number of shards completed.
+    """
+    worker = worker or worker_name()
+    completed = 0
+    while True:
+        shard_id = claim_shard(worker, lease_seconds, run_id)
+        if shard_id is None and steal_min_objects:
+            shard_id = steal_shard(worker, lease_seconds, run_id, steal_min_objects)
+            if shard_id is not None:
+                progress(f"{worker}: split shard {shard_id} off a busy worker")
+        if shard_id is None:
+            if exit_when_idle:
+                return completed
+            time.sleep(poll_interval)
+            continue
+
+        progress(f"{worker}: shard {shard_id}")
+        try:
+            process_shard(shard_id, worker, workers, insert_size, lease_seconds, station, progress)
+            completed += 1
+        except LeaseLost:
+            progress(f"{worker}: lost the lease on shard {shard_id}")
+
+
+def run_progress(run_id):
+    """
+    Progress of a sharded run aggregated across every worker: pass, fail and
+    carried-forward counts from the run's counters, the rest summed over its
+    shards, whose counters are updated with each committed batch. Neither
+    touches the inspection table, so it is cheap enough to poll.
+    """
+    passed, failed, carried = db.session.query(Run.passed, Run.failed, Run.carried).filter(Run.id == run_id).one()
+    progress = {
+        'shards': {'planning': 0, 'pending': 0, 'leased': 0, 'done': 0},
+        'objects': 0, 'inspected': 0, 'passed': passed, 'failed': failed, 'errors': 0, 'carried': carried,
+    }
+    totals = db.session.query(
+        RunShard.status,
+        db.func.count(RunShard.id),
+        db.func.sum(RunShard.object_count),
+        db.func.sum(RunShard.inspected),
+        db.func.sum(RunShard.errors)
+    ).filter(RunShard.run_id == run_id).group_by(RunShard.status)
+    for status, shards, objects, inspected, errors in totals:
+        progress['shards'][status] = shards
+        progress['objects'] += int(objects or 0)
+        progress['inspected'] += int(inspected or 0)
+        progress['errors'] += int(errors or 0)
+
+    progress['workers'] = sorted(
+        worker for worker, in db.session.query(RunShard.worker).filter(
+            RunShard.run_id == run_id, RunShard.status == 'leased', RunShard.lease_expires_at >= datetime.utcnow()
+        ).distinct()
+    )
+    return progress
+
+
+def has_shards(run_id):
+    return db.session.query(RunShard.query.filter_by(run_id=run_id).exists()).scalar()
+
@@ -0,0 +1,103 @@
+import hashlib
+import os
+import tempfile
+from collections import Counter
+
+from flask import current_app
+from flask_uploads import UploadNotAllowed, extension, lowercase_ext
+from sqlalchemy.exc import IntegrityError
+from werkzeug.utils import secure_filename
+
+from . import db, images
+from .models import Blob
+
+CHUNK_SIZE = 1024 * 1024
+
+
+def save_upload(storage):
+    """
+    Stream an uploaded file into the content-addressed store and return its blob
+    filename (<sha256>.<ext>). The content is hashed while it is written, and an
+    upload identical to one already stored is discarded and the existing blob
+    reused. The caller takes a reference with acquire() or assign().
+    """
+    basename = lowercase_ext(secure_filename(storage.filename or ''))
+    if not basename or not images.file_allowed(storage, basename):
+        raise UploadNotAllowed()
+
+    dest = current_app.config['UPLOADED_IMAGES_DEST']
+    os.makedirs(dest, exist_ok=True)
+
+    digest = hashlib.sha256()
+    size = 0
+    # The temp file sits next to the blobs so the final rename is atomic
+    with tempfile.NamedTemporaryFile(dir=dest, prefix='.upload-', delete=False) as temp_file:
+        for chunk in iter(lambda: storage.stream.read(CHUNK_SIZE), b''):
+            digest.update(chunk)
+            temp_file.write(chunk)
+            size += len(chunk)
+
+    filename = f'{digest.hexdigest()}.{extension(basename)}'
+    blob_path = os.path.join(dest, filename)
+    if os.path.exists(blob_path):
+        os.remove(temp_file.name)
+        # Refresh the mtime so the storage GC's minimum age covers the new reference
+        os.utime(blob_path)
+    else:
+        os.replace(temp_file.name, blob_path)
+
+    if Blob.query.filter_by(filename=filename).first() is None:
+        try:
+            with db.session.begin_nested():
+                db.session.add(Blob(filename=filename, size=size, refcount=0))
+        except IntegrityError:
+            # A concurrent upload of the same bytes added the row first; its row
+            # is this blob's, and the caller's reference goes on it as usual
+            pass
+
+    return filename
+
+
+def upload_filename(image_url):
+    """The stored filename behind a /static/uploads/ URL, or None for anything else (e.g. S3 URLs)."""
+    if image_url and '/static/uploads/' in image_url:
+        return image_url.rsplit('/', 1)[-1]
+    return None
+
+
+def acquire(filename, count=1):
+    """Add references to a blob. Filenames from before the blob store are ignored."""
+    if filename:
+        Blob.query.filter_by(filename=filename).update(
+            {Blob.refcount: Blob.refcount + count}, synchronize_session=False
+        )
+
+
+def release(filename, count=1):
+    """Drop references to a blob. Unreferenced blobs are left for the storage GC."""
+    if filename:
+        Blob.query.filter_by(filename=filename).update(
+            {Blob.refcount: Blob.refcount - count}, synchronize_session=False
+        )
+
+
+def acquire_many(filenames):
+    """Add one reference per occurrence of each filename, with one UPDATE per distinct blob."""
+    for filename, count in Counter(filter(None, filenames)).items():
+        acquire(filename, count)
+
+
+def release_many(filenames):
+    """Drop one reference per occurrence of each filename, with one UPDATE per distinct blob."""
+    for filename, count in Counter(filter(None, filenames)).items():
+        release(filename, count)
+
+
+def assign(obj, attr, filename):
+    """Point a filename column at a blob, moving the reference from the blob it replaces."""
+    old_filename = getattr(obj, attr)
+    if old_filename == filename:
+        return
+    setattr(obj, attr, filename)
+    release(old_filename)
+    acquire(filename)
@@ -0,0 +1,176 @@
+import fcntl
+import logging
+import os
+import threading
+import time
+
+from flask import current_app
+
+from . import db
+from .models import Model, ModelTemplate, ModelRegion, ReferenceImage, Inspection, Blob
+from .storage import upload_filename
+
+logger = logging.getLogger(__name__)
+
+LOCK_NAME = '.gc.lock'
+DELETE_BATCH_SIZE = 500
+
+
+def _filename_columns(model_class):
+    """The columns of a model that hold filenames in UPLOADED_IMAGES_DEST."""
+    return [
+        column for column in model_class.__table__.columns
+        if column.name.endswith('filename') or column.name == 'model_pkl'
+    ]
+
+
+def referenced_files():
+    """
+    Every filename in UPLOADED_IMAGES_DEST that the database still points at:
+    primary and extra templates, reference images with their aligned copies and crops, region
+    .pkl files, inspection images and any blob that still has references.
+    """
+    referenced = set()
+    for model_class in (Model, ModelTemplate, ModelRegion, ReferenceImage):
+        for row in db.session.query(*_filename_columns(model_class)).yield_per(1000):
+            referenced.update(filter(None, row))
+
+    inspection_urls = db.session.query(Inspection.image_url).distinct().yield_per(1000)
+    referenced.update(filter(None, (upload_filename(image_url) for image_url, in inspection_urls)))
+
+    blobs = db.session.query(Blob.filename).filter(Blob.refcount > 0).yield_per(1000)
+    referenced.update(filename for filename, in blobs)
+    return referenced
+
+
+def _scan(directory):
+    """Yield (path, stat) for every file below a directory."""
+    for root, _, filenames in os.walk(directory):
+        for filename in filenames:
+            path = os.path.join(root, filename)
+            try:
+                yield path, os.stat(path)
+            except FileNotFoundError:
+                pass  # removed while we were scanning
+
+
+def _remove(path):
+    try:
+        os.remove(path)
+        return True
+    except FileNotFoundError:
+        return False
+
+
+def collect_garbage(min_age, dry_run=False):
+    """
+    Delete files in UPLOADED_IMAGES_DEST that nothing in the database references,
+    along with the rows of blobs that have no references left. Files younger than
+    min_age seconds are kept, since uploads, aligned images and crops are written
+    before the rows pointing at them are committed.
+    """
+    dest = current_app.config['UPLOADED_IMAGES_DEST']
+    referenced = referenced_files()
+    cutoff = time.time() - min_age
+    stats = {'scanned': 0, 'deleted': 0, 'freed_bytes': 0}
+    deleted_names = []
+
+    with os.scandir(dest) as entries:
+        for entry in entries:
+            if not entry.is_file() or entry.name == LOCK_NAME:
+                continue
+            stats['scanned'] += 1
+            # Leftover .upload-* temp files from interrupted uploads go too
+            if entry.name in referenced and not entry.name.startswith('.'):
+                continue
+            stat = entry.stat()
+            if stat.st_mtime > cutoff:
+                continue
+            if dry_run or _remove(entry.path):
+                stats['deleted'] += 1
+                stats['freed_bytes'] += stat.st_size
+                deleted_names.append(entry.name)
+
+    if not dry_run:
+        for start in range(0, len(deleted_names), DELETE_BATCH_SIZE):
+            Blob.query.filter(
+                Blob.filename.in_(deleted_names[start:start + DELETE_BATCH_SIZE]),
+                Blob.refcount <= 0
+            ).delete(synchronize_session=False)
+        db.session.commit()
+
+    return stats
+
+
+def enforce_quota(quota_bytes, dry_run=False):
+    """
+    Evict thumbnails, least recently used first, until uploads and thumbnails
+    together fit in quota_bytes. Thumbnails are the only derived files that can be
+    regenerated on demand, so if the referenced uploads alone are over the quota
+    this stops short and says so.
+    """
+    uploads_bytes = sum(stat.st_size for _, stat in _scan(current_app.config['UPLOADED_IMAGES_DEST']))
+    thumbnails = sorted(_scan(current_app.config['THUMBNAILS_DEST']), key=lambda item: item[1].st_mtime)
+    total_bytes = uploads_bytes + sum(stat.st_size for _, stat in thumbnails)
+    stats = {'used_bytes': total_bytes, 'evicted': 0, 'evicted_bytes': 0}
+
+    for path, stat in thumbnails:
+        if total_bytes <= quota_bytes:
+            break
+        if dry_run or _remove(path):
+            total_bytes -= stat.st_size
+            stats['evicted'] += 1
+            stats['evicted_bytes'] += stat.st_size
+
+    if total_bytes > quota_bytes:
+        logger.warning("Storage is %d bytes after eviction, over the %d byte quota", total_bytes, quota_bytes)
+    stats['used_bytes'] = total_bytes
+    return stats
+
+
+def run_storage_gc(min_age=None, quota_bytes=None, dry_run=False):
+    """
+    Run the GC and then the quota, holding a lock file in UPLOADED_IMAGES_DEST so
+    only one process sweeps at a time. Returns None if another process holds it.
+    """
+    config = current_app.config
+    min_age = config['STORAGE_GC_MIN_AGE'] if min_age is None else min_age
+    quota_bytes = config['STORAGE_QUOTA_BYTES'] if quota_bytes is None else quota_bytes
+
+    os.makedirs(config['UPLOADED_IMAGES_DEST'], exist_ok=True)
+    with open(os.path.join(config['UPLOADED_IMAGES_DEST'], LOCK_NAME), 'w') as lock_file:
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            return None
+        try:
+            stats = collect_garbage(min_age, dry_run)
+            if quota_bytes:
+                stats.update(enforce_quota(quota_bytes, dry_run))
+            return stats
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def run_gc_loop(app, interval, progress=print, **options):
+    """Run the storage GC every interval seconds, forever. A failed sweep is reported and retried next time."""
+    while True:
+        time.sleep(interval)
+        with app.app_context():
+            try:
+                stats = run_storage_gc(**options)
+                if stats:
+                    progress(f"Storage GC: {stats}")
+            except Exception as e:
+                progress(f"Storage GC failed: {e}")
+            finally:
+                db.session.remove()
+
+
+def start_gc_thread(app, progress=print):
+    """Run the storage GC every STORAGE_GC_INTERVAL seconds on a daemon thread."""
+    thread = threading.Thread(
+        target=run_gc_loop, args=(app, app.config['STORAGE_GC_INTERVAL'], progress), name='storage-gc', daemon=True
+    )
+    thread.start()
+    return thread
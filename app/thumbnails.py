@@ -0,0 +1,104 @@
+import hashlib
+import os
+import threading
+import time
+
+from flask import current_app, url_for
+
+from .lazy import lazy_import
+
+cv2 = lazy_import('cv2')
+
+# Thumbnail widths in pixels. Pages ask for a display width and get the
+# smallest of these that is at least as wide.
+THUMBNAIL_SIZES = (160, 320, 640)
+
+# A served thumbnail's mtime is bumped at most this often, in seconds. The
+# storage GC evicts thumbnails least recently used first by mtime.
+TOUCH_INTERVAL = 3600
+
+_hash_cache = {}  # path -> (mtime_ns, size, digest)
+_hash_lock = threading.Lock()
+
+
+def content_hash(path):
+    """SHA-1 of a file's contents, cached by path until the file's mtime or size changes."""
+    stat = os.stat(path)
+    with _hash_lock:
+        cached = _hash_cache.get(path)
+    if cached and cached[0] == stat.st_mtime_ns and cached[1] == stat.st_size:
+        return cached[2]
+
+    digest = hashlib.sha1()
+    with open(path, 'rb') as image_file:
+        for chunk in iter(lambda: image_file.read(1024 * 1024), b''):
+            digest.update(chunk)
+    digest = digest.hexdigest()
+
+    with _hash_lock:
+        _hash_cache[path] = (stat.st_mtime_ns, stat.st_size, digest)
+    return digest
+
+
+def get_thumbnail(source_path, size):
+    """
+    Return (thumbnail path, content hash) for an image at one of THUMBNAIL_SIZES,
+    generating it on first use. Thumbnails are stored by the source's content hash,
+    so identical images share one and a changed image never gets a stale one.
+    """
+    if size not in THUMBNAIL_SIZES:
+        raise ValueError(f"Unsupported thumbnail size: {size}")
+
+    digest = content_hash(source_path)
+    thumbnail_dir = os.path.join(current_app.config['THUMBNAILS_DEST'], digest[:2])
+    thumbnail_path = os.path.join(thumbnail_dir, f'{digest}_{size}.jpg')
+
+    try:
+        thumbnail_stat = os.stat(thumbnail_path)
+    except FileNotFoundError:
+        thumbnail_stat = None
+
+    if thumbnail_stat is not None:
+        if time.time() - thumbnail_stat.st_mtime > TOUCH_INTERVAL:
+            os.utime(thumbnail_path)
+    else:
+        image = cv2.imread(source_path)
+        if image is None:
+            raise ValueError(f"Could not load image: {source_path}")
+
+        # Only ever shrink, keeping the aspect ratio
+        height, width = image.shape[:2]
+        if width > size:
+            image = cv2.resize(image, (size, max(1, round(height * size / width))), interpolation=cv2.INTER_AREA)
+
+        os.makedirs(thumbnail_dir, exist_ok=True)
+        ok, encoded = cv2.imencode('.jpg', image, [cv2.IMWRITE_JPEG_QUALITY, 85])
+        if not ok:
+            raise ValueError(f"Could not encode thumbnail for: {source_path}")
+
+        # Write then rename so concurrent requests never serve a partial file
+        temp_path = f'{thumbnail_path}.{os.getpid()}.{threading.get_ident()}.tmp'
+        with open(temp_path, 'wb') as thumbnail_file:
+            thumbnail_file.write(encoded.tobytes())
+        os.replace(temp_path, thumbnail_path)
+
+    return thumbnail_path, digest
+
+
+def thumbnail_url(image, width):
+    """
+    URL of a thumbnail for an uploaded image, given its filename or its
+    /static/uploads/ URL, sized for the given display width. Images that are not
+    local uploads (e.g. S3 URLs) are returned unchanged.
+    """
+    if not image:
+        return image
+
+    uploads_prefix = url_for('static', filename='uploads/')
+    if image.startswith(uploads_prefix):
+        image = image[len(uploads_prefix):]
+    elif '/' in image or ':' in image:
+        return image
+
+    size = next((size for size in THUMBNAIL_SIZES if size >= width), THUMBNAIL_SIZES[-1])
+    return url_for('main.thumbnail', size=size, filename=image)
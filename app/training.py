@@ -0,0 +1,90 @@
+import os
+import traceback
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from .align import crop_regions
+from .bedrock import train_bedrock
+from .variants import model_variants
+
+
+def train_region(app, model, region, good_images, bad_images, output_dir):
+    """
+    Crop the aligned good and bad images for a single region and train it on Bedrock.
+    good_images and bad_images are lists of (ordinal, aligned filename). Runs inside
+    a worker thread, so nothing is written to the database here - the crop
+    filenames (by ordinal) and any error are returned for the caller to apply.
+    """
+    result = {
+        'good_crops': {},
+        'bad_crops': {},
+        'error': None,
+    }
+
+    with app.app_context():
+        try:
+            good_img_urls = []
+            bad_img_urls = []
+
+            # Align and crop good images
+            for ordinal, good_image_filename in good_images:
+                good_image_path = os.path.join(output_dir, good_image_filename)
+                cropped_good_image = crop_regions(good_image_path, model, region)
+                if cropped_good_image:
+                    result['good_crops'][ordinal] = os.path.basename(cropped_good_image)
+                    good_img_urls.append(cropped_good_image)
+
+            # Align and crop bad images
+            for ordinal, bad_image_filename in bad_images:
+                bad_image_path = os.path.join(output_dir, bad_image_filename)
+                cropped_bad_image = crop_regions(bad_image_path, model, region)
+                if cropped_bad_image:
+                    result['bad_crops'][ordinal] = os.path.basename(cropped_bad_image)
+                    bad_img_urls.append(cropped_bad_image)
+
+            # Run bedrock training - the fail then pass turns stay sequential
+            train_bedrock(good_img_urls, bad_img_urls, region)
+        except Exception as e:
+            traceback.print_exc()
+            result['error'] = f"{type(e).__name__}: {e}"
+
+    return result
+
+
+def train_regions(app, model, regions, reference_set, output_dir, max_workers):
+    """
+    Train several regions concurrently with a bounded number of worker threads.
+    Each region is cropped through its own template with that template's good
+    images. Returns a dict of region id -> result dict from train_region.
+    """
+    results = {}
+    if not regions:
+        return results
+
+    variants = {variant.template_id: variant for variant in model_variants(model)}
+
+    # Plain (ordinal, filename) lists, so the workers never touch the session
+    good_images = {
+        template_id: [
+            (reference.ordinal, reference.aligned_filename)
+            for reference in reference_set.originals(template_id=template_id) if reference.aligned_filename
+        ]
+        for template_id in variants
+    }
+
+    with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(regions)))) as executor:
+        futures = {}
+        for region in regions:
+            bad_images = [
+                (reference.ordinal, reference.aligned_filename)
+                for reference in reference_set.originals(region.id) if reference.aligned_filename
+            ]
+            future = executor.submit(
+                train_region, app, variants[region.template_id], region,
+                good_images[region.template_id], bad_images, output_dir
+            )
+            futures[future] = region
+        for future in as_completed(futures):
+            region = futures[future]
+            results[region.id] = future.result()
+
+    return results
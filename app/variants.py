@@ -0,0 +1,108 @@
+import os
+import threading
+
+from flask import current_app
+
+from . import metrics
+from .lazy import lazy_import
+
+cv2 = lazy_import('cv2')
+np = lazy_import('numpy')
+
+# Global descriptor settings: a difference hash of the downscaled grayscale image
+# and a coarse hue/saturation histogram, cheap enough to compare against every
+# template before picking one to run SIFT against
+HASH_SIZE = 8
+HISTOGRAM_BINS = (8, 4)
+
+_descriptor_cache = {}  # template path -> (mtime_ns, descriptor)
+_descriptor_lock = threading.Lock()
+
+
+class ModelVariant:
+    """
+    A model seen through one of its templates: the template image and the regions
+    drawn on it. It has the attributes the alignment and inspection code reads
+    from a Model, so it can be passed wherever a model is expected.
+    """
+
+    def __init__(self, model, template=None):
+        self.model = model
+        self.template = template
+        self.id = model.id
+        self.template_id = template.id if template else None
+        self.name = template.name if template else 'Primary'
+        self.template_image_filename = template.image_filename if template else model.template_image_filename
+        self.regions = [region for region in model.regions if region.template_id == self.template_id]
+
+    def get_image_path(self, image_filename):
+        return self.model.get_image_path(image_filename)
+
+    def get_template_image_path(self):
+        return self.get_image_path(self.template_image_filename)
+
+
+def model_variants(model):
+    """The primary template followed by each extra template of a model."""
+    return [ModelVariant(model)] + [ModelVariant(model, template) for template in model.templates]
+
+
+def variant_for(model, template_id):
+    """The variant of a model for a template id, None meaning the primary template."""
+    return next((variant for variant in model_variants(model) if variant.template_id == template_id), None)
+
+
+def global_descriptor(image):
+    """(difference hash bits, normalised hue/saturation histogram) of a BGR image."""
+    gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+    small = cv2.resize(gray, (HASH_SIZE + 1, HASH_SIZE), interpolation=cv2.INTER_AREA)
+    bits = (small[:, 1:] > small[:, :-1]).ravel()
+
+    # The histogram only needs a thumbnail
+    thumbnail = cv2.resize(image, (64, 64), interpolation=cv2.INTER_AREA)
+    hsv = cv2.cvtColor(thumbnail, cv2.COLOR_BGR2HSV)
+    histogram = cv2.calcHist([hsv], [0, 1], None, list(HISTOGRAM_BINS), [0, 180, 0, 256])
+    cv2.normalize(histogram, histogram, 1.0, 0.0, cv2.NORM_L1)
+    return bits, histogram
+
+
+def template_descriptor(path):
+    """The global descriptor of a template image, cached until the file changes."""
+    mtime = os.stat(path).st_mtime_ns
+    with _descriptor_lock:
+        cached = _descriptor_cache.get(path)
+    if cached and cached[0] == mtime:
+        return cached[1]
+
+    image = cv2.imread(path)
+    if image is None:
+        raise ValueError(f"Could not load template: {path}")
+    descriptor = global_descriptor(image)
+    with _descriptor_lock:
+        _descriptor_cache[path] = (mtime, descriptor)
+    return descriptor
+
+
+def descriptor_distance(a, b):
+    """0 for identical descriptors; the hash and histogram each contribute up to 1."""
+    hash_distance = np.count_nonzero(a[0] != b[0]) / a[0].size
+    histogram_distance = 1.0 - cv2.compareHist(a[1], b[1], cv2.HISTCMP_INTERSECT)
+    return hash_distance + histogram_distance
+
+
+def shortlist_variants(input_image, variants, model_id=None):
+    """
+    Order a model's variants by how closely their template's global descriptor
+    matches the input image and keep the first VARIANT_SHORTLIST, so SIFT runs
+    against the likely templates only. A single variant is returned as is.
+    """
+    if len(variants) == 1:
+        return variants
+
+    with metrics.timed('variant_select', model=model_id):
+        descriptor = global_descriptor(input_image)
+        ranked = sorted(
+            variants,
+            key=lambda variant: descriptor_distance(descriptor, template_descriptor(variant.get_template_image_path()))
+        )
+    return ranked[:current_app.config['VARIANT_SHORTLIST']]
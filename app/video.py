@@ -0,0 +1,178 @@
+import json
+
+from . import metrics
+from .align import detect_features, estimate_homography
+from .inspection import inspect_aligned, UNALIGNED_REASON
+from .lazy import lazy_import
+from .variants import variant_for
+
+cv2 = lazy_import('cv2')
+np = lazy_import('numpy')
+
+# Optical-flow tracking settings for video inspection. Full SIFT alignment runs
+# on keyframes only; frames in between reuse the last homography composed with
+# the frame-to-frame motion of tracked corners.
+DEFAULT_TRACKING_PARAMS = dict(
+    max_corners=400,  # corners tracked between frames
+    quality_level=0.01,  # goodFeaturesToTrack corner quality
+    min_distance=8,  # minimum pixels between tracked corners
+    win_size=21,  # Lucas-Kanade search window in pixels
+    max_level=3,  # Lucas-Kanade pyramid levels
+    fb_threshold=1.0,  # forward-backward tracking error allowed, in pixels
+    min_points=40,  # re-anchor when fewer corners than this survive
+    min_confidence=0.6,  # re-anchor when a smaller share of corners fit the motion
+    keyframe_interval=60,  # re-anchor at least this often, in sampled frames
+    reprojection_threshold=3.0,  # RANSAC inlier distance for frame-to-frame motion
+)
+
+
+def iter_frames(source, sample_fps=None):
+    """
+    Yield (frame index, seconds, frame) from a video file or stream URL, keeping
+    about sample_fps frames per second. Skipped frames are grabbed but not
+    decoded. Streams that do not report a frame rate yield every frame with
+    seconds set to None.
+    """
+    capture = cv2.VideoCapture(source)
+    if not capture.isOpened():
+        raise ValueError(f"Could not open video: {source}")
+
+    video_fps = capture.get(cv2.CAP_PROP_FPS) or 0
+    step = max(1, round(video_fps / sample_fps)) if sample_fps and video_fps > 0 else 1
+
+    index = 0
+    try:
+        while True:
+            if index % step:
+                if not capture.grab():
+                    return
+            else:
+                ok, frame = capture.read()
+                if not ok:
+                    return
+                yield index, index / video_fps if video_fps > 0 else None, frame
+            index += 1
+    finally:
+        capture.release()
+
+
+class HomographyTracker:
+    """
+    Tracks the homography from each frame onto a template. Keyframes are aligned
+    with SIFT; between them corners are followed with pyramidal Lucas-Kanade and
+    the frame-to-frame homography is chained onto the last one. The tracker
+    re-anchors with SIFT when too few corners survive, too few fit the motion, or
+    keyframe_interval frames have passed, so drift never accumulates for long.
+    """
+
+    def __init__(self, gray_template, model_id=None, params=DEFAULT_TRACKING_PARAMS):
+        self.gray_template = gray_template
+        self.features = None  # the template's SIFT features, detected at the first keyframe
+        self.model_id = model_id
+        self.params = params
+        self.H = None
+        self.previous_gray = None
+        self.previous_points = None
+        self.since_keyframe = 0
+
+    def _detect(self, gray):
+        return cv2.goodFeaturesToTrack(
+            gray,
+            maxCorners=self.params['max_corners'],
+            qualityLevel=self.params['quality_level'],
+            minDistance=self.params['min_distance']
+        )
+
+    def _anchor(self, gray):
+        if self.features is None:
+            self.features = detect_features(self.gray_template)
+        self.H = estimate_homography(self.gray_template, gray, model_id=self.model_id, features=self.features)
+        self.previous_gray = gray
+        self.previous_points = self._detect(gray) if self.H is not None else None
+        self.since_keyframe = 0
+        return self.H, True, 1.0 if self.H is not None else 0.0
+
+    def _track(self, gray):
+        """Frame-to-frame homography (previous -> current) with its confidence, or (None, 0.0)."""
+        lk_params = dict(
+            winSize=(self.params['win_size'], self.params['win_size']),
+            maxLevel=self.params['max_level']
+        )
+        points, status, _ = cv2.calcOpticalFlowPyrLK(self.previous_gray, gray, self.previous_points, None, **lk_params)
+        back_points, back_status, _ = cv2.calcOpticalFlowPyrLK(gray, self.previous_gray, points, None, **lk_params)
+
+        # Keep corners that track forward and back to where they started
+        error = np.linalg.norm((self.previous_points - back_points).reshape(-1, 2), axis=1)
+        good = (status.ravel() == 1) & (back_status.ravel() == 1) & (error < self.params['fb_threshold'])
+        if good.sum() < self.params['min_points']:
+            return None, 0.0
+
+        F, mask = cv2.findHomography(
+            self.previous_points[good], points[good], cv2.RANSAC, self.params['reprojection_threshold']
+        )
+        if F is None:
+            return None, 0.0
+
+        inliers = mask.ravel() == 1
+        self.previous_points = points[good][inliers].reshape(-1, 1, 2)
+        return F, inliers.sum() / len(good)
+
+    def update(self, gray):
+        """Homography for the next frame, as (H or None, whether it was a keyframe, confidence)."""
+        if self.H is None or self.previous_points is None or self.since_keyframe >= self.params['keyframe_interval']:
+            return self._anchor(gray)
+
+        with metrics.timed('optical_flow', model=self.model_id):
+            F, confidence = self._track(gray)
+        if F is None or confidence < self.params['min_confidence']:
+            return self._anchor(gray)
+
+        # Current frame -> previous frame -> template
+        self.H = self.H @ np.linalg.inv(F)
+        self.previous_gray = gray
+        self.since_keyframe += 1
+        if len(self.previous_points) < 2 * self.params['min_points']:
+            self.previous_points = self._detect(gray)
+        return self.H, False, round(float(confidence), 4)
+
+
+def inspect_video(model, source, sample_fps=None, params=DEFAULT_TRACKING_PARAMS):
+    """
+    Inspect sampled frames of a video against the model's primary template and
+    the regions drawn on it. Yields one result dict per frame, like
+    inspect_image's with the frame index, time, whether it was a keyframe and
+    the tracking confidence added.
+    """
+    variant = variant_for(model, None)  # loads the regions once rather than per frame
+    template = cv2.imread(variant.get_template_image_path() or '')
+    if template is None:
+        raise ValueError("Template image could not be loaded.")
+
+    tracker = HomographyTracker(cv2.cvtColor(template, cv2.COLOR_BGR2GRAY), model.id, params)
+
+    for index, seconds, frame in iter_frames(source, sample_fps):
+        with metrics.collect() as timings:
+            H, keyframe, confidence = tracker.update(cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY))
+            if H is None:
+                pass_fail, reason, region_results = False, UNALIGNED_REASON, {}
+            else:
+                pass_fail, reason, region_results = inspect_aligned(frame, H, template, variant, source)
+
+        yield {
+            'frame': index,
+            'seconds': seconds,
+            'keyframe': keyframe,
+            'confidence': confidence,
+            'pass_fail': pass_fail,
+            'reason': reason,
+            'region_results': region_results,
+            'timings': json.loads(timings.as_json()),
+            'duration_ms': round(timings.total * 1000, 3),
+        }
+
+
+def frame_url(source, index, seconds):
+    """An image URL for a video frame: a media fragment for its time, or the frame index."""
+    if seconds is None:
+        return f'{source}#frame={index}'
+    return f'{source}#t={seconds:.3f}'
@@ -0,0 +1,158 @@
+import threading
+from collections import OrderedDict
+
+from flask import current_app
+
+from . import metrics
+from .align import compute_homography, warp_to_template
+from .lazy import lazy_import
+
+cv2 = lazy_import('cv2')
+np = lazy_import('numpy')
+
+warm_start_total = metrics.Counter(
+    'homography_warm_start_total',
+    'Homography lookups by outcome: hit (cached homography verified), miss '
+    '(verification failed, full alignment ran) or cold (nothing cached yet).',
+    labelnames=('model', 'result')
+)
+
+
+class HomographyCache:
+    """
+    The last good homography per (model, template, station) with the region
+    scores it produced, least recently used evicted first. Each process keeps
+    its own, since fixed cameras make the homography from one image a good first
+    guess for the next.
+    """
+
+    def __init__(self, maxsize=1024):
+        self.maxsize = maxsize
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """(H, baseline scores) for a key, or None."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+            return entry
+
+    def put(self, key, H, baseline):
+        with self._lock:
+            self._entries[key] = (H, baseline)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def discard(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+
+homography_cache = HomographyCache()
+
+_region_stats = {}  # (model id, template filename, region boxes) -> stats
+_region_stats_lock = threading.Lock()
+
+
+def _region_boxes(template, model):
+    """Ordered region boxes, or the whole template for a model without regions."""
+    boxes = []
+    for region in model.regions:
+        x1, x2 = sorted((region.x1, region.x2))
+        y1, y2 = sorted((region.y1, region.y2))
+        boxes.append((x1, y1, x2, y2))
+    if not boxes:
+        height, width = template.shape[:2]
+        boxes.append((0, 0, width, height))
+    return tuple(boxes)
+
+
+def template_region_stats(template, model):
+    """
+    Zero-mean grayscale template crops and their norms for each region, computed
+    once per template and region layout so verification only touches the input.
+    """
+    boxes = _region_boxes(template, model)
+    key = (model.id, model.template_image_filename, boxes)
+    with _region_stats_lock:
+        stats = _region_stats.get(key)
+    if stats is not None:
+        return stats
+
+    gray = cv2.cvtColor(template, cv2.COLOR_BGR2GRAY).astype(np.float32)
+    stats = []
+    for x1, y1, x2, y2 in boxes:
+        crop = gray[y1:y2, x1:x2]
+        centred = crop - crop.mean() if crop.size else crop
+        stats.append(((x1, y1, x2, y2), centred, float(np.sqrt((centred * centred).sum()))))
+
+    with _region_stats_lock:
+        _region_stats[key] = stats
+    return stats
+
+
+def region_ncc(aligned_image, stats):
+    """
+    Normalised cross-correlation of each aligned region against the template at
+    zero offset, the same score TM_CCOEFF_NORMED gives for equal-sized crops.
+    """
+    gray = cv2.cvtColor(aligned_image, cv2.COLOR_BGR2GRAY).astype(np.float32)
+    scores = []
+    for (x1, y1, x2, y2), template_crop, template_norm in stats:
+        crop = gray[y1:y2, x1:x2]
+        if crop.size == 0 or crop.shape != template_crop.shape:
+            scores.append(0.0)
+            continue
+        centred = crop - crop.mean()
+        norm = float(np.sqrt((centred * centred).sum())) * template_norm
+        scores.append(float((centred * template_crop).sum() / norm) if norm > 0 else 0.0)
+    return scores
+
+
+def align_with_warm_start(template, input_image, model, station=None):
+    """
+    Align an input image onto the model's template, trying the station's last
+    homography before full SIFT/FLANN/RANSAC. The cached homography is kept when
+    the median region's correlation with the template is within
+    WARM_START_TOLERANCE of what it scored when the homography was cached, so
+    one defective region does not force a realignment but a moved camera does.
+    Images without a station, or with WARM_START off, always take the full path.
+    Returns (H, aligned image, region scores); scores are None when the full path
+    ran, and everything is None when the image could not be aligned.
+    """
+    # Images from unknown cameras would all share one slot and evict each other
+    if station is None or not current_app.config['WARM_START']:
+        H = compute_homography(template, input_image, model)
+        if H is None:
+            return None, None, None
+        return H, warp_to_template(input_image, H, template, model), None
+
+    key = (model.id, model.template_image_filename, station)
+    entry = homography_cache.get(key)
+    stats = template_region_stats(template, model)
+
+    if entry is not None:
+        H, baseline = entry
+        aligned_image = warp_to_template(input_image, H, template, model)
+        with metrics.timed('warm_start_verify', model=model.id):
+            scores = region_ncc(aligned_image, stats)
+            drops = [expected - score for score, expected in zip(scores, baseline)]
+        if float(np.median(drops)) <= current_app.config['WARM_START_TOLERANCE']:
+            warm_start_total.inc(model=model.id, result='hit')
+            # Without regions the only score is the whole-image check
+            return H, aligned_image, scores if model.regions else []
+        warm_start_total.inc(model=model.id, result='miss')
+    else:
+        warm_start_total.inc(model=model.id, result='cold')
+
+    H = compute_homography(template, input_image, model)
+    if H is None:
+        homography_cache.discard(key)
+        return None, None, None
+
+    aligned_image = warp_to_template(input_image, H, template, model)
+    homography_cache.put(key, H, region_ncc(aligned_image, stats))
+    return H, aligned_image, None
@@ -0,0 +1,242 @@
+"""
+Alignment accuracy and speed benchmark. Test images are made by warping
+synthetic templates with known random homographies, then degrading them with
+blur, noise and lighting changes. Every alignment configuration is run over
+the same cases, and the report gives corner reprojection error, failure rate,
+latency and peak memory.
+
+    python -m benchmarks.align_bench --cases 40 --configs default,fast,loose_ratio
+    python -m benchmarks.align_bench --config "mine:nfeatures=8000,checks=100"
+"""
+import argparse
+import json
+import math
+import os
+import resource
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from multiprocessing import get_context
+
+import cv2
+import numpy as np
+
+from app.align import DEFAULT_ALIGN_PARAMS, estimate_homography
+from loadtest.synthetic import synthetic_image
+
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'results')
+
+# Named configurations, each a set of overrides on the production settings
+CONFIGS = {
+    'default': {},
+    'fast': dict(nfeatures=5000, checks=50),
+    'balanced': dict(nfeatures=15000, checks=150),
+    'loose_ratio': dict(ratio=0.8),
+    'strict_ratio': dict(ratio=0.6),
+    'tight_ransac': dict(reprojection_threshold=3.0),
+    'loose_ransac': dict(reprojection_threshold=8.0),
+}
+
+# Degradations applied to the warped template, cycled over the cases
+CONDITIONS = ['clean', 'blur', 'noise', 'lighting', 'combined']
+
+# Cases whose mean corner error is above this many pixels count as failures
+FAILURE_THRESHOLD_PX = 10.0
+
+
+def random_homography(rng, width, height, max_shift):
+    """A homography moving each template corner by up to max_shift of the image size."""
+    corners = np.float32([[0, 0], [width, 0], [width, height], [0, height]])
+    offsets = rng.uniform(-max_shift, max_shift, (4, 2)) * np.float32([width, height])
+    return cv2.getPerspectiveTransform(corners, np.float32(corners + offsets))
+
+
+def degrade(image, condition, rng):
+    """Apply the named degradation to an image."""
+    if condition in ('blur', 'combined'):
+        sigma = rng.uniform(1.0, 3.0)
+        image = cv2.GaussianBlur(image, (0, 0), sigma)
+    if condition in ('lighting', 'combined'):
+        gain = rng.uniform(0.6, 1.4)
+        bias = rng.uniform(-40, 40)
+        gamma = rng.uniform(0.7, 1.4)
+        lut = np.clip(255.0 * (np.arange(256) / 255.0) ** gamma * gain + bias, 0, 255).astype(np.uint8)
+        image = cv2.LUT(image, lut)
+    if condition in ('noise', 'combined'):
+        noise = rng.normal(0, rng.uniform(5, 20), image.shape)
+        image = np.clip(image.astype(np.float32) + noise, 0, 255).astype(np.uint8)
+    return image
+
+
+def make_cases(count, seed, width, height, max_shift):
+    """
+    Generate (condition, template, test image, true homography) tuples. The true
+    homography maps template coordinates to test image coordinates.
+    """
+    rng = np.random.default_rng(seed)
+    templates = [
+        cv2.cvtColor(synthetic_image(seed=seed + i, width=width, height=height), cv2.COLOR_BGR2GRAY)
+        for i in range(3)
+    ]
+    cases = []
+    for i in range(count):
+        template = templates[i % len(templates)]
+        condition = CONDITIONS[i % len(CONDITIONS)]
+        H_true = random_homography(rng, width, height, max_shift)
+        warped = cv2.warpPerspective(template, H_true, (width, height), borderMode=cv2.BORDER_REFLECT)
+        cases.append((condition, template, degrade(warped, condition, rng), H_true))
+    return cases
+
+
+def corner_error(H_est, H_true, width, height):
+    """
+    Mean distance in pixels between the template corners and the corners after a
+    round trip through the true homography and the estimated inverse one.
+    """
+    corners = np.float32([[0, 0], [width, 0], [width, height], [0, height]]).reshape(-1, 1, 2)
+    in_test = cv2.perspectiveTransform(corners, H_true)
+    recovered = cv2.perspectiveTransform(in_test, H_est)
+    return float(np.linalg.norm(recovered - corners, axis=2).mean())
+
+
+def percentile(values, pct):
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[max(1, math.ceil(pct / 100.0 * len(ordered))) - 1]
+
+
+def summarise(samples):
+    errors = [s['error_px'] for s in samples if s['error_px'] is not None and not s['failed']]
+    latencies = [s['latency_ms'] for s in samples]
+    failures = sum(1 for s in samples if s['failed'])
+    return {
+        'cases': len(samples),
+        'failures': failures,
+        'failure_rate': round(failures / len(samples), 4) if samples else None,
+        'error_mean_px': round(float(np.mean(errors)), 3) if errors else None,
+        'error_p95_px': round(percentile(errors, 95), 3) if errors else None,
+        'latency_mean_ms': round(float(np.mean(latencies)), 2) if latencies else None,
+        'latency_p50_ms': round(percentile(latencies, 50), 2) if latencies else None,
+        'latency_p95_ms': round(percentile(latencies, 95), 2) if latencies else None,
+    }
+
+
+def run_config(name, overrides, args):
+    """Run one configuration over every case. Runs in a fresh process so peak RSS is per config."""
+    params = dict(DEFAULT_ALIGN_PARAMS, **overrides)
+    cases = make_cases(args['cases'], args['seed'], args['width'], args['height'], args['max_shift'])
+    # Memory is reported as growth over the high-water mark after generating the cases
+    baseline_rss_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    samples = []
+    for condition, template, test_image, H_true in cases:
+        start = time.perf_counter()
+        H_est = estimate_homography(template, test_image, params)
+        latency_ms = (time.perf_counter() - start) * 1000
+
+        error = None if H_est is None else corner_error(H_est, H_true, args['width'], args['height'])
+        samples.append({
+            'condition': condition,
+            'latency_ms': latency_ms,
+            'error_px': error,
+            'failed': error is None or error > FAILURE_THRESHOLD_PX,
+        })
+
+    peak_rss_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return {
+        'name': name,
+        'params': params,
+        # ru_maxrss is kilobytes on Linux and bytes on macOS
+        'peak_rss_mb': round(peak_rss_kb / (1024.0 * 1024.0 if sys.platform == 'darwin' else 1024.0), 1),
+        'rss_growth_mb': round((peak_rss_kb - baseline_rss_kb) / (1024.0 * 1024.0 if sys.platform == 'darwin' else 1024.0), 1),
+        'overall': summarise(samples),
+        'by_condition': {
+            condition: summarise([s for s in samples if s['condition'] == condition])
+            for condition in CONDITIONS
+        },
+    }
+
+
+def parse_config(text):
+    """Parse 'name:key=value,key=value' into (name, overrides)."""
+    name, _, assignments = text.partition(':')
+    overrides = {}
+    for assignment in filter(None, assignments.split(',')):
+        key, _, value = assignment.partition('=')
+        key = key.strip()
+        if key not in DEFAULT_ALIGN_PARAMS:
+            raise SystemExit(f"Unknown alignment parameter: {key}")
+        overrides[key] = type(DEFAULT_ALIGN_PARAMS[key])(value)
+    return name.strip(), overrides
+
+
+def print_report(results):
+    print(f"{'config':<14} {'fail %':>7} {'err px':>8} {'p95 px':>8} {'mean ms':>9} {'p95 ms':>9} {'+rss MB':>8}")
+    for result in results:
+        overall = result['overall']
+        print(
+            f"{result['name']:<14} {overall['failure_rate'] * 100:>7.1f} "
+            f"{overall['error_mean_px'] if overall['error_mean_px'] is not None else '-':>8} "
+            f"{overall['error_p95_px'] if overall['error_p95_px'] is not None else '-':>8} "
+            f"{overall['latency_mean_ms']:>9} {overall['latency_p95_ms']:>9} {result['rss_growth_mb']:>8}"
+        )
+    print()
+    print(f"{'config':<14} " + ' '.join(f"{condition + ' fail %':>16}" for condition in CONDITIONS))
+    for result in results:
+        rates = [result['by_condition'][condition]['failure_rate'] for condition in CONDITIONS]
+        print(f"{result['name']:<14} " + ' '.join(f"{(rate or 0) * 100:>16.1f}" for rate in rates))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--configs', default=','.join(CONFIGS), help="Comma separated names from CONFIGS")
+    parser.add_argument('--config', action='append', default=[], help="Extra config as name:key=value,...")
+    parser.add_argument('--cases', type=int, default=25)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--width', type=int, default=1280)
+    parser.add_argument('--height', type=int, default=960)
+    parser.add_argument('--max-shift', type=float, default=0.08, help="Max corner shift as a fraction of size")
+    parser.add_argument('--label', default=datetime.utcnow().strftime('%Y%m%d-%H%M%S'))
+    parser.add_argument('--output', help="Result file, defaults to benchmarks/results/align-<label>.json")
+    args = parser.parse_args()
+
+    configs = []
+    for name in filter(None, args.configs.split(',')):
+        if name not in CONFIGS:
+            raise SystemExit(f"Unknown config: {name}")
+        configs.append((name, CONFIGS[name]))
+    configs.extend(parse_config(text) for text in args.config)
+
+    case_args = dict(
+        cases=args.cases,
+        seed=args.seed,
+        width=args.width,
+        height=args.height,
+        max_shift=args.max_shift
+    )
+
+    results = []
+    for name, overrides in configs:
+        print(f"Running {name}...", file=sys.stderr)
+        with ProcessPoolExecutor(max_workers=1, mp_context=get_context('spawn')) as executor:
+            results.append(executor.submit(run_config, name, overrides, case_args).result())
+
+    print_report(results)
+
+    os.makedirs(RESULTS_DIR, exist_ok=True)
+    output_path = args.output or os.path.join(RESULTS_DIR, f'align-{args.label}.json')
+    with open(output_path, 'w') as output_file:
+        json.dump({
+            'label': args.label,
+            'created_at': datetime.utcnow().isoformat(),
+            'cases': case_args,
+            'failure_threshold_px': FAILURE_THRESHOLD_PX,
+            'results': results,
+        }, output_file, indent=2)
+    print(f"Results saved to {output_path}")
+
+
+if __name__ == '__main__':
+    main()
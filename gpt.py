@@ -1,53 +1,243 @@
+"""
+Dump the source tree into one text file (code.txt by default) to paste into a
+chat model, each file preceded by a "File: <path>" line.
+
+Files are streamed to the output one chunk at a time, so the dump takes time
+linear in the size of the tree and memory that does not grow with it. Paths
+matched by .gitignore files (at the root and in subdirectories), by
+--exclude patterns (same syntax) or by DEFAULT_EXCLUDES are left out, as are
+hidden directories, binary files, files over --max-file-bytes and anything past
+--max-total-bytes. Each file's token estimate is printed as it is written.
+
+    python gpt.py [directory] [-o code.txt] [--exclude 'loadtest/results/']
+"""
+import argparse
 import os
+import re
+
+# Left out even when no .gitignore mentions them
+DEFAULT_EXCLUDES = ['app/static/uploads/', 'code.txt', 'requests.jsonl']
+
+MAX_FILE_BYTES = 256 * 1024
+MAX_TOTAL_BYTES = 8 * 1024 * 1024
+
+SNIFF_BYTES = 8192
+CHUNK_CHARS = 64 * 1024
+CHARS_PER_TOKEN = 4  # rough average for code with English comments
+
+
+def translate_pattern(pattern):
+    """A regex for one gitignore glob, matched against a /-separated path."""
+    parts = []
+    i = 0
+    while i < len(pattern):
+        if pattern.startswith('**/', i):
+            parts.append('(?:.*/)?')
+            i += 3
+        elif pattern.startswith('**', i):
+            parts.append('.*')
+            i += 2
+        elif pattern[i] == '*':
+            parts.append('[^/]*')
+            i += 1
+        elif pattern[i] == '?':
+            parts.append('[^/]')
+            i += 1
+        elif pattern[i] == '[' and ']' in pattern[i + 2:]:
+            end = pattern.index(']', i + 2)
+            body = pattern[i + 1:end]
+            if body.startswith('!'):
+                body = '^' + body[1:]
+            parts.append('[' + body.replace('\\', '\\\\') + ']')
+            i = end + 1
+        elif pattern[i] == '\\' and i + 1 < len(pattern):
+            parts.append(re.escape(pattern[i + 1]))
+            i += 2
+        else:
+            parts.append(re.escape(pattern[i]))
+            i += 1
+    return re.compile(''.join(parts) + r'\Z')
+
+
+class IgnoreRule:
+    """One line of a .gitignore, applying to paths under the directory it was read from."""
 
-def concatenate_files_in_directory(directory_path):
-    giant_string = ""
+    def __init__(self, line, base=''):
+        self.base = base
+        self.negated = line.startswith('!')
+        if self.negated:
+            line = line[1:]
+        self.directory_only = line.endswith('/')
+        line = line.rstrip('/')
+        # A pattern with a slash other than at its end is relative to the
+        # .gitignore's directory; otherwise it matches a name at any depth
+        self.anchored = '/' in line
+        self.regex = translate_pattern(line.lstrip('/'))
 
-    # Traverse the directory and its subdirectories
-    for root, dirs, files in os.walk(directory_path):
-        # Skip directories that start with a dot (.)
-        if any(part.startswith('.') for part in root.split(os.sep)):
-            print(f"Skipping directory: {root}")
+    def matches(self, path, is_dir):
+        """Whether the rule matches a path relative to the dumped directory."""
+        if self.directory_only and not is_dir:
+            return False
+        if self.base:
+            if not path.startswith(self.base + '/'):
+                return False
+            path = path[len(self.base) + 1:]
+        if not self.anchored:
+            path = path.rsplit('/', 1)[-1]
+        return bool(self.regex.match(path))
+
+
+def parse_ignore_lines(lines, base=''):
+    rules = []
+    for line in lines:
+        line = line.rstrip('\n')
+        if line.endswith(' ') and not line.endswith('\\ '):
+            line = line.rstrip(' ')
+        if not line or line.startswith('#'):
             continue
+        if line.startswith('\\#') or line.startswith('\\!'):
+            line = line[1:]
+        rules.append(IgnoreRule(line, base))
+    return rules
 
-        for file_name in files:
-            # Skip image files
-            if file_name.lower().endswith(('.jpg', '.jpeg', '.png', '.gif', '.bmp', '.tiff')):
-                print(f"Skipping image file: {file_name}")
-                continue
 
-            file_path = os.path.join(root, file_name)
-            # Prepend the directory structure to the file name in the string
-            relative_path = os.path.relpath(file_path, directory_path)
-            print(f"Processing file: {relative_path}")
-            giant_string += f"File: {relative_path}\n"
+def read_gitignore(directory, base):
+    path = os.path.join(directory, '.gitignore')
+    if not os.path.isfile(path):
+        return []
+    with open(path, encoding='utf-8', errors='replace') as ignore_file:
+        return parse_ignore_lines(ignore_file, base)
+
+
+def is_ignored(rules, path, is_dir):
+    """The last matching rule decides, as in git; a negated one re-includes the path."""
+    ignored = False
+    for rule in rules:
+        if rule.matches(path, is_dir):
+            ignored = not rule.negated
+    return ignored
+
+
+def is_binary(path):
+    """Sniff the start of a file: a NUL byte or bytes that are not UTF-8 mean binary."""
+    with open(path, 'rb') as sniff_file:
+        head = sniff_file.read(SNIFF_BYTES)
+    if b'\0' in head:
+        return True
+    try:
+        head.decode('utf-8')
+    except UnicodeDecodeError as e:
+        # A multi-byte character cut off by the sniff window is still text
+        return e.start < len(head) - 3
+    return False
+
+
+def iter_files(root, rules, use_gitignore=True):
+    """
+    Yield (relative path, absolute path) of every file to dump, in sorted order.
+    Each directory's .gitignore is read when the walk reaches it and applies to
+    everything beneath; ignored and hidden directories are not entered.
+    """
+    rules_by_dir = {os.path.normpath(root): rules}
+    for directory, dirs, files in os.walk(root):
+        directory = os.path.normpath(directory)
+        rules = rules_by_dir.pop(directory)
+        relative_dir = os.path.relpath(directory, root).replace(os.sep, '/')
+        relative_dir = '' if relative_dir == '.' else relative_dir
+        if use_gitignore:
+            rules = rules + read_gitignore(directory, relative_dir)
+
+        def relative(name):
+            return f'{relative_dir}/{name}' if relative_dir else name
+
+        dirs[:] = sorted(
+            name for name in dirs
+            if not name.startswith('.') and not is_ignored(rules, relative(name), True)
+        )
+        for name in dirs:
+            rules_by_dir[os.path.normpath(os.path.join(directory, name))] = rules
+        for name in sorted(files):
+            if not is_ignored(rules, relative(name), False):
+                yield relative(name), os.path.join(directory, name)
+
+
+def copy_file(path, output):
+    """Stream a text file into the output. Returns the number of characters written."""
+    chars = 0
+    with open(path, encoding='utf-8', errors='replace') as source:
+        while True:
+            chunk = source.read(CHUNK_CHARS)
+            if not chunk:
+                break
+            output.write(chunk)
+            chars += len(chunk)
+    return chars
+
+
+def dump(root, output_path, excludes=(), max_file_bytes=MAX_FILE_BYTES, max_total_bytes=MAX_TOTAL_BYTES,
+         use_gitignore=True, progress=print):
+    """
+    Write every dumpable file under root to output_path. Returns counts of the
+    files written and skipped and the estimated tokens.
+    """
+    rules = parse_ignore_lines(list(DEFAULT_EXCLUDES) + list(excludes))
+    output_real_path = os.path.realpath(output_path)
+    counts = {'files': 0, 'binary': 0, 'too_large': 0, 'unreadable': 0, 'bytes': 0, 'tokens': 0}
+
+    with open(output_path, 'w', encoding='utf-8') as output:
+        for relative_path, path in iter_files(root, rules, use_gitignore):
+            if os.path.realpath(path) == output_real_path:
+                continue
             try:
-                # Append file contents to the giant string
-                with open(file_path, 'r', encoding='utf-8') as file:
-                    contents = file.read()
-                    giant_string += contents + "\n\n"  # Add an extra newline for separation
-            except Exception as e:
-                # Handle exceptions for reading files
-                print(f"Could not read file {file_path}: {e}")
-    return giant_string
-
-# Replace with the path of your directory
-directory_path = "."
-
-# Delete code.txt if it exists
-output_file_path = "code.txt"
-if os.path.exists(output_file_path):
-    os.remove(output_file_path)
-    print(f"{output_file_path} deleted.")
-
-# Get the concatenated result string
-result_string = concatenate_files_in_directory(directory_path)
-
-# Save the result to a file named "code.txt"
-if result_string.strip():  # Check if the string is not empty
-    with open(output_file_path, "w", encoding="utf-8") as output_file:
-        output_file.write(result_string)
-    print("Giant string saved to code.txt")
-else:
-    print("No files were processed, code.txt was not written.")
+                size = os.path.getsize(path)
+                if size > max_file_bytes:
+                    counts['too_large'] += 1
+                    progress(f"Skipping {relative_path}: {size} bytes is over the {max_file_bytes} byte limit")
+                    continue
+                # Binaries are never written, so they must not end the dump
+                if is_binary(path):
+                    counts['binary'] += 1
+                    continue
+                if counts['bytes'] + size > max_total_bytes:
+                    progress(f"Stopping at {relative_path}: the dump would pass {max_total_bytes} bytes")
+                    break
+
+                output.write(f"File: {relative_path}\n")
+                chars = copy_file(path, output)
+                output.write("\n\n")
+            except OSError as e:
+                counts['unreadable'] += 1
+                progress(f"Could not read {relative_path}: {e}")
+                continue
+
+            tokens = -(-chars // CHARS_PER_TOKEN)
+            counts['files'] += 1
+            counts['bytes'] += size
+            counts['tokens'] += tokens
+            progress(f"{tokens:>8} tokens  {relative_path}")
+    return counts
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Dump a source tree into one text file.')
+    parser.add_argument('directory', nargs='?', default='.')
+    parser.add_argument('-o', '--output', default='code.txt')
+    parser.add_argument('--exclude', action='append', default=[], metavar='PATTERN',
+                        help='Also leave out paths matching this gitignore-style pattern (repeatable).')
+    parser.add_argument('--max-file-bytes', type=int, default=MAX_FILE_BYTES, help='Skip files larger than this.')
+    parser.add_argument('--max-total-bytes', type=int, default=MAX_TOTAL_BYTES, help='Stop before the dump passes this.')
+    parser.add_argument('--no-gitignore', action='store_true', help='Do not read .gitignore files.')
+    args = parser.parse_args()
+
+    counts = dump(
+        args.directory, args.output, args.exclude, args.max_file_bytes, args.max_total_bytes,
+        use_gitignore=not args.no_gitignore
+    )
+    print(
+        f"Wrote {counts['files']} files ({counts['bytes']} bytes, ~{counts['tokens']} tokens) to {args.output}; "
+        f"skipped {counts['binary']} binary, {counts['too_large']} too large and {counts['unreadable']} unreadable"
+    )
+
 
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,69 @@
+# Gunicorn settings for production: gunicorn -c gunicorn.conf.py wsgi:app
+# Each setting can be overridden on the command line or in GUNICORN_CMD_ARGS.
+import os
+import tempfile
+
+bind = os.environ.get('BIND') or '0.0.0.0:8000'
+
+# One process per core, since alignment is CPU bound, with threads each so
+# streamed batch responses and event streams do not hold a whole process. Run
+# progress streams read the database, so any worker can serve any run; each
+# open run page holds one thread for up to EVENTS_STREAM_SECONDS at a time
+workers = int(os.environ.get('WEB_CONCURRENCY') or os.cpu_count() or 1)
+worker_class = 'gthread'
+threads = int(os.environ.get('WEB_THREADS') or 8)
+
+# Every worker keeps its own metrics, so they are written to a shared directory
+# and summed by whichever worker serves /metrics (see METRICS_DIR in config.py)
+if not os.environ.get('METRICS_DIR'):
+    os.environ['METRICS_DIR'] = tempfile.mkdtemp(prefix='inspection-metrics-')
+
+# Import the app (and OpenCV, via wsgi.py) once in the master and fork workers
+# from it, so they start quickly and share those pages
+preload_app = True
+
+# Seconds a worker may go without checking in, which includes prewarming
+timeout = int(os.environ.get('WEB_TIMEOUT') or 120)
+graceful_timeout = 30
+keepalive = 5
+
+
+def on_starting(server):
+    from app.metrics import clear_snapshots
+    clear_snapshots(os.environ['METRICS_DIR'])
+
+
+def pre_fork(server, worker):
+    # Exactly one live worker runs the periodic storage GC; when it exits the
+    # next worker forked takes over
+    gc_worker = getattr(server, 'storage_gc_worker', None)
+    if gc_worker is None or gc_worker not in server.WORKERS.values():
+        server.storage_gc_worker = worker
+        worker.runs_storage_gc = True
+
+
+def post_fork(server, worker):
+    # Database connections opened in the master must not be shared with workers
+    from app import db
+    app = server.app.wsgi()
+    with app.app_context():
+        db.engine.dispose()
+
+
+def post_worker_init(worker):
+    from app.metrics import start_snapshot_thread
+    start_snapshot_thread(os.environ['METRICS_DIR'], worker.wsgi.config['METRICS_SNAPSHOT_SECONDS'])
+
+    # Fill this worker's template caches before it takes requests
+    if worker.wsgi.config['PREWARM']:
+        from app.prewarm import prewarm
+        prewarm(worker.wsgi, progress=worker.log.info)
+    if getattr(worker, 'runs_storage_gc', False) and worker.wsgi.config['STORAGE_GC_INTERVAL']:
+        from app.storage_gc import start_gc_thread
+        start_gc_thread(worker.wsgi, progress=worker.log.info)
+
+
+def worker_exit(server, worker):
+    # Keep what this worker counted since its last snapshot
+    from app.metrics import write_snapshot
+    write_snapshot(os.environ['METRICS_DIR'])
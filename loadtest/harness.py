@@ -0,0 +1,360 @@
+"""
+Offline load-test harness. Boots the app against SQLite with local Bedrock and
+S3 stand-ins, drives the inspect, run and train (finish model, which calls
+Bedrock) endpoints at a target concurrency, and reports throughput, latency
+percentiles and the server's peak RSS. A run request is timed until the run
+records its result, not just until it is queued.
+
+    python -m loadtest.harness run --concurrency 8 --requests 200 --label baseline
+    python -m loadtest.harness compare loadtest/results/baseline.json loadtest/results/candidate.json
+"""
+import argparse
+import itertools
+import json
+import math
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from urllib.parse import urljoin
+
+import requests
+
+from loadtest.stubs import start_bedrock_stub, start_s3_stub
+from loadtest.synthetic import synthetic_jpeg
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RESULTS_DIR = os.path.join(REPO_ROOT, 'loadtest', 'results')
+
+# Metrics compared between result files, and whether a higher value is better
+COMPARED_METRICS = [
+    ('throughput_rps', True),
+    ('p50_ms', False),
+    ('p95_ms', False),
+    ('p99_ms', False),
+    ('error_rate', False),
+]
+
+
+def percentile(sorted_values, pct):
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return None
+    rank = max(1, math.ceil(pct / 100.0 * len(sorted_values)))
+    return sorted_values[min(rank, len(sorted_values)) - 1]
+
+
+def peak_rss_mb(pid):
+    """Peak resident set size of a process in MB, read from /proc (Linux only)."""
+    try:
+        with open(f'/proc/{pid}/status') as status:
+            for line in status:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) / 1024.0
+    except OSError:
+        pass
+    return None
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(
+            ['git', 'rev-parse', '--short', 'HEAD'], cwd=REPO_ROOT, stderr=subprocess.DEVNULL, text=True
+        ).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def boot_app(workdir, bedrock_url, s3_url, regions, training_models=0):
+    """
+    Start the app in a subprocess and wait until it is serving. Returns
+    (process, base url, model id, ids of the models seeded for training).
+    """
+    env = dict(
+        os.environ,
+        DATABASE_URL=f"sqlite:///{os.path.join(workdir, 'loadtest.db')}",
+        UPLOADED_IMAGES_DEST=os.path.join(workdir, 'uploads'),
+        BEDROCK_ENDPOINT_URL=bedrock_url,
+        S3_ENDPOINT_URL=s3_url,
+        S3_BUCKET='loadtest',
+        AWS_ACCESS_KEY_ID='loadtest',
+        AWS_SECRET_ACCESS_KEY='loadtest',
+        AWS_DEFAULT_REGION='us-east-1',
+        # Run latencies are read off the progress stream, so poll it finely
+        EVENTS_POLL_SECONDS='0.05',
+    )
+    process = subprocess.Popen(
+        [sys.executable, '-m', 'loadtest.serve', '--regions', str(regions), '--training-models', str(training_models)],
+        cwd=REPO_ROOT,
+        env=env,
+        stdout=subprocess.PIPE,
+        text=True
+    )
+    line = process.stdout.readline()
+    if not line.startswith('READY'):
+        process.kill()
+        raise RuntimeError(f"App failed to start: {line!r}")
+    _, port, model_id, training_ids = line.split()
+    training_ids = [int(model_id) for model_id in training_ids.split(',')] if training_ids != '-' else []
+    return process, f'http://127.0.0.1:{port}', int(model_id), training_ids
+
+
+class Driver:
+    """Issues requests from a pool of threads and records each request's latency."""
+
+    def __init__(self, base_url, model_id, images, s3_path, training_ids=(), run_timeout=300):
+        self.base_url = base_url
+        self.model_id = model_id
+        self.training_ids = iter(training_ids)  # one untrained model per train request
+        self.images = images
+        self.s3_path = s3_path
+        self.run_timeout = run_timeout
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self.samples = {}  # endpoint -> list of (latency seconds, ok)
+
+    def _session(self):
+        session = getattr(self._local, 'session', None)
+        if session is None:
+            session = self._local.session = requests.Session()
+        return session
+
+    def _request(self, endpoint, n):
+        session = self._session()
+        if endpoint == 'inspect':
+            image = self.images[n % len(self.images)]
+            return session.post(
+                f'{self.base_url}/models/{self.model_id}/inspect',
+                files={'image': (f'loadtest_{n}.jpg', image, 'image/jpeg')},
+                allow_redirects=False
+            )
+        if endpoint == 'train':
+            # Finishing a model crops and trains each region, two Bedrock calls per region
+            with self._lock:
+                training_id = next(self.training_ids)
+            return session.post(f'{self.base_url}/models/finish/{training_id}', allow_redirects=False)
+        queued = session.post(
+            f'{self.base_url}/models/{self.model_id}/run',
+            data={'s3_path': self.s3_path},
+            allow_redirects=False
+        )
+        if queued.status_code >= 400:
+            return queued
+        # The run is only queued here; wait for it to finish
+        return self._wait_for_run(session, urljoin(self.base_url, queued.headers['Location']))
+
+    def _wait_for_run(self, session, run_url):
+        """
+        Follow a run's progress stream, reconnecting whenever the server ends it,
+        until the run records its result. Raises RuntimeError if the run stopped
+        early and requests.Timeout after run_timeout seconds.
+        """
+        deadline = time.monotonic() + self.run_timeout
+        while time.monotonic() < deadline:
+            with session.get(f'{run_url}/events', stream=True, timeout=self.run_timeout) as response:
+                if response.status_code >= 400:
+                    return response
+                for line in response.iter_lines(decode_unicode=True):
+                    if line.startswith('data:'):
+                        result = json.loads(line[len('data:'):])['result']
+                        if result is not None:
+                            if 'stopped' in result:
+                                raise RuntimeError(f"Run stopped: {result}")
+                            return response
+                    if time.monotonic() >= deadline:
+                        break
+        raise requests.Timeout(f"Run at {run_url} did not finish in {self.run_timeout}s")
+
+    def call(self, endpoint, n, record=True):
+        start = time.perf_counter()
+        try:
+            response = self._request(endpoint, n)
+            ok = response.status_code < 400
+        except (requests.RequestException, RuntimeError):
+            ok = False
+        latency = time.perf_counter() - start
+        if record:
+            with self._lock:
+                self.samples.setdefault(endpoint, []).append((latency, ok))
+
+    def drive(self, endpoints, total, concurrency, record=True):
+        counter = itertools.count()
+        schedule = itertools.cycle(endpoints)
+        schedule_lock = threading.Lock()
+
+        def worker():
+            while True:
+                with schedule_lock:
+                    n = next(counter)
+                    endpoint = next(schedule)
+                if n >= total:
+                    return
+                self.call(endpoint, n, record)
+
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            for _ in range(concurrency):
+                executor.submit(worker)
+
+
+def summarise(samples, elapsed):
+    latencies = sorted(latency for latency, _ in samples)
+    errors = sum(1 for _, ok in samples if not ok)
+    to_ms = lambda value: None if value is None else round(value * 1000, 2)
+    return {
+        'requests': len(samples),
+        'errors': errors,
+        'error_rate': round(errors / len(samples), 4) if samples else None,
+        'throughput_rps': round(len(samples) / elapsed, 2) if elapsed else None,
+        'p50_ms': to_ms(percentile(latencies, 50)),
+        'p95_ms': to_ms(percentile(latencies, 95)),
+        'p99_ms': to_ms(percentile(latencies, 99)),
+        'max_ms': to_ms(latencies[-1] if latencies else None),
+    }
+
+
+def run(args):
+    endpoints = ['inspect', 'run', 'train'] if args.scenario == 'mixed' else [args.scenario]
+    images = [synthetic_jpeg(seed=i) for i in range(args.image_variants)]
+    # Each train request needs a model of its own, since a trained one has nothing left to do
+    training_models = args.warmup + args.requests if 'train' in endpoints else 0
+
+    bedrock = start_bedrock_stub(args.bedrock_latency, args.bedrock_jitter, args.throttle_rate)
+    s3 = start_s3_stub(images[0], args.s3_objects)
+
+    with tempfile.TemporaryDirectory(prefix='loadtest-') as workdir:
+        process, base_url, model_id, training_ids = boot_app(workdir, bedrock.url, s3.url, args.regions, training_models)
+        try:
+            driver = Driver(base_url, model_id, images, 's3://loadtest/images/', training_ids, args.run_timeout)
+            if args.warmup:
+                driver.drive(endpoints, args.warmup, args.concurrency, record=False)
+
+            start = time.perf_counter()
+            driver.drive(endpoints, args.requests, args.concurrency)
+            elapsed = time.perf_counter() - start
+            rss = peak_rss_mb(process.pid)
+        finally:
+            process.terminate()
+            process.wait(timeout=10)
+
+    bedrock.shutdown()
+    s3.shutdown()
+
+    all_samples = [sample for samples in driver.samples.values() for sample in samples]
+    result = {
+        'label': args.label,
+        'created_at': datetime.utcnow().isoformat(),
+        'git_commit': git_commit(),
+        'params': {
+            'scenario': args.scenario,
+            'concurrency': args.concurrency,
+            'requests': args.requests,
+            'warmup': args.warmup,
+            'regions': args.regions,
+            'image_variants': args.image_variants,
+            'bedrock_latency': args.bedrock_latency,
+            'bedrock_jitter': args.bedrock_jitter,
+            'throttle_rate': args.throttle_rate,
+            's3_objects': args.s3_objects,
+            'run_timeout': args.run_timeout,
+        },
+        'elapsed_s': round(elapsed, 3),
+        'peak_rss_mb': None if rss is None else round(rss, 1),
+        'total': summarise(all_samples, elapsed),
+        'endpoints': {endpoint: summarise(samples, elapsed) for endpoint, samples in driver.samples.items()},
+        'stubs': {'bedrock': dict(bedrock.stats), 's3': dict(s3.stats)},
+    }
+
+    os.makedirs(RESULTS_DIR, exist_ok=True)
+    output_path = args.output or os.path.join(RESULTS_DIR, f'{args.label}.json')
+    with open(output_path, 'w') as output_file:
+        json.dump(result, output_file, indent=2, sort_keys=True)
+
+    print_result(result)
+    print(f"Results saved to {output_path}")
+
+
+def print_result(result):
+    print(f"{'endpoint':<10} {'requests':>8} {'errors':>6} {'rps':>8} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}")
+    rows = list(result['endpoints'].items()) + [('total', result['total'])]
+    for endpoint, stats in rows:
+        print(
+            f"{endpoint:<10} {stats['requests']:>8} {stats['errors']:>6} {stats['throughput_rps'] or 0:>8} "
+            f"{stats['p50_ms'] or 0:>9} {stats['p95_ms'] or 0:>9} {stats['p99_ms'] or 0:>9}"
+        )
+    print(f"Peak RSS: {result['peak_rss_mb']} MB")
+
+
+def compare(args):
+    with open(args.baseline) as baseline_file:
+        baseline = json.load(baseline_file)
+    with open(args.candidate) as candidate_file:
+        candidate = json.load(candidate_file)
+
+    if baseline['params'] != candidate['params']:
+        print("Warning: the two runs used different parameters, deltas may not be meaningful.")
+
+    regressions = 0
+    print(f"{baseline['label']} ({baseline['git_commit']}) -> {candidate['label']} ({candidate['git_commit']})")
+    sections = [('total', baseline['total'], candidate['total'])]
+    for endpoint, stats in candidate['endpoints'].items():
+        if endpoint in baseline['endpoints']:
+            sections.append((endpoint, baseline['endpoints'][endpoint], stats))
+
+    for name, before, after in sections:
+        for metric, higher_is_better in COMPARED_METRICS:
+            old, new = before.get(metric), after.get(metric)
+            if old is None or new is None:
+                continue
+            change = (new - old) / old * 100 if old else 0.0
+            worse = change < -args.threshold if higher_is_better else change > args.threshold
+            regressions += worse
+            flag = '  REGRESSION' if worse else ''
+            print(f"{name:<10} {metric:<15} {old:>10} -> {new:>10} ({change:+.1f}%){flag}")
+
+    old_rss, new_rss = baseline.get('peak_rss_mb'), candidate.get('peak_rss_mb')
+    if old_rss and new_rss:
+        change = (new_rss - old_rss) / old_rss * 100
+        worse = change > args.threshold
+        regressions += worse
+        print(f"{'server':<10} {'peak_rss_mb':<15} {old_rss:>10} -> {new_rss:>10} ({change:+.1f}%){'  REGRESSION' if worse else ''}")
+
+    return 1 if regressions else 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    run_parser = subparsers.add_parser('run', help="Run a load test and save the results")
+    run_parser.add_argument('--scenario', choices=['inspect', 'run', 'train', 'mixed'], default='inspect')
+    run_parser.add_argument('--concurrency', type=int, default=8)
+    run_parser.add_argument('--requests', type=int, default=200)
+    run_parser.add_argument('--warmup', type=int, default=10)
+    run_parser.add_argument('--regions', type=int, default=3)
+    run_parser.add_argument('--image-variants', type=int, default=4)
+    run_parser.add_argument('--bedrock-latency', type=float, default=0.5, help="Seconds per InvokeModel call")
+    run_parser.add_argument('--bedrock-jitter', type=float, default=0.2, help="Extra random seconds per call")
+    run_parser.add_argument('--throttle-rate', type=float, default=0.0, help="Fraction of calls answered with 429")
+    run_parser.add_argument('--s3-objects', type=int, default=100, help="Objects listed under the stub prefix")
+    run_parser.add_argument('--run-timeout', type=float, default=300, help="Seconds to wait for a run to finish")
+    run_parser.add_argument('--label', default=datetime.utcnow().strftime('%Y%m%d-%H%M%S'))
+    run_parser.add_argument('--output', help="Result file, defaults to loadtest/results/<label>.json")
+
+    compare_parser = subparsers.add_parser('compare', help="Compare two saved result files")
+    compare_parser.add_argument('baseline')
+    compare_parser.add_argument('candidate')
+    compare_parser.add_argument('--threshold', type=float, default=10.0, help="Percent change flagged as a regression")
+
+    args = parser.parse_args()
+    if args.command == 'run':
+        run(args)
+    else:
+        sys.exit(compare(args))
+
+
+if __name__ == '__main__':
+    main()
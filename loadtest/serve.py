@@ -0,0 +1,98 @@
+"""
+Boot the app for the load-test harness: create the SQLite schema, seed a ready
+model with a synthetic template, and serve it with a threaded WSGI server.
+With --training-models it also seeds models whose regions still need training,
+one per train request. The harness configures the database, uploads folder and
+AWS endpoints through the environment before starting this module.
+"""
+import argparse
+import logging
+import os
+
+import cv2
+from werkzeug.serving import make_server
+
+from loadtest.synthetic import synthetic_image
+from run import app
+from app import db
+from app.models import Model, ModelRegion, ReferenceImage
+
+
+def seed_model(region_count, status='ready'):
+    """Create a model with a synthetic template and evenly spaced regions, trained unless status is 'setup'."""
+    template = synthetic_image(seed=0)
+    template_filename = 'loadtest_template.png'
+    os.makedirs(app.config['UPLOADED_IMAGES_DEST'], exist_ok=True)
+    cv2.imwrite(os.path.join(app.config['UPLOADED_IMAGES_DEST'], template_filename), template)
+
+    model = Model(
+        name='Load test',
+        description='Seeded by the load-test harness',
+        template_image_filename=template_filename,
+        status=status
+    )
+    db.session.add(model)
+    db.session.flush()
+
+    height, width = template.shape[:2]
+    step = width // max(region_count, 1)
+    for i in range(region_count):
+        db.session.add(ModelRegion(
+            model_id=model.id,
+            name=f'region_{i + 1}',
+            x1=i * step,
+            y1=height // 4,
+            x2=(i + 1) * step - 1,
+            y2=3 * height // 4,
+            status='trained' if status == 'ready' else 'pending',
+            fail_description='Component missing',
+            pass_description='Component present'
+        ))
+    db.session.commit()
+    return model
+
+
+def seed_training_model(region_count, good_images=2, bad_images=1):
+    """
+    Create a model whose regions still need training, with its reference images
+    already uploaded and aligned (copies of the template), so finishing it crops
+    each region and trains it against Bedrock.
+    """
+    model = seed_model(region_count, status='setup')
+    filename = model.template_image_filename
+    for ordinal in range(1, good_images + 1):
+        db.session.add(ReferenceImage(
+            model_id=model.id, kind='good', ordinal=ordinal, filename=filename, aligned_filename=filename
+        ))
+    for region in model.regions:
+        for ordinal in range(1, bad_images + 1):
+            db.session.add(ReferenceImage(
+                model_id=model.id, region_id=region.id, kind='bad', ordinal=ordinal,
+                filename=filename, aligned_filename=filename
+            ))
+    db.session.commit()
+    return model
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--regions', type=int, default=3)
+    parser.add_argument('--training-models', type=int, default=0)
+    args = parser.parse_args()
+
+    with app.app_context():
+        db.create_all()
+        model = seed_model(args.regions)
+        model_id = model.id
+        training_ids = [seed_training_model(args.regions).id for _ in range(args.training_models)]
+
+    # Per-request access logs would dominate the harness output
+    logging.getLogger('werkzeug').setLevel(logging.WARNING)
+
+    server = make_server('127.0.0.1', 0, app, threaded=True)
+    print(f"READY {server.port} {model_id} {','.join(map(str, training_ids)) or '-'}", flush=True)
+    server.serve_forever()
+
+
+if __name__ == '__main__':
+    main()
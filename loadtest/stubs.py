@@ -0,0 +1,165 @@
+"""
+Local stand-ins for the AWS services the app talks to, so load tests can run
+without an AWS account. Both servers speak just enough of the wire protocol
+for boto3 pointed at them with an endpoint_url.
+"""
+import hashlib
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, unquote, urlparse
+from xml.sax.saxutils import escape
+
+
+class StubServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, handler_class, host='127.0.0.1', port=0, **settings):
+        super().__init__((host, port), handler_class)
+        self.settings = settings
+        self.random = random.Random(settings.get('seed', 0))
+        self.lock = threading.Lock()
+        self.stats = {'requests': 0, 'throttled': 0}
+
+    @property
+    def url(self):
+        host, port = self.server_address[:2]
+        return f'http://{host}:{port}'
+
+    def count(self, key):
+        with self.lock:
+            self.stats[key] += 1
+
+    def start(self):
+        thread = threading.Thread(target=self.serve_forever, daemon=True)
+        thread.start()
+        return self
+
+
+class _QuietHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send(self, status, body, content_type, headers=None):
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        if self.command != 'HEAD':
+            self.wfile.write(body)
+
+
+class BedrockStubHandler(_QuietHandler):
+    """Answers bedrock-runtime InvokeModel with a canned Anthropic messages response."""
+
+    def do_POST(self):
+        server = self.server
+        server.count('requests')
+
+        length = int(self.headers.get('Content-Length') or 0)
+        self.rfile.read(length)
+
+        settings = server.settings
+        with server.lock:
+            throttled = server.random.random() < settings.get('throttle_rate', 0.0)
+            delay = settings.get('latency', 0.0) + server.random.uniform(0, settings.get('jitter', 0.0))
+
+        if throttled:
+            server.count('throttled')
+            body = json.dumps({'message': 'Too many requests, please wait before trying again.'}).encode()
+            self._send(429, body, 'application/json', {'x-amzn-ErrorType': 'ThrottlingException:'})
+            return
+
+        time.sleep(delay)
+        body = json.dumps({
+            'id': 'msg_loadtest',
+            'type': 'message',
+            'role': 'assistant',
+            'content': [{'type': 'text', 'text': 'The region looks correct.'}],
+            'stop_reason': 'end_turn',
+            'usage': {'input_tokens': 0, 'output_tokens': 0},
+        }).encode()
+        self._send(200, body, 'application/json')
+
+
+class S3StubHandler(_QuietHandler):
+    """
+    Serves a synthetic bucket over path-style requests: ListObjectsV2 on the
+    bucket, and GetObject/HeadObject returning the same generated image for
+    every key.
+    """
+
+    def _object_keys(self, prefix):
+        count = self.server.settings.get('object_count', 100)
+        prefix = prefix or ''
+        return [f'{prefix}image_{i:06d}.jpg' for i in range(count)]
+
+    def _list_objects(self, bucket, query):
+        prefix = query.get('prefix', [''])[0]
+        start_after = query.get('start-after', [''])[0]
+        token = query.get('continuation-token', [''])[0]
+        max_keys = int(query.get('max-keys', ['1000'])[0])
+
+        keys = [key for key in self._object_keys(prefix) if key > (token or start_after)]
+        page, rest = keys[:max_keys], keys[max_keys:]
+        etag = self.server.settings['etag']
+        size = len(self.server.settings['body'])
+
+        contents = ''.join(
+            f'<Contents><Key>{escape(key)}</Key><ETag>&quot;{etag}&quot;</ETag>'
+            f'<Size>{size}</Size><LastModified>2024-01-01T00:00:00.000Z</LastModified>'
+            f'<StorageClass>STANDARD</StorageClass></Contents>'
+            for key in page
+        )
+        next_token = f'<NextContinuationToken>{escape(page[-1])}</NextContinuationToken>' if rest else ''
+        body = (
+            '<?xml version="1.0" encoding="UTF-8"?>'
+            '<ListBucketResult xmlns="http://s3.amazonaws.com/doc/2006-03-01/">'
+            f'<Name>{escape(bucket)}</Name><Prefix>{escape(prefix)}</Prefix>'
+            f'<KeyCount>{len(page)}</KeyCount><MaxKeys>{max_keys}</MaxKeys>'
+            f'<IsTruncated>{"true" if rest else "false"}</IsTruncated>'
+            f'{next_token}{contents}</ListBucketResult>'
+        ).encode()
+        self._send(200, body, 'application/xml')
+
+    def do_GET(self):
+        self.server.count('requests')
+        parsed = urlparse(self.path)
+        bucket, _, key = unquote(parsed.path).lstrip('/').partition('/')
+        query = parse_qs(parsed.query)
+
+        if not key:
+            self._list_objects(bucket, query)
+            return
+
+        settings = self.server.settings
+        self._send(200, settings['body'], 'image/jpeg', {'ETag': f'"{settings["etag"]}"'})
+
+    do_HEAD = do_GET
+
+
+def start_bedrock_stub(latency=0.0, jitter=0.0, throttle_rate=0.0, seed=0):
+    """Start a bedrock-runtime stand-in on an ephemeral port."""
+    return StubServer(
+        BedrockStubHandler,
+        latency=latency,
+        jitter=jitter,
+        throttle_rate=throttle_rate,
+        seed=seed
+    ).start()
+
+
+def start_s3_stub(object_body, object_count=100):
+    """Start an S3 stand-in on an ephemeral port that serves object_body for every key."""
+    return StubServer(
+        S3StubHandler,
+        body=object_body,
+        etag=hashlib.md5(object_body).hexdigest(),
+        object_count=object_count
+    ).start()
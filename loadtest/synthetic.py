@@ -0,0 +1,33 @@
+import cv2
+import numpy as np
+
+
+def synthetic_image(seed=0, width=1280, height=960):
+    """
+    Generate a textured image with enough structure for SIFT to find keypoints:
+    a smoothed noise background with random rectangles and circles on top.
+    """
+    rng = np.random.default_rng(seed)
+    image = rng.integers(0, 256, (height, width, 3), dtype=np.uint8)
+    image = cv2.GaussianBlur(image, (7, 7), 0)
+
+    for _ in range(40):
+        x, y = int(rng.integers(0, width)), int(rng.integers(0, height))
+        w, h = int(rng.integers(20, 200)), int(rng.integers(20, 200))
+        color = tuple(int(c) for c in rng.integers(0, 256, 3))
+        cv2.rectangle(image, (x, y), (x + w, y + h), color, -1)
+
+    for _ in range(40):
+        center = (int(rng.integers(0, width)), int(rng.integers(0, height)))
+        color = tuple(int(c) for c in rng.integers(0, 256, 3))
+        cv2.circle(image, center, int(rng.integers(5, 80)), color, 3)
+
+    return image
+
+
+def synthetic_jpeg(seed=0, width=1280, height=960, quality=90):
+    """Encode a synthetic image as JPEG bytes."""
+    ok, encoded = cv2.imencode('.jpg', synthetic_image(seed, width, height), [cv2.IMWRITE_JPEG_QUALITY, quality])
+    if not ok:
+        raise ValueError("Could not encode synthetic image.")
+    return encoded.tobytes()
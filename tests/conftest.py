@@ -0,0 +1,39 @@
+import os
+
+import pytest
+
+# Config is read from the environment when it is imported, so point it at
+# SQLite before the app is; each test then gets its own database file
+os.environ['DATABASE_URL'] = 'sqlite://'
+
+from flask_uploads import configure_uploads  # noqa: E402
+
+from app import create_app, db, images  # noqa: E402
+
+
+@pytest.fixture
+def app(tmp_path):
+    app = create_app()
+    app.config.update(
+        TESTING=True,
+        SQLALCHEMY_DATABASE_URI=f"sqlite:///{tmp_path / 'test.db'}",
+        UPLOADED_IMAGES_DEST=str(tmp_path / 'uploads'),
+        THUMBNAILS_DEST=str(tmp_path / 'thumbs'),
+    )
+    configure_uploads(app, images)  # the upload set reads its folder from the config
+    os.makedirs(app.config['UPLOADED_IMAGES_DEST'])
+    os.makedirs(app.config['THUMBNAILS_DEST'])
+    with app.app_context():
+        db.create_all()
+        yield app
+        db.session.remove()
+
+
+@pytest.fixture
+def model(app):
+    from app.models import Model
+
+    model = Model(name='widget', status='ready')
+    db.session.add(model)
+    db.session.commit()
+    return model
@@ -0,0 +1,67 @@
+import os
+
+import cv2
+import numpy as np
+import pytest
+
+from app import align
+from app.align import DEFAULT_ALIGN_PARAMS, estimate_homography, template_features
+
+PARAMS = dict(DEFAULT_ALIGN_PARAMS, nfeatures=2000)
+
+
+@pytest.fixture
+def template_path(tmp_path, monkeypatch):
+    monkeypatch.setattr(align, '_feature_cache', {})
+    rng = np.random.default_rng(0)
+    blocks = rng.integers(0, 256, (30, 40, 3), dtype=np.uint8)
+    template = cv2.GaussianBlur(cv2.resize(blocks, (400, 300), interpolation=cv2.INTER_NEAREST), (3, 3), 0)
+    path = str(tmp_path / 'template.png')
+    cv2.imwrite(path, template)
+    return path
+
+
+@pytest.fixture
+def detections(monkeypatch):
+    calls = []
+    detect_features = align.detect_features
+
+    def counting(gray, params=DEFAULT_ALIGN_PARAMS):
+        calls.append(gray.shape)
+        return detect_features(gray, params)
+
+    monkeypatch.setattr(align, 'detect_features', counting)
+    return calls
+
+
+def test_template_features_are_detected_once_per_file(template_path, detections):
+    first = template_features(template_path, params=PARAMS)
+    second = template_features(template_path, cv2.imread(template_path), params=PARAMS)
+
+    assert len(detections) == 1
+    assert first[0] is second[0] and first[1] is second[1]
+    assert first[0].shape == (len(first[1]), 2)
+
+
+def test_template_features_are_detected_again_when_the_file_changes(template_path, detections):
+    template_features(template_path, params=PARAMS)
+    mtime = os.stat(template_path).st_mtime_ns + 10 ** 9
+    os.utime(template_path, ns=(mtime, mtime))
+    template_features(template_path, params=PARAMS)
+    template_features(template_path, params=dict(PARAMS, nfeatures=500))
+
+    assert len(detections) == 3
+
+
+def test_cached_features_give_the_same_homography(template_path):
+    template = cv2.imread(template_path)
+    shifted = cv2.warpAffine(template, np.float32([[1, 0, 12], [0, 1, 8]]), (400, 300))
+    gray_template = cv2.cvtColor(template, cv2.COLOR_BGR2GRAY)
+    gray_input = cv2.cvtColor(shifted, cv2.COLOR_BGR2GRAY)
+
+    cached = estimate_homography(None, gray_input, PARAMS, features=template_features(template_path, template, PARAMS))
+    detected = estimate_homography(gray_template, gray_input, PARAMS)
+
+    assert np.allclose(cached, detected)
+    # The input is the template moved 12px right and 8px down, so H moves it back
+    assert np.allclose(cached[:2, 2], [-12, -8], atol=0.5)
@@ -0,0 +1,113 @@
+import io
+import json
+import zipfile
+
+import pytest
+
+from app import routes
+from app.models import Inspection, InspectionRollup, Run
+
+
+@pytest.fixture
+def inspected(monkeypatch):
+    """
+    Stub inspection that passes images whose bytes start with 'good', fails the
+    rest and raises for 'broken' ones, recording each flush's row count.
+    """
+    flushes = []
+    record_inspections = routes.record_inspections
+
+    def inspect_image(image_path, model, station=None):
+        with open(image_path, 'rb') as image_file:
+            data = image_file.read()
+        if data == b'broken':
+            raise ValueError("Input image could not be loaded.")
+        passed = data.startswith(b'good')
+        return {'pass_fail': passed, 'reason': None if passed else 'scratch', 'template_id': None,
+                'region_results': {}, 'timings': {'warp': 1.0}, 'duration_ms': 2.0}
+
+    def recording(rows):
+        flushes.append(len(rows))
+        record_inspections(rows)
+
+    monkeypatch.setattr(routes, 'inspect_image', inspect_image)
+    monkeypatch.setattr(routes, 'record_inspections', recording)
+    return flushes
+
+
+def zip_bytes(members, compression=zipfile.ZIP_DEFLATED):
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, 'w', compression) as archive:
+        for name, data in members:
+            archive.writestr(name, data)
+    return buffer.getvalue()
+
+
+def ndjson(response):
+    return [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+
+
+def test_batch_of_images_and_a_zip(app, model, inspected):
+    archive = zip_bytes([('parts/c.png', b'good c'), ('parts/notes.txt', b'skipped'), ('d.jpg', b'bad d')])
+
+    response = app.test_client().post(f'/models/{model.id}/inspect/batch', data={
+        'images': [
+            (io.BytesIO(b'good a'), 'a.png'),
+            (io.BytesIO(b'broken'), 'b.png'),
+            (io.BytesIO(b'#!/bin/sh'), 'run.sh'),
+            (io.BytesIO(archive), 'more.zip'),
+        ],
+    }, content_type='multipart/form-data')
+
+    assert response.status_code == 200
+    assert response.mimetype == 'application/x-ndjson'
+    lines = ndjson(response)
+    results = {line['filename']: line for line in lines[:-1]}
+    assert len(results) == len(lines) - 1 == 5
+    assert (results['a.png']['pass_fail'], results['a.png']['error']) == (True, None)
+    assert results['b.png']['error'] == "ValueError: Input image could not be loaded."
+    assert results['run.sh']['error'] == "File type not allowed"
+    assert (results['c.png']['pass_fail'], results['d.jpg']['pass_fail']) == (True, False)
+    assert lines[-1] == {'summary': {'total': 5, 'passed': 2, 'failed': 1, 'errors': 2, 'run_id': None}}
+    assert Inspection.query.count() == 3
+
+
+def test_raw_zip_body(app, model, inspected):
+    archive = zip_bytes([('a.png', b'good a'), ('b.png', b'bad b')], zipfile.ZIP_STORED)
+
+    response = app.test_client().post(f'/models/{model.id}/inspect/batch', data=archive,
+                                      content_type='application/zip')
+
+    lines = ndjson(response)
+    assert [line['filename'] for line in lines[:-1]] == ['a.png', 'b.png']
+    assert lines[-1]['summary']['total'] == 2
+
+
+def test_unsupported_body_is_an_error_line(app, model, inspected):
+    response = app.test_client().post(f'/models/{model.id}/inspect/batch', data=b'a.png',
+                                      content_type='text/plain')
+
+    lines = ndjson(response)
+    assert lines[0] == {'error': "Batch uploads must be multipart/form-data or application/zip."}
+    assert lines[-1]['summary']['total'] == 0
+
+
+def test_run_batch_is_flushed_in_chunks(app, model, inspected):
+    app.config.update(BATCH_INSERT_SIZE=2, BATCH_INSPECT_WORKERS=1)
+    uploads = [(io.BytesIO(f'good {n}'.encode()), f'{n}.png') for n in range(4)]
+    uploads += [(io.BytesIO(f'bad {n}'.encode()), f'{n}.png') for n in range(4, 7)]
+
+    response = app.test_client().post(f'/models/{model.id}/inspect/batch?run=1', data={'images': uploads},
+                                      content_type='multipart/form-data')
+
+    summary = ndjson(response)[-1]['summary']
+    assert (summary['total'], summary['passed'], summary['failed']) == (7, 4, 3)
+    # Each chunk goes in once it reaches the insert size, with whatever
+    # finished alongside it; the last holds the rest
+    assert sum(inspected) == 7 and len(inspected) >= 3
+    assert all(2 <= size <= 3 for size in inspected[:-1])
+    run = Run.query.get(summary['run_id'])
+    assert (run.passed, run.failed, run.result) == (4, 3, '4/7 PASS')
+    assert Inspection.query.filter_by(run_id=run.id).count() == 7
+    whole = InspectionRollup.query.filter_by(model_id=model.id, region_id=0, period='hour').one()
+    assert (whole.total, whole.passed, whole.failed) == (7, 4, 3)
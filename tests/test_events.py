@@ -0,0 +1,61 @@
+import json
+
+from app import db
+from app.events import add_run_counts, count_run_inspections, recent_failures, stream_run_events
+from app.models import Inspection, Run
+
+
+def add_run(model, result=None):
+    run = Run(model_id=model.id, s3_path='parts/', result=result)
+    db.session.add(run)
+    db.session.commit()
+    return run
+
+
+def test_recent_failures_are_newest_first(app, model):
+    run = add_run(model)
+    for n in range(5):
+        db.session.add(Inspection(run_id=run.id, model_id=model.id, image_url=f'{n}.png', pass_fail=n == 2, reason=f'r{n}'))
+    db.session.commit()
+
+    assert recent_failures(run.id, limit=3) == [
+        {'image_url': '4.png', 'reason': 'r4'}, {'image_url': '3.png', 'reason': 'r3'}, {'image_url': '1.png', 'reason': 'r1'},
+    ]
+
+
+def test_run_counts_follow_inserted_rows(app, model):
+    run = add_run(model)
+    count_run_inspections([
+        {'run_id': run.id, 'pass_fail': True}, {'run_id': run.id, 'pass_fail': False}, {'run_id': None, 'pass_fail': True},
+    ])
+    add_run_counts(run.id, carried=4)
+    db.session.commit()
+
+    run = Run.query.get(run.id)
+    assert (run.passed, run.failed, run.carried) == (1, 1, 4)
+
+
+def test_stream_of_a_finished_run_sends_one_event(app, model):
+    run = add_run(model, result='1/2 PASS')
+    db.session.add(Inspection(run_id=run.id, model_id=model.id, image_url='bad.png', pass_fail=False, reason='dent'))
+    add_run_counts(run.id, passed=1, failed=1)
+    db.session.commit()
+
+    retry, event = list(stream_run_events(run.id, interval=0))
+
+    assert retry == 'retry: 1000\n\n'
+    name, data = event.strip().split('\n')
+    assert name == 'event: progress'
+    snapshot = json.loads(data[len('data: '):])
+    assert (snapshot['total'], snapshot['failed'], snapshot['finished'], snapshot['result']) == (2, 1, True, '1/2 PASS')
+    assert snapshot['recent_failures'] == [{'image_url': 'bad.png', 'reason': 'dent'}]
+
+
+def test_stream_ends_after_its_duration(app, model):
+    run = add_run(model)
+
+    events = list(stream_run_events(run.id, interval=0.01, duration=0.05, heartbeat=0))
+
+    assert events[0].startswith('retry:')
+    assert json.loads(events[1].split('data: ')[1])['finished'] is False
+    assert set(events[2:]) <= {': keep-alive\n\n'}
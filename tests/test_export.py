@@ -0,0 +1,76 @@
+import csv
+import io
+import json
+from datetime import datetime
+
+from app import db, export
+from app.export import iter_csv, iter_run_rows, region_columns, run_export_columns
+from app.models import Inspection, ModelRegion, Run
+
+
+def add_region(model, name):
+    region = ModelRegion(model_id=model.id, name=name, x1=0, y1=0, x2=10, y2=10)
+    db.session.add(region)
+    db.session.commit()
+    return region
+
+
+def test_region_columns_disambiguate_shared_names(app, model):
+    screw = add_region(model, 'screw')
+    label = add_region(model, 'label')
+    other_screw = add_region(model, 'screw')
+
+    assert region_columns(model.id) == [
+        (screw.id, f'region_screw_{screw.id}'), (label.id, 'region_label'), (other_screw.id, f'region_screw_{other_screw.id}'),
+    ]
+
+
+def test_run_rows_sum_region_timings_into_their_stage(app, model):
+    region = add_region(model, 'label')
+    run = Run(model_id=model.id, s3_path='parts/')
+    db.session.add(run)
+    db.session.flush()
+    db.session.add(Inspection(
+        run_id=run.id, model_id=model.id, image_url='s3://bucket/a.png', pass_fail=False, reason='torn',
+        duration_ms=12.5, created_at=datetime(2026, 1, 2, 3, 4, 5),
+        timings=json.dumps({'warp': 1.0, f'region_scoring:{region.id}': 2.0, 'region_scoring:9': 0.5, 'unknown': 7}),
+        region_results=json.dumps({str(region.id): {'name': 'label', 'score': 0.25, 'pass': False}}),
+    ))
+    db.session.commit()
+
+    row, = iter_run_rows(run.id, model.id)
+
+    assert row['created_at'] == '2026-01-02T03:04:05'
+    assert (row['warp_ms'], row['region_scoring_ms'], row['sift_detect_ms']) == (1.0, 2.5, None)
+    assert (row['region_label_score'], row['region_label_pass']) == (0.25, False)
+    assert 'unknown_ms' not in row
+    assert set(row) <= set(run_export_columns(run))
+
+
+def test_csv_is_streamed_in_chunks_with_one_header(app, monkeypatch):
+    monkeypatch.setattr(export, 'CSV_CHUNK_ROWS', 2)
+    rows = [{'inspection_id': n, 'pass_fail': n % 2 == 0, 'extra': 'dropped'} for n in range(5)]
+
+    chunks = list(iter_csv(rows, ['inspection_id', 'pass_fail']))
+
+    assert len(chunks) == 3
+    parsed = list(csv.DictReader(io.StringIO(''.join(chunks))))
+    assert [row['inspection_id'] for row in parsed] == ['0', '1', '2', '3', '4']
+    assert parsed[1]['pass_fail'] == 'False'
+
+
+def test_export_route(app, model):
+    run = Run(model_id=model.id, s3_path='parts/')
+    db.session.add(run)
+    db.session.flush()
+    db.session.add(Inspection(run_id=run.id, model_id=model.id, image_url='s3://bucket/a.png', pass_fail=True))
+    db.session.commit()
+    client = app.test_client()
+
+    response = client.get(f'/runs/{run.id}/export.csv')
+    assert response.status_code == 200
+    assert response.headers['Content-Disposition'] == f'attachment; filename=run_{run.id}.csv'
+    rows = list(csv.DictReader(io.StringIO(response.get_data(as_text=True))))
+    assert [(row['image_url'], row['pass_fail']) for row in rows] == [('s3://bucket/a.png', 'True')]
+
+    assert client.get(f'/runs/{run.id}/export.xlsx').status_code == 404
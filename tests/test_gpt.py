@@ -0,0 +1,91 @@
+import os
+
+import pytest
+
+from gpt import dump, is_binary, is_ignored, iter_files, parse_ignore_lines
+
+
+def write(root, path, data='text\n'):
+    full_path = os.path.join(root, path)
+    os.makedirs(os.path.dirname(full_path), exist_ok=True)
+    with open(full_path, 'wb') as out:
+        out.write(data.encode('utf-8') if isinstance(data, str) else data)
+
+
+def ignored(lines, path, is_dir=False):
+    return is_ignored(parse_ignore_lines(lines), path, is_dir)
+
+
+@pytest.mark.parametrize('pattern, path, is_dir, expected', [
+    ('*.pyc', 'app/__pycache__/x.pyc', False, True),
+    ('*.pyc', 'x.py', False, False),
+    ('/config.py', 'config.py', False, True),
+    ('/config.py', 'app/config.py', False, False),
+    ('app/*.html', 'app/index.html', False, True),
+    ('app/*.html', 'app/templates/index.html', False, False),
+    ('results/', 'loadtest/results', True, True),
+    ('results/', 'results', False, False),
+    ('**/static/uploads', 'app/static/uploads', True, True),
+    ('docs/**', 'docs/a/b.md', False, True),
+    ('img?.png', 'img1.png', False, True),
+    ('img[!0-4].png', 'img3.png', False, False),
+    ('img[!0-4].png', 'img7.png', False, True),
+    ('\\#notes', '#notes', False, True),
+])
+def test_patterns(pattern, path, is_dir, expected):
+    assert ignored([pattern], path, is_dir) is expected
+
+
+def test_last_matching_rule_decides():
+    lines = ['*.log', '!keep.log', '# a comment', '']
+    assert ignored(lines, 'debug.log')
+    assert not ignored(lines, 'keep.log')
+    assert ignored(lines + ['keep.log'], 'keep.log')
+
+
+def test_is_binary(tmp_path):
+    write(tmp_path, 'nul.dat', b'abc\0def')
+    write(tmp_path, 'utf8.txt', 'café\n')
+    write(tmp_path, 'latin1.txt', b'caf\xe9 menu ' * 10)
+
+    assert is_binary(tmp_path / 'nul.dat')
+    assert is_binary(tmp_path / 'latin1.txt')
+    assert not is_binary(tmp_path / 'utf8.txt')
+
+
+def test_nested_gitignores_and_hidden_directories(tmp_path):
+    write(tmp_path, '.gitignore', '*.log\n')
+    write(tmp_path, 'app/.gitignore', 'generated/\n!keep.log\n')
+    for path in ('main.py', 'debug.log', 'app/keep.log', 'app/views.py', 'app/generated/out.py',
+                 'generated/kept.py', '.git/config', 'app/static/uploads/a.png'):
+        write(tmp_path, path)
+
+    files = [relative for relative, _ in iter_files(str(tmp_path), parse_ignore_lines(['app/static/uploads/']))]
+
+    assert files == ['.gitignore', 'main.py', 'app/.gitignore', 'app/keep.log', 'app/views.py', 'generated/kept.py']
+
+
+def test_dump_skips_binaries_before_the_total_cap(tmp_path):
+    root = tmp_path / 'tree'
+    write(root, 'a.bin', b'\0' * 200)  # over the total cap, but never written
+    write(root, 'b.py', 'print(1)\n')
+    write(root, 'c.py', 'x' * 300)
+    write(root, 'd.py', 'y' * 100)
+    output = tmp_path / 'code.txt'
+
+    counts = dump(str(root), str(output), max_file_bytes=250, max_total_bytes=50, progress=lambda message: None)
+
+    assert (counts['files'], counts['binary'], counts['too_large']) == (1, 1, 1)
+    assert output.read_text() == 'File: b.py\nprint(1)\n\n\n'
+
+
+def test_dump_leaves_out_its_own_output(tmp_path):
+    write(tmp_path, 'main.py', 'pass\n')
+    output = tmp_path / 'dump.txt'
+    output.write_text('stale')
+
+    counts = dump(str(tmp_path), str(output), progress=lambda message: None)
+
+    assert counts['files'] == 1
+    assert counts['tokens'] == 2
+    assert 'stale' not in output.read_text()
@@ -0,0 +1,80 @@
+from app import db
+from app.models import Inspection, Run, RunObject
+from app.s3_runs import base_run_for, diff_page, key_hash, run_inspections
+
+PATH = 's3://bucket/parts/'
+
+
+def add_run(model, objects=(), result='done', s3_path=PATH):
+    """A run with a manifest of (key, etag, pass_fail) objects; pass_fail None means it failed to inspect."""
+    run = Run(model_id=model.id, s3_path=s3_path, result=result)
+    db.session.add(run)
+    db.session.flush()
+    for key, etag, pass_fail in objects:
+        inspection_id = None
+        if pass_fail is not None:
+            inspection = Inspection(run_id=run.id, model_id=model.id, image_url=f's3://bucket/{key}', pass_fail=pass_fail)
+            db.session.add(inspection)
+            db.session.flush()
+            inspection_id = inspection.id
+        db.session.add(RunObject(run_id=run.id, key_hash=key_hash(key), key=key, etag=etag, inspection_id=inspection_id))
+    db.session.commit()
+    return run
+
+
+def test_diff_page_carries_unchanged_objects_forward(app, model):
+    base = add_run(model, [
+        ('parts/same.png', 'e1', True),
+        ('parts/bad.png', 'e2', False),
+        ('parts/edited.png', 'e3', True),
+        ('parts/errored.png', 'e4', None),
+    ])
+    listed = [
+        ('parts/same.png', 'e1'), ('parts/bad.png', 'e2'), ('parts/edited.png', 'changed'),
+        ('parts/errored.png', 'e4'), ('parts/new.png', 'e5'),
+    ]
+
+    unchanged, todo = diff_page(base.id, listed)
+
+    inspections = {inspection.image_url: inspection.id for inspection in Inspection.query}
+    assert sorted(unchanged) == [
+        ('parts/bad.png', 'e2', inspections['s3://bucket/parts/bad.png'], False),
+        ('parts/same.png', 'e1', inspections['s3://bucket/parts/same.png'], True),
+    ]
+    assert todo == [('parts/edited.png', 'changed'), ('parts/errored.png', 'e4'), ('parts/new.png', 'e5')]
+
+
+def test_diff_page_without_a_base_run_inspects_everything(app):
+    listed = [('parts/a.png', 'e1')]
+    assert diff_page(None, listed) == ([], listed)
+
+
+def test_base_run_is_the_latest_finished_run_with_a_manifest(app, model):
+    add_run(model, [('parts/a.png', 'e1', True)])
+    latest = add_run(model, [('parts/a.png', 'e1', True)])
+    add_run(model, [('parts/a.png', 'e1', True)], result=None)  # still running
+    add_run(model, [])  # from before manifests
+    add_run(model, [('parts/a.png', 'e1', True)], s3_path='s3://bucket/other/')
+    current = add_run(model, result=None)
+
+    assert base_run_for(current).id == latest.id
+
+
+def test_run_inspections_reads_carried_inspections_through_the_manifest(app, model):
+    base = add_run(model, [('parts/a.png', 'e1', True), ('parts/b.png', 'e2', False)])
+    run = add_run(model, [('parts/b.png', 'e3', True)])
+    carried = Inspection.query.filter_by(run_id=base.id, pass_fail=True).one()
+    db.session.add(RunObject(run_id=run.id, key_hash=key_hash('parts/a.png'), key='parts/a.png', etag='e1',
+                             inspection_id=carried.id))
+    db.session.commit()
+
+    urls = [image_url for image_url, in run_inspections(run.id, Inspection.image_url)]
+    assert urls == ['s3://bucket/parts/b.png', 's3://bucket/parts/a.png']
+
+
+def test_run_inspections_of_a_run_without_a_manifest(app, model):
+    run = add_run(model)
+    db.session.add(Inspection(run_id=run.id, model_id=model.id, image_url='/static/uploads/x.png', pass_fail=True))
+    db.session.commit()
+
+    assert [inspection.image_url for inspection in run_inspections(run.id)] == ['/static/uploads/x.png']
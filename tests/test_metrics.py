@@ -0,0 +1,60 @@
+import json
+import os
+
+import pytest
+
+from app import metrics
+
+
+@pytest.fixture
+def registry(monkeypatch):
+    monkeypatch.setattr(metrics, 'REGISTRY', [])
+    histogram = metrics.Histogram('test_seconds', 'Test timings.', labelnames=('stage',), buckets=(0.1, 1.0))
+    counter = metrics.Counter('test_total', 'Test events.', labelnames=('result',))
+    return histogram, counter
+
+
+def test_render_of_one_process(registry):
+    histogram, counter = registry
+    histogram.observe(0.05, stage='warp')
+    histogram.observe(0.5, stage='warp')
+    counter.inc(result='hit')
+
+    lines = metrics.render().splitlines()
+
+    assert 'test_seconds_bucket{stage="warp",le="0.1"} 1' in lines
+    assert 'test_seconds_bucket{stage="warp",le="1.0"} 2' in lines
+    assert 'test_seconds_bucket{stage="warp",le="+Inf"} 2' in lines
+    assert 'test_seconds_count{stage="warp"} 2' in lines
+    assert 'test_total{result="hit"} 1.0' in lines
+
+
+def test_render_sums_every_process_snapshot(registry, tmp_path):
+    histogram, counter = registry
+    histogram.observe(0.05, stage='warp')
+    counter.inc(2, result='hit')
+    # Another worker's snapshot, and one left by a worker that has exited
+    other = {
+        'test_seconds': [[['warp'], [[0, 1], 0.5, 1]], [['ransac'], [[1, 0], 0.01, 1]]],
+        'test_total': [[['hit'], 3], [['miss'], 1]],
+    }
+    for pid in (1, 2):
+        with open(tmp_path / f'{pid}.json', 'w') as snapshot_file:
+            json.dump(other, snapshot_file)
+    (tmp_path / '3.json.tmp').write_text('{"partial')
+
+    lines = metrics.render(str(tmp_path)).splitlines()
+
+    assert os.path.exists(tmp_path / f'{os.getpid()}.json')
+    assert 'test_seconds_bucket{stage="warp",le="0.1"} 1' in lines
+    assert 'test_seconds_bucket{stage="warp",le="1.0"} 3' in lines
+    assert 'test_seconds_count{stage="ransac"} 2' in lines
+    assert 'test_total{result="hit"} 8.0' in lines
+    assert 'test_total{result="miss"} 2.0' in lines
+
+
+def test_clear_snapshots(tmp_path):
+    (tmp_path / '1.json').write_text('{}')
+    (tmp_path / 'keep.txt').write_text('')
+    metrics.clear_snapshots(str(tmp_path))
+    assert os.listdir(tmp_path) == ['keep.txt']
@@ -0,0 +1,52 @@
+import os
+
+import pytest
+from flask_migrate import downgrade, upgrade
+from sqlalchemy import inspect
+from sqlalchemy.exc import IntegrityError
+
+from app import create_app, db
+from app.models import ReferenceImage
+
+MIGRATIONS = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'migrations')
+
+
+@pytest.fixture
+def empty_app(tmp_path):
+    app = create_app()
+    app.config['SQLALCHEMY_DATABASE_URI'] = f"sqlite:///{tmp_path / 'migrated.db'}"
+    with app.app_context():
+        yield app
+        db.session.remove()
+
+
+def table_names():
+    return set(db.engine.table_names()) - {'alembic_version'}
+
+
+def test_migrations_build_the_models_tables_and_tear_them_down(empty_app):
+    upgrade(directory=MIGRATIONS)
+    assert table_names() == set(db.metadata.tables)
+    slot = [index for index in inspect(db.engine).get_indexes('reference_image') if index['name'] == 'ix_reference_image_slot']
+    assert slot[0]['column_names'] == ['model_id', 'region_key', 'kind', 'ordinal'] and slot[0]['unique']
+
+    downgrade(directory=MIGRATIONS, revision='base')
+    assert table_names() == set()
+
+    upgrade(directory=MIGRATIONS)
+    assert table_names() == set(db.metadata.tables)
+
+
+def test_model_wide_reference_slots_are_unique(app, model):
+    db.session.add(ReferenceImage(model_id=model.id, kind='good', ordinal=1, filename='a.png'))
+    db.session.commit()
+    assert ReferenceImage.query.one().region_key == 0
+
+    db.session.add(ReferenceImage(model_id=model.id, kind='good', ordinal=1, filename='b.png'))
+    with pytest.raises(IntegrityError):
+        db.session.commit()
+    db.session.rollback()
+
+    db.session.add(ReferenceImage(model_id=model.id, kind='good', ordinal=2, filename='b.png'))
+    db.session.commit()
+    assert ReferenceImage.query.count() == 2
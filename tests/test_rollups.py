@@ -0,0 +1,98 @@
+import json
+from datetime import datetime
+
+from app import db
+from app.models import Inspection, InspectionRollup, ModelRegion
+from app.rollups import (
+    aggregate, backfill, bucket_start, model_summaries, percentile, record_inspections, region_summaries, reason_key,
+    top_reasons
+)
+
+NOW = datetime(2026, 3, 4, 5, 6, 7)
+HOUR = datetime(2026, 3, 4, 5)
+DAY = datetime(2026, 3, 4)
+
+
+def inspection(model_id, passed, region_results=None, timings=None, reason=None, duration_ms=30.0, created_at=NOW):
+    return {
+        'model_id': model_id, 'pass_fail': passed, 'reason': reason, 'duration_ms': duration_ms,
+        'timings': json.dumps(timings or {}), 'region_results': json.dumps(region_results or {}),
+        'created_at': created_at,
+    }
+
+
+def test_bucket_start():
+    assert bucket_start(NOW, 'hour') == HOUR
+    assert bucket_start(NOW, 'day') == DAY
+
+
+def test_aggregate_counts_inspections_regions_and_reasons():
+    rows = [
+        inspection(1, True, {'7': {'name': 'label', 'score': 0.9, 'pass': True}}, {'region_scoring:7': 40.0}),
+        inspection(1, False, {'7': {'name': 'label', 'score': 0.3, 'pass': False}}, {'region_scoring:7': 60.0},
+                   reason='torn label', duration_ms=700.0),
+    ]
+
+    deltas, reasons = aggregate(rows)
+
+    whole = deltas[(1, 0, 'hour', HOUR)]
+    assert (whole['total'], whole['passed'], whole['failed'], whole['score_sum']) == (2, 1, 1, 0)
+    assert (whole['latency_le_50'], whole['latency_le_1000'], whole['latency_ms_sum']) == (1, 1, 730.0)
+    region = deltas[(1, 7, 'day', DAY)]
+    assert (region['total'], region['passed'], region['failed']) == (2, 1, 1)
+    assert round(region['score_sum'], 6) == 1.2
+    assert (region['latency_le_50'], region['latency_le_100'], region['latency_ms_sum']) == (1, 1, 100.0)
+    hashed, reason = reason_key('torn label')
+    assert reasons == {(1, 'hour', HOUR, hashed): [reason, 1], (1, 'day', DAY, hashed): [reason, 1]}
+
+
+def test_aggregate_keys_region_latency_by_id_when_names_repeat():
+    results = {'7': {'name': 'screw', 'score': 1.0, 'pass': True}, '8': {'name': 'screw', 'score': 1.0, 'pass': True}}
+    deltas, _ = aggregate([inspection(1, True, results, {'region_scoring:7': 5.0, 'region_scoring:8': 500.0})])
+
+    assert deltas[(1, 7, 'hour', HOUR)]['latency_ms_sum'] == 5.0
+    assert deltas[(1, 8, 'hour', HOUR)]['latency_ms_sum'] == 500.0
+
+
+def test_aggregate_reads_name_labelled_timings_of_older_inspections():
+    results = {'7': {'name': 'label', 'score': 1.0, 'pass': True}}
+    deltas, _ = aggregate([inspection(1, True, results, {'region_scoring:label': 20.0})])
+
+    assert deltas[(1, 7, 'hour', HOUR)]['latency_ms_sum'] == 20.0
+
+
+def test_percentile_interpolates_within_buckets():
+    counts = [0, 10, 10, 0, 0, 0, 0, 0, 0, 0, 0]  # ten up to 50ms, ten up to 100ms
+    assert percentile(counts, 0.5) == 50
+    assert percentile(counts, 0.75) == 75
+    assert percentile([0] * 10 + [3], 0.5) == 30000
+    assert percentile([0] * 11, 0.5) is None
+
+
+def test_recorded_rollups_add_up_and_summarise(app, model):
+    region = ModelRegion(model_id=model.id, name='label', x1=0, y1=0, x2=1, y2=1)
+    db.session.add(region)
+    db.session.commit()
+    results = {str(region.id): {'name': 'label', 'score': 0.5, 'pass': True}}
+    record_inspections([inspection(model.id, True, results)])
+    record_inspections([inspection(model.id, False, results, reason='smudge')])
+    db.session.commit()
+
+    assert InspectionRollup.query.count() == 4  # the model and its region, by hour and by day
+    summary = model_summaries('day', NOW)[model.id]
+    assert (summary['total'], summary['passed'], summary['pass_rate'], summary['mean_score']) == (2, 1, 0.5, None)
+    (region_id, name, region_summary), = region_summaries(model.id, 'hour', NOW)
+    assert (region_id, name, region_summary['total'], region_summary['mean_score']) == (region.id, 'label', 2, 0.5)
+    assert top_reasons(model.id, 'day', NOW) == [('smudge', 1)]
+
+
+def test_backfill_rebuilds_from_inspections(app, model):
+    record_inspections([inspection(model.id, True)])  # counted, but the inspection was never written
+    for row in (inspection(model.id, True), inspection(model.id, False, reason='dent')):
+        db.session.add(Inspection(image_url='x.png', **row))
+    db.session.commit()
+
+    assert backfill(model.id, progress=lambda message: None) == 2
+
+    summary = model_summaries('hour', NOW)[model.id]
+    assert (summary['total'], summary['passed'], summary['failed']) == (2, 1, 1)
@@ -0,0 +1,254 @@
+import threading
+from datetime import datetime, timedelta
+
+import pytest
+
+from app import db, s3_runs, shards
+from app.models import Inspection, Run, RunObject, RunShard
+from app.s3_runs import key_hash
+from app.shards import (
+    LeaseLost, claim_shard, complete_shard, finish_run_if_done, plan_run, renew_lease, run_progress, steal_shard,
+    write_inspections
+)
+
+
+class FakePaginator:
+    def __init__(self, pages, fail_after=None):
+        self.pages = pages
+        self.fail_after = fail_after
+
+    def paginate(self, **kwargs):
+        for number, page in enumerate(self.pages):
+            if number == self.fail_after:
+                raise ConnectionError('listing interrupted')
+            yield {'Contents': [{'Key': key, 'ETag': f'"{etag}"'} for key, etag in page]}
+
+
+class FakeS3:
+    def __init__(self, pages, fail_after=None):
+        self.paginator = FakePaginator(pages, fail_after)
+
+    def get_paginator(self, operation):
+        return self.paginator
+
+
+@pytest.fixture
+def s3(monkeypatch):
+    def install(pages, fail_after=None):
+        monkeypatch.setattr(s3_runs, '_s3_client', FakeS3(pages, fail_after))
+    return install
+
+
+def add_run(model, result=None):
+    run = Run(model_id=model.id, s3_path='s3://bucket/parts/', result=result)
+    db.session.add(run)
+    db.session.commit()
+    return run
+
+
+def add_shard(run, objects, worker=None, lease_seconds=60):
+    """A shard of a run holding objects fresh run objects, leased to worker if given."""
+    shard = RunShard(run_id=run.id, status='pending', object_count=objects)
+    if worker:
+        shard.status, shard.worker, shard.attempts = 'leased', worker, 1
+        shard.lease_expires_at = datetime.utcnow() + timedelta(seconds=lease_seconds)
+    db.session.add(shard)
+    db.session.flush()
+    db.session.bulk_insert_mappings(RunObject, [
+        {'run_id': run.id, 'key_hash': key_hash(f'parts/{shard.id}/{n}.png'), 'key': f'parts/{shard.id}/{n}.png',
+         'etag': 'e', 'shard_id': shard.id}
+        for n in range(objects)
+    ])
+    db.session.commit()
+    return shard.id
+
+
+def inspection_rows(run, object_ids, pass_fail=True):
+    return [
+        ({'run_id': run.id, 'model_id': run.model_id, 'image_url': f's3://bucket/{object_id}.png',
+          'pass_fail': pass_fail, 'created_at': datetime.utcnow()}, object_id)
+        for object_id in object_ids
+    ]
+
+
+def shard_object_ids(shard_id):
+    return [object_id for object_id, in db.session.query(RunObject.id).filter_by(shard_id=shard_id).order_by(RunObject.id)]
+
+
+def test_claim_leases_each_shard_once(app, model):
+    run = add_run(model)
+    first, second = add_shard(run, 2), add_shard(run, 2)
+
+    assert claim_shard('a', 60) == first
+    assert claim_shard('b', 60) == second
+    assert claim_shard('c', 60) is None
+
+    shard = RunShard.query.get(first)
+    assert (shard.status, shard.worker, shard.attempts) == ('leased', 'a', 1)
+
+
+def test_expired_lease_is_taken_over(app, model):
+    run = add_run(model)
+    shard_id = add_shard(run, 2, worker='a', lease_seconds=-1)
+
+    assert claim_shard('b', 60) == shard_id
+    shard = RunShard.query.get(shard_id)
+    assert (shard.worker, shard.attempts) == ('b', 2)
+    with pytest.raises(LeaseLost):
+        renew_lease(shard_id, 'a', 60)
+    with pytest.raises(LeaseLost):
+        complete_shard(shard_id, 'a')
+
+
+def test_renew_lease_extends_it_and_adds_counts(app, model):
+    run = add_run(model)
+    shard_id = add_shard(run, 5, worker='a', lease_seconds=1)
+
+    renew_lease(shard_id, 'a', 600, inspected=3, passed=2, failed=1)
+    db.session.commit()
+
+    shard = RunShard.query.get(shard_id)
+    assert (shard.inspected, shard.passed, shard.failed) == (3, 2, 1)
+    assert shard.lease_expires_at > datetime.utcnow() + timedelta(seconds=500)
+
+
+def test_steal_takes_the_uninspected_upper_half(app, model):
+    run = add_run(model)
+    victim = add_shard(run, 100, worker='a')
+    object_ids = shard_object_ids(victim)
+    write_inspections(inspection_rows(run, object_ids[:10]))
+    db.session.commit()
+
+    stolen = steal_shard('b', 60, min_objects=20)
+
+    assert shard_object_ids(stolen) == object_ids[55:]
+    assert shard_object_ids(victim) == object_ids[:55]
+    assert RunShard.query.get(stolen).object_count == 45
+    assert RunShard.query.get(victim).object_count == 55
+    assert RunShard.query.get(stolen).worker == 'b'
+
+
+def test_steal_leaves_small_own_and_expired_shards_alone(app, model):
+    run = add_run(model)
+    add_shard(run, 30, worker='a')
+    add_shard(run, 100, worker='b')
+    add_shard(run, 100, worker='c', lease_seconds=-1)
+
+    assert steal_shard('b', 60, min_objects=20) is None
+
+
+def test_write_inspections_records_each_object_once(app, model):
+    run = add_run(model)
+    shard_id = add_shard(run, 2)
+    object_ids = shard_object_ids(shard_id)
+
+    written = write_inspections(inspection_rows(run, object_ids))
+    duplicate = write_inspections(inspection_rows(run, object_ids[:1], pass_fail=False))
+    db.session.commit()
+
+    assert (len(written), len(duplicate)) == (2, 0)
+    assert Inspection.query.count() == 2
+    run = Run.query.get(run.id)
+    assert (run.passed, run.failed) == (2, 0)
+
+
+def test_complete_shard_and_finish_run(app, model):
+    run = add_run(model)
+    shard_id = add_shard(run, 3, worker='a')
+    object_ids = shard_object_ids(shard_id)
+    write_inspections(inspection_rows(run, object_ids[:1]) + inspection_rows(run, object_ids[1:2], pass_fail=False))
+    db.session.commit()
+
+    complete_shard(shard_id, 'a')
+
+    shard = RunShard.query.get(shard_id)
+    assert (shard.status, shard.inspected, shard.passed, shard.failed, shard.errors) == ('done', 2, 1, 1, 1)
+    assert finish_run_if_done(run.id) == '1/2 PASS'
+    assert Run.query.get(run.id).result == '1/2 PASS'
+
+
+def test_plan_run_shards_the_listing(app, model, s3):
+    s3([[(f'parts/{n}.png', 'e') for n in range(5)], [('parts/5.png', 'e'), ('parts/notes.txt', 'e')]])
+    run = add_run(model)
+
+    assert plan_run(run, shard_size=2, progress=lambda message: None) == 3
+
+    planned = RunShard.query.order_by(RunShard.id).all()
+    assert [(shard.status, shard.object_count) for shard in planned] == [('pending', 2)] * 3
+    assert RunObject.query.filter_by(run_id=run.id).count() == 6
+    assert run_progress(run.id)['objects'] == 6
+
+
+def test_incremental_plan_carries_unchanged_objects(app, model, s3):
+    base = add_run(model)
+    for key, etag, pass_fail in [('parts/a.png', 'e1', True), ('parts/b.png', 'e2', False)]:
+        inspection = Inspection(run_id=base.id, model_id=model.id, image_url=key, pass_fail=pass_fail)
+        db.session.add(inspection)
+        db.session.flush()
+        db.session.add(RunObject(run_id=base.id, key_hash=key_hash(key), key=key, etag=etag, inspection_id=inspection.id))
+    base.result = '1/2 PASS'
+    db.session.commit()
+    s3([[('parts/a.png', 'e1'), ('parts/b.png', 'e2'), ('parts/c.png', 'e3')]])
+    run = add_run(model)
+
+    assert plan_run(run, incremental=True, progress=lambda message: None) == 1
+
+    carried = RunObject.query.filter(RunObject.run_id == run.id, RunObject.shard_id.is_(None)).count()
+    assert carried == 2
+    assert shard_object_ids(RunShard.query.filter_by(run_id=run.id).one().id)
+    run = Run.query.get(run.id)
+    assert (run.passed, run.failed, run.carried) == (1, 1, 2)
+
+
+def test_plan_run_of_unchanged_objects_finishes_at_once(app, model, s3):
+    base = add_run(model, result='1/1 PASS')
+    inspection = Inspection(run_id=base.id, model_id=model.id, image_url='parts/a.png', pass_fail=True)
+    db.session.add(inspection)
+    db.session.flush()
+    db.session.add(RunObject(run_id=base.id, key_hash=key_hash('parts/a.png'), key='parts/a.png', etag='e1',
+                             inspection_id=inspection.id))
+    db.session.commit()
+    s3([[('parts/a.png', 'e1')]])
+    run = add_run(model)
+
+    assert plan_run(run, incremental=True, progress=lambda message: None) == 0
+    assert Run.query.get(run.id).result == '1/1 PASS'
+
+
+def test_failed_listing_opens_the_shards_planned_so_far(app, model, s3):
+    s3([[(f'parts/{n}.png', 'e') for n in range(3)], [('parts/late.png', 'e')]], fail_after=1)
+    run = add_run(model)
+
+    with pytest.raises(ConnectionError):
+        plan_run(run, shard_size=2, progress=lambda message: None)
+
+    planned = RunShard.query.order_by(RunShard.id).all()
+    assert [(shard.status, shard.object_count) for shard in planned] == [('pending', 2), ('pending', 1)]
+
+
+def test_sharded_run_is_planned_in_the_background(app, model, monkeypatch):
+    listing_started, release_listing = threading.Event(), threading.Event()
+
+    def slow_pages(client, bucket, prefix):
+        listing_started.set()
+        release_listing.wait(10)
+        yield [('parts/a.png', 'e'), ('parts/b.png', 'e')]
+
+    monkeypatch.setattr(shards, 'iter_object_pages', slow_pages)
+    monkeypatch.setattr(s3_runs, '_s3_client', FakeS3([]))
+    planned = []
+    monkeypatch.setattr(shards, 'submit_background', lambda fn, *args: planned.append(
+        s3_runs.submit_background(fn, *args)
+    ))
+
+    response = app.test_client().post(f'/models/{model.id}/run', data={'s3_path': 's3://bucket/parts/', 'sharded': '1'})
+
+    assert response.status_code == 302
+    assert listing_started.wait(10)
+    assert RunShard.query.count() == 0
+    release_listing.set()
+    planned[0].result(10)
+    db.session.commit()
+    run = Run.query.one()
+    assert response.headers['Location'].endswith(f'/runs/{run.id}')
+    assert [(shard.status, shard.object_count) for shard in RunShard.query] == [('pending', 2)]
@@ -0,0 +1,123 @@
+import hashlib
+import io
+import os
+import threading
+
+import pytest
+from flask_uploads import UploadNotAllowed
+from sqlalchemy import event
+from werkzeug.datastructures import FileStorage
+
+from app import db
+from app.models import Blob
+from app.storage import acquire, acquire_many, assign, release, release_many, save_upload, upload_filename
+
+
+def upload(data, filename='part.PNG'):
+    return FileStorage(stream=io.BytesIO(data), filename=filename)
+
+
+def refcount(filename):
+    return Blob.query.filter_by(filename=filename).one().refcount
+
+
+def test_save_upload_names_blobs_by_content(app):
+    filename = save_upload(upload(b'image bytes'))
+    db.session.commit()
+
+    assert filename == hashlib.sha256(b'image bytes').hexdigest() + '.png'
+    with open(os.path.join(app.config['UPLOADED_IMAGES_DEST'], filename), 'rb') as blob_file:
+        assert blob_file.read() == b'image bytes'
+    blob = Blob.query.filter_by(filename=filename).one()
+    assert (blob.size, blob.refcount) == (len(b'image bytes'), 0)
+
+
+def test_identical_uploads_share_one_blob(app):
+    first = save_upload(upload(b'same', 'a.png'))
+    second = save_upload(upload(b'same', 'b.png'))
+    db.session.commit()
+
+    assert first == second
+    assert Blob.query.count() == 1
+    assert sorted(os.listdir(app.config['UPLOADED_IMAGES_DEST'])) == [first]
+
+
+def test_save_upload_rejects_other_extensions(app):
+    with pytest.raises(UploadNotAllowed):
+        save_upload(upload(b'#!/bin/sh', 'run.sh'))
+    assert os.listdir(app.config['UPLOADED_IMAGES_DEST']) == []
+
+
+def test_acquire_and_release_count_references(app):
+    filename = save_upload(upload(b'counted'))
+    acquire(filename)
+    acquire_many([filename, filename, None])
+    db.session.commit()
+    assert refcount(filename) == 3
+
+    release(filename)
+    release_many([filename, filename])
+    db.session.commit()
+    assert refcount(filename) == 0
+
+
+def test_acquire_ignores_files_from_before_the_blob_store(app):
+    acquire('legacy_name.png')
+    release(None)
+    db.session.commit()
+    assert Blob.query.count() == 0
+
+
+def test_assign_moves_the_reference(app, model):
+    old = save_upload(upload(b'old template'))
+    new = save_upload(upload(b'new template'))
+    assign(model, 'template_image_filename', old)
+    db.session.commit()
+    assert (refcount(old), refcount(new)) == (1, 0)
+
+    assign(model, 'template_image_filename', new)
+    assign(model, 'template_image_filename', new)
+    db.session.commit()
+    assert model.template_image_filename == new
+    assert (refcount(old), refcount(new)) == (0, 1)
+
+
+def test_upload_filename():
+    assert upload_filename('/static/uploads/abc.png') == 'abc.png'
+    assert upload_filename('s3://bucket/key.png') is None
+    assert upload_filename(None) is None
+
+
+def test_concurrent_uploads_of_the_same_bytes(app, monkeypatch):
+    # Both uploads look for the blob row before either adds it
+    lookups_done = threading.Barrier(2, timeout=10)
+
+    def after_lookup(conn, cursor, statement, parameters, context, executemany):
+        if statement.startswith('SELECT') and 'FROM blob' in statement:
+            lookups_done.wait()
+
+    event.listen(db.engine, 'after_cursor_execute', after_lookup)
+    results, errors = [], []
+
+    def save(name):
+        with app.app_context():
+            try:
+                filename = save_upload(upload(b'same bytes', name))
+                acquire(filename)
+                db.session.commit()
+                results.append(filename)
+            except Exception as e:
+                errors.append(e)
+            finally:
+                db.session.remove()
+
+    threads = [threading.Thread(target=save, args=(name,)) for name in ('a.png', 'b.png')]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    event.remove(db.engine, 'after_cursor_execute', after_lookup)
+
+    assert errors == []
+    assert len(set(results)) == 1 and len(results) == 2
+    assert refcount(results[0]) == 2
@@ -0,0 +1,118 @@
+import os
+import time
+
+from app import cli, db
+from app.models import Blob, Inspection
+from app.storage_gc import collect_garbage, enforce_quota, run_storage_gc
+
+HOUR = 3600
+
+
+def write_file(directory, name, data=b'x', age=2 * HOUR):
+    path = os.path.join(directory, name)
+    with open(path, 'wb') as out:
+        out.write(data)
+    stamp = time.time() - age
+    os.utime(path, (stamp, stamp))
+    return path
+
+
+def add_blob(name, refcount):
+    db.session.add(Blob(filename=name, size=1, refcount=refcount))
+    db.session.commit()
+
+
+def test_collects_unreferenced_blobs_and_their_rows(app):
+    dest = app.config['UPLOADED_IMAGES_DEST']
+    write_file(dest, 'kept.png')
+    write_file(dest, 'dropped.png', b'12345')
+    add_blob('kept.png', 1)
+    add_blob('dropped.png', 0)
+
+    stats = collect_garbage(min_age=HOUR)
+
+    assert stats == {'scanned': 2, 'deleted': 1, 'freed_bytes': 5}
+    assert os.listdir(dest) == ['kept.png']
+    assert [blob.filename for blob in Blob.query] == ['kept.png']
+
+
+def test_keeps_files_referenced_by_columns_and_inspections(app, model):
+    dest = app.config['UPLOADED_IMAGES_DEST']
+    model.template_image_filename = 'template.png'
+    db.session.add(Inspection(model_id=model.id, image_url='/static/uploads/inspected.png'))
+    db.session.commit()
+    for name in ('template.png', 'inspected.png', 'orphan.png'):
+        write_file(dest, name)
+
+    collect_garbage(min_age=HOUR)
+
+    assert sorted(os.listdir(dest)) == ['inspected.png', 'template.png']
+
+
+def test_keeps_young_files_and_removes_stale_temp_files(app):
+    dest = app.config['UPLOADED_IMAGES_DEST']
+    write_file(dest, 'just_written.png', age=10)
+    write_file(dest, '.upload-abandoned')
+
+    collect_garbage(min_age=HOUR)
+
+    assert os.listdir(dest) == ['just_written.png']
+
+
+def test_dry_run_deletes_nothing(app):
+    dest = app.config['UPLOADED_IMAGES_DEST']
+    write_file(dest, 'orphan.png')
+    add_blob('orphan.png', 0)
+
+    stats = collect_garbage(min_age=HOUR, dry_run=True)
+
+    assert stats['deleted'] == 1
+    assert os.listdir(dest) == ['orphan.png']
+    assert Blob.query.count() == 1
+
+
+def test_blob_rows_with_references_survive_a_missing_file(app):
+    # A blob whose file went missing keeps its row while anything points at it
+    write_file(app.config['UPLOADED_IMAGES_DEST'], 'orphan.png')
+    add_blob('orphan.png', 0)
+    add_blob('missing.png', 2)
+
+    collect_garbage(min_age=HOUR)
+
+    assert [blob.filename for blob in Blob.query] == ['missing.png']
+
+
+def test_quota_evicts_oldest_thumbnails_first(app):
+    write_file(app.config['UPLOADED_IMAGES_DEST'], 'upload.png', b'u' * 100)
+    thumbs = app.config['THUMBNAILS_DEST']
+    write_file(thumbs, 'old.jpg', b't' * 50, age=3 * HOUR)
+    write_file(thumbs, 'new.jpg', b't' * 50, age=HOUR)
+
+    stats = enforce_quota(160)
+
+    assert stats == {'used_bytes': 150, 'evicted': 1, 'evicted_bytes': 50}
+    assert os.listdir(thumbs) == ['new.jpg']
+
+
+def test_run_storage_gc_uses_config_defaults(app):
+    app.config.update(STORAGE_GC_MIN_AGE=HOUR, STORAGE_QUOTA_BYTES=0)
+    write_file(app.config['UPLOADED_IMAGES_DEST'], 'orphan.png')
+
+    stats = run_storage_gc()
+
+    assert stats['deleted'] == 1
+    assert 'evicted' not in stats
+
+
+def test_storage_gc_command_sweeps_once_or_loops(app, monkeypatch):
+    write_file(app.config['UPLOADED_IMAGES_DEST'], 'dropped.png')
+    loops = []
+    monkeypatch.setattr(cli, 'run_gc_loop', lambda app, interval, progress, **options: loops.append((interval, options)))
+    runner = app.test_cli_runner()
+
+    once = runner.invoke(args=['storage-gc', '--dry-run'])
+    looped = runner.invoke(args=['storage-gc', '--every', '60', '--min-age', '10'])
+
+    assert once.exit_code == 0 and 'deleted: 1' in once.output.splitlines()
+    assert loops == [(60, {'min_age': 10, 'quota_bytes': None, 'dry_run': False})]
+    assert looped.exit_code == 0 and 'scanned' not in looped.output
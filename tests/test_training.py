@@ -0,0 +1,77 @@
+import threading
+import time
+
+import pytest
+
+from app import db, training
+from app.models import Model, ModelRegion
+from app.references import load_reference_set
+from app.training import train_regions
+
+
+@pytest.fixture
+def regions(model):
+    model.status = 'setup'
+    for n in range(5):
+        db.session.add(ModelRegion(model_id=model.id, name=f'region {n}', x1=0, y1=0, x2=10, y2=10))
+    db.session.commit()
+    return list(model.regions)
+
+
+@pytest.fixture
+def trained(monkeypatch):
+    """
+    Stub train_region that fails 'region 2', recording which regions it trained
+    and the most it ever ran at once.
+    """
+    calls = {'regions': [], 'running': 0, 'peak': 0}
+    lock = threading.Lock()
+
+    def train_region(app, model, region, good_images, bad_images, output_dir):
+        with lock:
+            calls['regions'].append(region.name)
+            calls['running'] += 1
+            calls['peak'] = max(calls['peak'], calls['running'])
+        time.sleep(0.05)
+        with lock:
+            calls['running'] -= 1
+        if region.name == 'region 2':
+            return {'good_crops': {}, 'bad_crops': {}, 'error': "ClientError: throttled"}
+        return {'good_crops': {}, 'bad_crops': {}, 'error': None}
+
+    monkeypatch.setattr(training, 'train_region', train_region)
+    return calls
+
+
+def test_train_regions_trains_the_others_when_one_fails(app, model, regions, trained):
+    results = train_regions(app, model, regions, load_reference_set(model.id), app.config['UPLOADED_IMAGES_DEST'], 2)
+
+    assert sorted(trained['regions']) == [region.name for region in regions]
+    errors = {region.name: results[region.id]['error'] for region in regions}
+    assert errors.pop('region 2') == "ClientError: throttled"
+    assert set(errors.values()) == {None}
+
+
+@pytest.mark.parametrize('max_workers', [1, 2, 4])
+def test_train_regions_runs_at_most_max_workers_at_once(app, model, regions, trained, max_workers):
+    train_regions(app, model, regions, load_reference_set(model.id), app.config['UPLOADED_IMAGES_DEST'], max_workers)
+
+    assert len(trained['regions']) == 5
+    assert trained['peak'] == max_workers
+
+
+def test_finish_marks_the_failed_region_and_retries_only_it(app, model, regions, trained):
+    app.config['TRAINING_MAX_WORKERS'] = 3
+    client = app.test_client()
+
+    response = client.post(f'/models/finish/{model.id}')
+
+    assert response.status_code == 200  # the training report
+    statuses = {region.name: (region.status, region.training_error) for region in ModelRegion.query}
+    assert statuses.pop('region 2') == ('failed', "ClientError: throttled")
+    assert set(statuses.values()) == {('trained', None)}
+    assert Model.query.get(model.id).status == 'setup'
+
+    trained['regions'].clear()
+    client.post(f'/models/finish/{model.id}')
+    assert trained['regions'] == ['region 2']
@@ -0,0 +1,61 @@
+import io
+import os
+
+import cv2
+import pytest
+
+from app import db
+from app.models import ModelRegion, ModelTemplate, ReferenceImage
+from loadtest.synthetic import synthetic_image, synthetic_jpeg
+
+SIZE = dict(width=480, height=360)
+
+
+def save_image(app, filename, seed):
+    cv2.imwrite(os.path.join(app.config['UPLOADED_IMAGES_DEST'], filename), synthetic_image(seed, **SIZE))
+    return filename
+
+
+@pytest.fixture
+def variant_model(app, model):
+    """A model with a region on its primary template and a newly added template with no regions yet."""
+    model.template_image_filename = save_image(app, 'primary.png', 0)
+    db.session.add(ModelRegion(model_id=model.id, name='label', x1=40, y1=40, x2=200, y2=160))
+    template = ModelTemplate(model_id=model.id, name='Back', image_filename=save_image(app, 'back.png', 5))
+    db.session.add(template)
+    db.session.flush()
+    db.session.add(ReferenceImage(model_id=model.id, kind='good', ordinal=1, filename=save_image(app, 'good_1.png', 0)))
+    db.session.add(ReferenceImage(
+        model_id=model.id, template_id=template.id, kind='good', ordinal=2, filename=save_image(app, 'good_2.png', 5)
+    ))
+    model.status = 'setup'
+    db.session.commit()
+    return model
+
+
+def variant_reference(model):
+    return ReferenceImage.query.filter(
+        ReferenceImage.model_id == model.id, ReferenceImage.template_id.isnot(None)
+    ).one()
+
+
+def test_finish_regions_with_a_template_that_has_no_regions(app, variant_model):
+    client = app.test_client()
+    with client.session_transaction() as session:
+        session['model_id'] = variant_model.id
+
+    response = client.post('/models/finish_regions')
+
+    assert response.status_code == 302
+    assert variant_reference(variant_model).aligned_filename
+
+
+def test_review_images_upload_for_a_template_that_has_no_regions(app, variant_model):
+    response = app.test_client().post(f'/models/{variant_model.id}/review_images', data={
+        'good_image_2': (io.BytesIO(synthetic_jpeg(5, **SIZE)), 'back_again.jpg'),
+    }, content_type='multipart/form-data')
+
+    assert response.status_code == 200
+    reference = variant_reference(variant_model)
+    assert reference.filename.endswith('.jpg')
+    assert reference.aligned_filename
@@ -0,0 +1,128 @@
+import os
+
+import cv2
+import numpy as np
+import pytest
+
+from app import db, warm_start
+from app.models import ModelRegion
+from app.warm_start import HomographyCache, align_with_warm_start, warm_start_total
+from loadtest.synthetic import synthetic_image
+
+SIZE = dict(width=480, height=360)
+
+
+def shifted(image, dx, dy):
+    """The image as a camera moved by (dx, dy) pixels would see it."""
+    height, width = image.shape[:2]
+    return cv2.warpAffine(image, np.float32([[1, 0, dx], [0, 1, dy]]), (width, height))
+
+
+@pytest.fixture
+def station_model(app, model, monkeypatch):
+    monkeypatch.setattr(warm_start, 'homography_cache', HomographyCache())
+    monkeypatch.setattr(warm_start, '_region_stats', {})
+    template = synthetic_image(0, **SIZE)
+    model.template_image_filename = 'template.png'
+    cv2.imwrite(os.path.join(app.config['UPLOADED_IMAGES_DEST'], model.template_image_filename), template)
+    db.session.add(ModelRegion(model_id=model.id, name='label', x1=40, y1=40, x2=200, y2=160))
+    db.session.add(ModelRegion(model_id=model.id, name='logo', x1=260, y1=180, x2=420, y2=320))
+    db.session.commit()
+    return model, template
+
+
+@pytest.fixture
+def estimates(monkeypatch):
+    """Count full SIFT/FLANN/RANSAC homography estimates."""
+    calls = []
+    compute_homography = warm_start.compute_homography
+
+    def counting(template, input_image, model):
+        calls.append(model.id)
+        return compute_homography(template, input_image, model)
+
+    monkeypatch.setattr(warm_start, 'compute_homography', counting)
+    return calls
+
+
+def counts(model):
+    return {result: warm_start_total.value(model=model.id, result=result) for result in ('hit', 'miss', 'cold')}
+
+
+def counted_since(model, before):
+    return {result: count - before[result] for result, count in counts(model).items()}
+
+
+def test_second_image_from_a_station_reuses_the_homography(station_model, estimates):
+    model, template = station_model
+    image = shifted(template, 12, -8)
+    before = counts(model)
+
+    H, aligned, scores = align_with_warm_start(template, image, model, 'line-1')
+    assert scores is None
+    warm_H, warm_aligned, warm_scores = align_with_warm_start(template, image, model, 'line-1')
+
+    assert counted_since(model, before) == {'hit': 1, 'miss': 0, 'cold': 1}
+    assert len(estimates) == 1
+    assert np.array_equal(warm_H, H)
+    assert len(warm_scores) == 2 and min(warm_scores) > 0.9
+
+
+def test_moved_camera_misses_and_reestimates(station_model, estimates):
+    model, template = station_model
+    align_with_warm_start(template, shifted(template, 12, -8), model, 'line-1')
+    before = counts(model)
+
+    moved = shifted(template, -30, 25)
+    H, aligned, scores = align_with_warm_start(template, moved, model, 'line-1')
+
+    assert counted_since(model, before) == {'hit': 0, 'miss': 1, 'cold': 0}
+    assert len(estimates) == 2 and scores is None
+    # The new homography undoes the new shift and replaces the cached one
+    assert H[0, 2] == pytest.approx(30, abs=1) and H[1, 2] == pytest.approx(-25, abs=1)
+    cached_H, baseline = warm_start.homography_cache.get((model.id, model.template_image_filename, 'line-1'))
+    assert np.array_equal(cached_H, H)
+
+
+@pytest.mark.parametrize('tolerance, result', [(0.2, 'hit'), (0.05, 'miss')])
+def test_tolerance_of_the_drop_from_the_cached_scores(app, station_model, estimates, tolerance, result):
+    model, template = station_model
+    image = shifted(template, 12, -8)
+    H, aligned, scores = align_with_warm_start(template, image, model, 'line-1')
+    # Pretend the regions scored 0.1 better when the homography was cached
+    key = (model.id, model.template_image_filename, 'line-1')
+    cached_H, baseline = warm_start.homography_cache.get(key)
+    warm_start.homography_cache.put(key, cached_H, [score + 0.1 for score in baseline])
+    app.config['WARM_START_TOLERANCE'] = tolerance
+    before = counts(model)
+
+    align_with_warm_start(template, image, model, 'line-1')
+
+    assert counted_since(model, before)[result] == 1
+    assert len(estimates) == (1 if result == 'hit' else 2)
+
+
+def test_images_without_a_station_are_not_cached(station_model, estimates):
+    model, template = station_model
+    image = shifted(template, 12, -8)
+    before = counts(model)
+
+    for _ in range(2):
+        H, aligned, scores = align_with_warm_start(template, image, model)
+        assert H is not None and scores is None
+
+    assert counted_since(model, before) == {'hit': 0, 'miss': 0, 'cold': 0}
+    assert len(estimates) == 2
+    assert warm_start.homography_cache.get((model.id, model.template_image_filename, None)) is None
+
+
+def test_warm_start_can_be_turned_off(app, station_model, estimates):
+    model, template = station_model
+    app.config['WARM_START'] = 0
+    before = counts(model)
+
+    for _ in range(2):
+        align_with_warm_start(template, shifted(template, 12, -8), model, 'line-1')
+
+    assert counted_since(model, before) == {'hit': 0, 'miss': 0, 'cold': 0}
+    assert len(estimates) == 2
@@ -0,0 +1,4 @@
+# Entry point for production servers: gunicorn -c gunicorn.conf.py wsgi:app
+import cv2  # noqa: F401 -- loaded up front here, where every worker needs it, so preloaded workers share it
+
+from run import app  # noqa: F401